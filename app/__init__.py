@@ -5,7 +5,7 @@ import logging
 from flask import Flask
 from flask_cors import CORS
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, firestore_async
 from dotenv import load_dotenv
 
 from config import config_by_name # MODIFIED: Import config
@@ -44,6 +44,9 @@ def create_app(config_name):
         app.register_blueprint(dashboard.dashboard_bp, url_prefix='/dashboard')
         app.register_blueprint(messaging.messaging_bp, url_prefix='/messages')
 
+    from .cli import register_commands
+    register_commands(app)
+
     return app
 
 def initialize_firebase(app, logger):
@@ -61,6 +64,7 @@ def initialize_firebase(app, logger):
             logger.info("Firebase Admin SDK initialized successfully")
         
         db.client = firestore.client()
+        db.async_client = firestore_async.client()
         logger.info("Firestore client initialized successfully")
 
     except Exception as e:
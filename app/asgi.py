@@ -0,0 +1,206 @@
+# --- app/asgi.py ---
+"""ASGI front for the Flask app, with native async handlers for the LLM-bound socratic endpoints.
+
+asgiref's WsgiToAsgi runs the Flask app on one thread per worker, so a request waiting seconds on
+the LLM holds up the requests queued behind it. /ai/api/socratic/start and /respond are served
+here on the event loop instead, using the async OpenRouter and Firestore clients, with the same
+authentication and JSON responses as the Flask routes in routes/ai.py. So is the /ai/api/stream
+server-sent event stream, which waits on an async progress subscription for up to
+SSE_MAX_STREAM_SECONDS and would otherwise hold that thread for as long. Everything else is passed
+through to the wrapped Flask app.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+
+from .extensions import db
+from .services.ai_analysis_service import AIAnalysisService
+from .services.openai_service import OpenAIService
+from .services.progress_channel import (get_progress_broker, sse_event, SSE_KEEPALIVE_SECONDS,
+                                        SSE_MAX_STREAM_SECONDS, TERMINAL_EVENTS)
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH_PREFIX = '/ai/api/stream/'
+
+
+class AsyncRouter:
+    def __init__(self, flask_app, fallback):
+        self.flask_app = flask_app
+        self.fallback = fallback
+        self.routes = {}
+        if flask_app.config.get('AI_ASYNC_SOCRATIC', True):
+            self.routes = {
+                '/ai/api/socratic/start': self.socratic_start,
+                '/ai/api/socratic/respond': self.socratic_respond,
+            }
+
+    async def __call__(self, scope, receive, send):
+        handler = None
+        if scope['type'] == 'http' and scope['method'] == 'GET' and scope['path'].startswith(STREAM_PATH_PREFIX):
+            session_id = scope['path'][len(STREAM_PATH_PREFIX):]
+            if session_id and '/' not in session_id:
+                await self.stream_progress(scope, receive, send, session_id)
+                return
+        if scope['type'] == 'http' and scope['method'] == 'POST':
+            handler = self.routes.get(scope['path'])
+        if handler is None:
+            await self.fallback(scope, receive, send)
+            return
+
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+        body = await self._read_body(receive)
+        user_session = self._load_session(headers.get('cookie'))
+        if 'user_id' not in user_session:
+            status, payload = 401, {'error': 'Authentication required'}
+        else:
+            # The services read their settings from current_app, as they do under Flask
+            with self.flask_app.app_context():
+                status, payload = await handler(user_session, body)
+        await self._send_json(send, status, payload, cors='origin' in headers)
+
+    async def socratic_start(self, user_session: dict, body: bytes) -> tuple:
+        """Starts a new Socratic questioning session."""
+        try:
+            data = json.loads(body)
+            initial_goal = data.get('goal')
+            if not initial_goal:
+                return 400, {'error': 'Initial goal is required'}
+
+            result = await self._ai_service().start_socratic_session_async(user_session['user_id'], initial_goal)
+            return 200, {'success': True, 'data': result}
+        except Exception as e:
+            logger.error(f"Socratic start API failed: {e}", exc_info=True)
+            return 500, {'error': 'Failed to start Socratic questioning process.'}
+
+    async def socratic_respond(self, user_session: dict, body: bytes) -> tuple:
+        """Continues a Socratic questioning session with a user's answer."""
+        try:
+            data = json.loads(body)
+            session_id = data.get('sessionId')
+            answer = data.get('answer')
+            if not all([session_id, answer]):
+                return 400, {'error': 'Session ID and answer are required'}
+
+            result = await self._ai_service().continue_socratic_session_async(session_id, answer)
+            return 200, {'success': True, 'data': result}
+        except Exception as e:
+            logger.error(f"Socratic respond API failed: {e}", exc_info=True)
+            return 500, {'error': 'Failed to process your response.'}
+
+    async def stream_progress(self, scope, receive, send, session_id: str):
+        """Streams partial persona output for a running analysis as server-sent events."""
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+        cors = 'origin' in headers
+        user_id = self._load_session(headers.get('cookie')).get('user_id')
+        if not user_id:
+            await self._send_json(send, 401, {'error': 'Authentication required'}, cors=cors)
+            return
+        broker = get_progress_broker(self.flask_app.config)
+        if broker is None:
+            await self._send_json(send, 404, {'error': 'Live progress is not enabled'}, cors=cors)
+            return
+
+        subscription = None
+        try:
+            session_doc = await db.async_client.collection('ai_sessions').document(session_id).get()
+            if not session_doc.exists:
+                await self._send_json(send, 404, {'error': 'Session not found'}, cors=cors)
+                return
+            session_dict = session_doc.to_dict()
+            if session_dict.get('userId') != user_id:
+                await self._send_json(send, 403, {'error': 'Permission denied'}, cors=cors)
+                return
+
+            # Subscribe before taking the snapshot so nothing published in between is lost;
+            # deltas carry offsets, so anything seen twice is dropped by the client.
+            subscription = await broker.subscribe_async(session_id)
+            snapshot = await broker.snapshot_async(session_id)
+        except Exception as e:
+            logger.error(f"Failed to open progress stream for session {session_id}: {e}", exc_info=True)
+            if subscription is not None:
+                await subscription.close()
+            await self._send_json(send, 500, {'error': 'Could not open progress stream.'}, cors=cors)
+            return
+
+        if session_dict.get('status') in ('completed', 'failed'):
+            snapshot['status'] = session_dict['status']
+
+        response_headers = [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                            (b'x-accel-buffering', b'no')]
+        if cors:
+            response_headers.append((b'access-control-allow-origin', b'*'))
+        disconnected = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': response_headers})
+            await self._send_chunk(send, sse_event('snapshot', snapshot))
+            if snapshot.get('status') not in ('completed', 'failed'):
+                stream_deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+                while time.monotonic() < stream_deadline and not disconnected.done():
+                    event = await subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                    if event is None:
+                        await self._send_chunk(send, ": keepalive\n\n")
+                        continue
+                    await self._send_chunk(send, sse_event(event['type'], event))
+                    if event['type'] in TERMINAL_EVENTS:
+                        break
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': b''})
+        except OSError:
+            # The client went away mid-write
+            pass
+        finally:
+            disconnected.cancel()
+            await subscription.close()
+
+    def _ai_service(self) -> AIAnalysisService:
+        return AIAnalysisService(db.client, OpenAIService(), async_db_client=db.async_client)
+
+    def _load_session(self, cookie_header: str) -> dict:
+        """Reads the Flask session from its signed cookie, exactly as SecureCookieSessionInterface does."""
+        app = self.flask_app
+        serializer = app.session_interface.get_signing_serializer(app)
+        if serializer is None or not cookie_header:
+            return {}
+        value = parse_cookie(cookie_header).get(app.config['SESSION_COOKIE_NAME'])
+        if not value:
+            return {}
+        try:
+            return serializer.loads(value, max_age=int(app.permanent_session_lifetime.total_seconds()))
+        except BadSignature:
+            return {}
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        return b''.join(chunks)
+
+    @staticmethod
+    async def _wait_for_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    @staticmethod
+    async def _send_chunk(send, text: str):
+        await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+    @staticmethod
+    async def _send_json(send, status: int, payload: dict, cors: bool = False):
+        body = json.dumps(payload).encode('utf-8')
+        headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        if cors:
+            # Matches the Flask-CORS defaults applied to the Flask routes
+            headers.append((b'access-control-allow-origin', b'*'))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
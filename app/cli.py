@@ -0,0 +1,57 @@
+# --- app/cli.py ---
+import json
+import logging
+
+import click
+from flask import current_app
+
+from .extensions import db
+from .services.audit_sink import close_audit_sink
+from .services.bulk_moderation import BulkModerationRunner
+from .services.search_index import build_from_firestore, get_search_index
+
+logger = logging.getLogger(__name__)
+
+
+@click.command('remoderate-organizations')
+@click.option('--workers', default=4, show_default=True, help="Concurrent moderation workers.")
+@click.option('--page-size', default=200, show_default=True, help="Organizations read per page.")
+@click.option('--llm-rate', default=None, type=float, help="Batched LLM requests per second [MODERATION_BULK_LLM_RATE].")
+@click.option('--status', 'statuses', default='approved,rejected', show_default=True, help="Comma-separated statuses to re-moderate.")
+@click.option('--checkpoint', default='instance/remoderate_checkpoint.json', show_default=True, help="Progress file.")
+@click.option('--resume', is_flag=True, help="Continue after the last organization in the checkpoint.")
+@click.option('--limit', default=None, type=int, help="Stop after this many organizations.")
+@click.option('--dry-run', is_flag=True, help="Moderate and report, but write nothing back.")
+def remoderate_organizations(workers, page_size, llm_rate, statuses, checkpoint, resume, limit, dry_run):
+    """Re-moderates existing organizations, e.g. after the keyword list or moderation prompt changed.
+
+    Example: FLASK_APP=run:wsgi_app flask remoderate-organizations --workers 8 --llm-rate 4
+    """
+    runner = BulkModerationRunner(
+        db.client,
+        workers=workers,
+        page_size=page_size,
+        llm_rate=llm_rate if llm_rate is not None else current_app.config.get('MODERATION_BULK_LLM_RATE', 2.0),
+        statuses=tuple(s.strip() for s in statuses.split(',') if s.strip()),
+        checkpoint_path=checkpoint,
+        dry_run=dry_run,
+        limit=limit,
+    )
+    report = runner.run(resume=resume)
+    close_audit_sink()
+    click.echo(json.dumps(report, indent=2))
+
+
+@click.command('rebuild-search-index')
+def rebuild_search_index():
+    """Rebuilds the organization search index from the approved organizations in Firestore."""
+    index = get_search_index(current_app.config)
+    if index is None:
+        raise click.ClickException("SEARCH_INDEX_ENABLED is off.")
+    build_from_firestore(index, db.client)
+    click.echo(json.dumps(index.stats(), indent=2))
+
+
+def register_commands(app):
+    app.cli.add_command(remoderate_organizations)
+    app.cli.add_command(rebuild_search_index)
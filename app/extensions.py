@@ -5,6 +5,8 @@ class FirestoreClient:
     """A wrapper for the Firestore client to avoid circular imports."""
     def __init__(self):
         self.client = None
+        # Async client for the native async request path (app/asgi.py)
+        self.async_client = None
 
 # Create a single, shared instance of our db wrapper
 db = FirestoreClient()
@@ -1,12 +1,16 @@
 # --- app/routes/ai.py ---
 import logging
-from flask import Blueprint, request, jsonify, session, render_template, url_for, redirect
+import time
+from flask import Blueprint, request, jsonify, session, render_template, url_for, redirect, current_app, Response, stream_with_context
 from celery.result import AsyncResult
 
 from ..extensions import db, celery
-from ..tasks import perform_ai_analysis
+from ..tasks import start_ai_analysis
 from ..services.ai_analysis_service import AIAnalysisService
 from ..services.openai_service import OpenAIService
+from ..services.progress_channel import get_progress_broker, sse_event, SSE_KEEPALIVE_SECONDS, SSE_MAX_STREAM_SECONDS, TERMINAL_EVENTS
+from ..services.llm_cache import get_response_cache
+from ..services.telemetry import metrics_token_valid
 
 ai_bp = Blueprint('ai', __name__)
 logger = logging.getLogger(__name__)
@@ -82,8 +86,8 @@ def api_ai_debate():
         return jsonify({'error': 'Session ID and refined goal are required'}), 400
 
     try:
-        # Dispatch the long-running analysis to a Celery worker
-        task = perform_ai_analysis.delay(user_id, refined_goal, session_id)
+        # Dispatch the long-running analysis to the Celery workers
+        task = start_ai_analysis(user_id, refined_goal, session_id)
         
         # Immediately respond with the task ID
         return jsonify({
@@ -137,4 +141,95 @@ def get_ai_results_api(session_id):
         return jsonify({'success': True, 'data': session_dict})
     except Exception as e:
         logger.error(f"Failed to fetch AI results for session {session_id}: {e}", exc_info=True)
-        return jsonify({'error': 'Could not retrieve results.'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Could not retrieve results.'}), 500
+
+def _require_operator():
+    """Operational endpoints take the /metrics bearer token; without METRICS_TOKEN, a signed-in user."""
+    if current_app.config.get('METRICS_TOKEN'):
+        if not metrics_token_valid(current_app.config, request.headers.get('Authorization')):
+            return jsonify({'error': 'Authentication required'}), 401
+    elif 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+    return None
+
+@ai_bp.route('/api/llm_cache/stats', methods=['GET'])
+def get_llm_cache_stats():
+    """Reports LLM response cache hits, misses and the seconds/tokens it has saved."""
+    auth_error = _require_operator()
+    if auth_error:
+        return auth_error
+
+    cache = get_response_cache(current_app.config)
+    if cache is None:
+        return jsonify({'success': True, 'data': {'enabled': False}})
+    return jsonify({'success': True, 'data': {'enabled': True, **cache.stats()}})
+
+@ai_bp.route('/api/llm_status', methods=['GET'])
+def get_llm_status():
+    """Reports circuit breaker state, concurrency limits and latency for each OpenRouter model."""
+    auth_error = _require_operator()
+    if auth_error:
+        return auth_error
+
+    try:
+        return jsonify({'success': True, 'data': OpenAIService().model_status()})
+    except Exception as e:
+        logger.error(f"Failed to read LLM status: {e}", exc_info=True)
+        return jsonify({'error': 'Could not retrieve LLM status.'}), 500
+
+@ai_bp.route('/api/stream/<session_id>', methods=['GET'])
+def stream_analysis_progress(session_id):
+    """Streams partial persona output for a running analysis as server-sent events.
+
+    Under ASGI (run.py) this path is served by app/asgi.py on the event loop, since a stream held here
+    would occupy the one thread WsgiToAsgi runs Flask on; this route serves the threaded dev server.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    broker = get_progress_broker(current_app.config)
+    if broker is None:
+        return jsonify({'error': 'Live progress is not enabled'}), 404
+
+    try:
+        session_doc = db.client.collection('ai_sessions').document(session_id).get()
+        if not session_doc.exists:
+            return jsonify({'error': 'Session not found'}), 404
+        session_dict = session_doc.to_dict()
+        if session_dict.get('userId') != user_id:
+            return jsonify({'error': 'Permission denied'}), 403
+
+        # Subscribe before taking the snapshot so nothing published in between is lost;
+        # deltas carry offsets, so anything seen twice is dropped by the client.
+        subscription = broker.subscribe(session_id)
+        snapshot = broker.snapshot(session_id)
+    except Exception as e:
+        logger.error(f"Failed to open progress stream for session {session_id}: {e}", exc_info=True)
+        return jsonify({'error': 'Could not open progress stream.'}), 500
+
+    if session_dict.get('status') in ('completed', 'failed'):
+        snapshot['status'] = session_dict['status']
+
+    def generate():
+        try:
+            yield sse_event('snapshot', snapshot)
+            if snapshot.get('status') in ('completed', 'failed'):
+                return
+            stream_deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+            while time.monotonic() < stream_deadline:
+                event = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse_event(event['type'], event)
+                if event['type'] in TERMINAL_EVENTS:
+                    return
+        finally:
+            subscription.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
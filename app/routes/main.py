@@ -1,6 +1,7 @@
 import os
 import logging
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, current_app, Response
+from ..services.telemetry import get_metrics, metrics_token_valid
 
 main_bp = Blueprint('main', __name__)
 logger = logging.getLogger(__name__)
@@ -28,4 +29,16 @@ def login_page():
 @main_bp.route('/signup')
 def signup_page():
     """Renders the signup page."""
-    return render_template('signup.html')
\ No newline at end of file
+    return render_template('signup.html')
+
+@main_bp.route('/metrics')
+def metrics():
+    """Exposes AI stage and LLM call metrics in the Prometheus text format."""
+    if not metrics_token_valid(current_app.config, request.headers.get('Authorization')):
+        return Response("Unauthorized\n", status=401, mimetype='text/plain')
+    try:
+        body = get_metrics(current_app.config).render()
+    except Exception as e:
+        logger.error(f"Failed to render metrics: {e}")
+        return Response("Metrics unavailable\n", status=503, mimetype='text/plain')
+    return Response(body, mimetype='text/plain; version=0.0.4')
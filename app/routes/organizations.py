@@ -1,15 +1,28 @@
 # --- app/routes/organizations.py ---
+import itertools
 import logging
-from flask import Blueprint, request, jsonify, session, redirect, url_for, render_template
+import time
+from flask import Blueprint, Response, current_app, request, jsonify, session, redirect, url_for, render_template, stream_with_context
 from datetime import datetime
 from google.cloud.firestore_v1.base_query import FieldFilter
+from itsdangerous import BadSignature, URLSafeSerializer
 
 from ..extensions import db 
+from ..services.moderation_service import moderation_content_hash
+from ..services.search_index import get_search_index, sync_organizations
+from ..services.telemetry import get_metrics
 from ..tasks import moderate_and_index_organization
 
 org_bp = Blueprint('organizations', __name__)
 logger = logging.getLogger(__name__)
 
+# Fields /api/organizations may return (?fields=); moderation details and private contacts stay server-side
+LIST_FIELDS = ('name', 'description', 'category', 'tags', 'logo', 'location', 'website', 'openPositions',
+               'ownerId', 'createdAt', 'updatedAt')
+# What an organization card needs, returned when no fields are requested
+DEFAULT_LIST_FIELDS = ('name', 'description', 'category', 'tags', 'logo', 'location', 'createdAt')
+PAGE_TOKEN_SALT = 'organizations-list-page'
+
 def normalize_tags(tags):
     """Normalize tags to ensure they start with '#' and are lowercase."""
     if not tags: return []
@@ -28,7 +41,10 @@ def normalize_tags(tags):
 @org_bp.route('/organizations')
 def organizations_page():
     initial_query = request.args.get('search', '')
-    return render_template('organizations.html', INITIAL_QUERY=initial_query)
+    # Without Algolia credentials the page searches through /api/organizations/search
+    return render_template('organizations.html', INITIAL_QUERY=initial_query,
+                           ALGOLIA_APP_ID=current_app.config.get('ALGOLIA_APP_ID', ''),
+                           ALGOLIA_API_KEY=current_app.config.get('ALGOLIA_SEARCH_KEY', ''))
 
 @org_bp.route('/organizations/create')
 def organization_create_page():
@@ -113,12 +129,26 @@ def api_organization_update(org_id):
         # Remove None values so we don't overwrite fields with null
         update_data = {k: v for k, v in update_data.items() if v is not None}
 
+        current_data = org_doc.to_dict()
+        full_org_data = {**current_data, **update_data}
+
+        # Moderation only reads name, description and tags; if they are unchanged since the last
+        # approval, keep it instead of re-moderating an edit to the logo, website or positions.
+        if current_data.get('status') == 'approved' and current_data.get('moderationHash') == moderation_content_hash(full_org_data):
+            update_data['status'] = 'approved'
+            org_ref.update(update_data)
+            sync_organizations(current_app.config, [(org_id, full_org_data, 'approved')])
+            get_metrics().inc("depanku_moderation_memo_total", outcome="reused")
+            logger.info(f"Organization {org_id} updated. Moderated content unchanged; approval kept.")
+            return jsonify({'success': True, 'data': {'id': org_id, **update_data}}), 200
+
         org_ref.update(update_data)
+        # Out of search until the new content is approved
+        sync_organizations(current_app.config, [(org_id, full_org_data, 'pending')])
         
         # Dispatch moderation task again on update
-        full_org_data = org_doc.to_dict()
-        full_org_data.update(update_data)
         moderate_and_index_organization.delay(org_data=full_org_data, org_id=org_id)
+        get_metrics().inc("depanku_moderation_memo_total", outcome="dispatched")
 
         logger.info(f"Organization {org_id} updated. Moderation task re-dispatched.")
         return jsonify({'success': True, 'data': {'id': org_id, **update_data}}), 202
@@ -141,10 +171,7 @@ def api_organization_delete(org_id):
             return jsonify({'error': 'Permission denied'}), 403
             
         org_ref.delete()
-        
-        # Future integration: Remove from search index
-        # from app.services.search_service import algolia_client
-        # algolia_client.delete_organization(org_id)
+        sync_organizations(current_app.config, [(org_id, None, 'deleted')])
         
         logger.info(f"Organization {org_id} deleted by user {user_id}.")
         return jsonify({'success': True, 'message': 'Organization deleted successfully'})
@@ -173,15 +200,102 @@ def api_organization_get(org_id):
 
 @org_bp.route('/api/organizations', methods=['GET'])
 def api_organizations_list():
+    """Approved organizations, newest first, one page at a time.
+
+    Query parameters: limit (capped at ORGANIZATIONS_MAX_PAGE_SIZE), pageToken (the nextPageToken
+    of the previous page), fields (comma-separated, from LIST_FIELDS) and owner=me (only the
+    signed-in user's organizations). Only the requested fields are read from Firestore. The response is streamed as
+    {"success": true, "data": [...], "nextPageToken": ...}; nextPageToken is null on the last page.
+    """
+    try:
+        limit = min(max(1, int(request.args.get('limit', current_app.config.get('ORGANIZATIONS_PAGE_SIZE', 20)))),
+                    current_app.config.get('ORGANIZATIONS_MAX_PAGE_SIZE', 100))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer.'}), 400
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()] or list(DEFAULT_LIST_FIELDS)
+    unknown = sorted(set(fields) - set(LIST_FIELDS))
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(LIST_FIELDS)}."}), 400
+    owner = request.args.get('owner')
+    if owner and owner != 'me':
+        return jsonify({'error': "owner only accepts 'me'."}), 400
+    if owner and 'user_id' not in session:
+        return jsonify({'error': 'Authentication required'}), 401
+
+    serializer = URLSafeSerializer(current_app.secret_key, salt=PAGE_TOKEN_SALT)
+    cursor = None
+    if request.args.get('pageToken'):
+        try:
+            created_at, last_id = serializer.loads(request.args['pageToken'])
+            cursor = {'createdAt': datetime.fromisoformat(created_at), '__name__': last_id}
+        except (BadSignature, TypeError, ValueError):
+            return jsonify({'error': 'Invalid pageToken.'}), 400
+
     try:
-        limit = int(request.args.get('limit', 20))
-        # This is a simple list for non-search purposes, filtering by approved status
+        # Needs the composite indexes status ASC, createdAt DESC, __name__ DESC and
+        # status ASC, ownerId ASC, createdAt DESC, __name__ DESC
         query = db.client.collection('organizations').where(
             filter=FieldFilter('status', '==', 'approved')
-        ).limit(limit)
-        
+        )
+        if owner:
+            query = query.where(filter=FieldFilter('ownerId', '==', session['user_id']))
+        query = query.order_by('createdAt', direction='DESCENDING').order_by('__name__', direction='DESCENDING')
+        # createdAt is always read: the page token is built from the last document's
+        query = query.select(sorted(set(fields) | {'createdAt'})).limit(limit + 1)
+        if cursor:
+            query = query.start_after(cursor)
         docs = query.stream()
-        org_list = [{'id': doc.id, **doc.to_dict()} for doc in docs]
-        return jsonify({'success': True, 'data': org_list})
+        # Pull the first document before answering so query errors still become a 500
+        first = next(docs, None)
+    except Exception as e:
+        logger.error(f"Error listing organizations: {e}", exc_info=True)
+        return jsonify({'error': 'Failed to retrieve organizations.'}), 500
+
+    dumps = current_app.json.dumps
+    drop_created_at = 'createdAt' not in fields
+
+    def generate():
+        yield '{"success": true, "data": ['
+        last, sent = None, 0
+        for doc in itertools.chain([first] if first is not None else [], docs):
+            if sent == limit:
+                # The extra document only tells us another page exists
+                token = serializer.dumps([last[1].isoformat(), last[0]])
+                yield f'], "nextPageToken": {dumps(token)}}}'
+                return
+            data = doc.to_dict() or {}
+            last = (doc.id, data.get('createdAt'))
+            if drop_created_at:
+                data.pop('createdAt', None)
+            yield (',' if sent else '') + dumps({'id': doc.id, **data})
+            sent += 1
+        yield '], "nextPageToken": null}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@org_bp.route('/api/organizations/search', methods=['GET'])
+def api_organizations_search():
+    """Full-text search over approved organizations (name, description, tags, category).
+
+    Query parameters: q, page, hitsPerPage, category and locationType (repeatable; any value
+    matches), and facets=true for value counts. The last word of q also matches as a prefix.
+    """
+    try:
+        index = get_search_index(current_app.config, db.client)
+        if index is None:
+            return jsonify({'error': 'Search is not enabled.'}), 404
+        try:
+            page = max(0, int(request.args.get('page', 0)))
+            hits_per_page = min(max(1, int(request.args.get('hitsPerPage', 20))), current_app.config.get('SEARCH_MAX_HITS_PER_PAGE', 100))
+        except ValueError:
+            return jsonify({'error': 'page and hitsPerPage must be integers.'}), 400
+        filters = {'category': request.args.getlist('category'), 'location.type': request.args.getlist('locationType')}
+
+        started = time.perf_counter()
+        result = index.search(request.args.get('q', ''), filters, page, hits_per_page,
+                              facets=request.args.get('facets', 'false').lower() == 'true')
+        result['processingTimeMS'] = round((time.perf_counter() - started) * 1000, 2)
+        return jsonify({'success': True, 'data': result})
     except Exception as e:
-        return jsonify({'error': 'Failed to retrieve organizations.'}), 500
\ No newline at end of file
+        logger.error(f"Error searching organizations: {e}", exc_info=True)
+        return jsonify({'error': 'Failed to search organizations.'}), 500
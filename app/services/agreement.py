@@ -0,0 +1,58 @@
+# --- app/services/agreement.py ---
+import math
+import re
+from collections import Counter
+from itertools import combinations
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset("""
+a an and are as at be been but by can could do for from has have if in into is it its
+may might more most not of on or our should so such than that the their them then there
+these they this to was we were what when which while who will with would you your
+""".split())
+
+
+def _terms(text: str) -> Counter:
+    return Counter(t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS and len(t) > 2)
+
+
+def tfidf_vectors(texts: list) -> list:
+    """Smoothed TF-IDF vectors (as dicts) for a small set of documents."""
+    term_counts = [_terms(text) for text in texts]
+    doc_freq = Counter(term for counts in term_counts for term in counts)
+    n = len(texts)
+    vectors = []
+    for counts in term_counts:
+        vector = {term: (1 + math.log(tf)) * (math.log((1 + n) / (1 + doc_freq[term])) + 1) for term, tf in counts.items()}
+        vectors.append(vector)
+    return vectors
+
+
+def cosine(a: dict, b: dict) -> float:
+    if not a or not b:
+        return 0.0
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(weight * b.get(term, 0.0) for term, weight in a.items())
+    norm = math.sqrt(sum(w * w for w in a.values())) * math.sqrt(sum(w * w for w in b.values()))
+    return dot / norm if norm else 0.0
+
+
+def agreement_score(responses: dict) -> tuple:
+    """Scores how closely a set of responses agree, without calling any model.
+
+    Returns (mean pairwise TF-IDF cosine similarity, the key of the most central response).
+    With fewer than two responses the score is None.
+    """
+    keys = list(responses)
+    if len(keys) < 2:
+        return None, keys[0] if keys else None
+    vectors = dict(zip(keys, tfidf_vectors([responses[k] for k in keys])))
+    totals = {k: 0.0 for k in keys}
+    pair_scores = []
+    for a, b in combinations(keys, 2):
+        score = cosine(vectors[a], vectors[b])
+        pair_scores.append(score)
+        totals[a] += score
+        totals[b] += score
+    return sum(pair_scores) / len(pair_scores), max(keys, key=totals.get)
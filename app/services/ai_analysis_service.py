@@ -1,27 +1,116 @@
 # --- app/services/ai_analysis_service.py ---
+import contextvars
 import logging
 import json
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 from datetime import datetime
+from flask import current_app
 from .openai_service import OpenAIService, SYSTEM_PROMPTS
+from .rate_limiter import PRIORITY_INTERACTIVE
+from .progress_channel import ProgressChannel
+from .session_writer import SessionWriteBuffer
+from .telemetry import SessionTrace, get_metrics
+from .analysis_checkpoint import (
+    AnalysisCheckpoint, CRITIQUE_KEY, COMPROMISE_KEY, OUTCOME_KEY, RECORDED_KEY, GOAL_CACHE_KEY,
+    debate_key, revision_key, digests_key, consensus_check_key,
+)
+from .goal_cache import get_goal_cache
+from .agreement import agreement_score
+from .token_budget import DigestCache, count_message_tokens, truncate_to_tokens
 
 logger = logging.getLogger(__name__)
 
 MAX_SOCRATIC_QUESTIONS = 3
 MAX_CONSENSUS_ITERATIONS = 2
+DEBATE_PERSONAS = ["deepseek", "maverick", "qwen", "glm"]
+UNAVAILABLE_RESPONSE = "This expert was unavailable for comment."
+# Streamed tokens are coalesced into one progress event per this many seconds or characters
+PROGRESS_FLUSH_INTERVAL = 0.1
+PROGRESS_FLUSH_CHARS = 80
 
 class AIAnalysisService:
-    def __init__(self, db_client, openai_service: OpenAIService):
+    def __init__(self, db_client, openai_service: OpenAIService, progress_broker=None, async_db_client=None):
         self.db = db_client
+        # google.cloud.firestore.AsyncClient, used only by the *_async socratic methods
+        self.async_db = async_db_client
         self.openai_service = openai_service
+        # When a broker is given, persona calls stream and publish partial output per session
+        self.progress_broker = progress_broker
+        self.debate_max_concurrency = current_app.config.get('AI_DEBATE_MAX_CONCURRENCY', len(DEBATE_PERSONAS))
+        self.persona_timeout = current_app.config.get('AI_PERSONA_TIMEOUT')
+        self.debate_stage_timeout = current_app.config.get('AI_DEBATE_STAGE_TIMEOUT')
+        self.consensus_max_concurrency = current_app.config.get('AI_CONSENSUS_MAX_CONCURRENCY', len(DEBATE_PERSONAS))
+        self.consensus_round_timeout = current_app.config.get('AI_CONSENSUS_ROUND_TIMEOUT')
+        self.session_write_max_fields = current_app.config.get('AI_SESSION_WRITE_MAX_FIELDS', 50)
+        self.session_write_max_delay = current_app.config.get('AI_SESSION_WRITE_MAX_DELAY', 5.0)
+        self._session_writers = {}
+        self._session_traces = {}
+        self._checkpoints = {}
+        self.consensus_prompt_token_budget = current_app.config.get('AI_CONSENSUS_PROMPT_TOKEN_BUDGET', 0)
+        self.digest_max_words = current_app.config.get('AI_DIGEST_MAX_WORDS', 120)
+        self.digest_cache = DigestCache()
+        self.consensus_precheck = current_app.config.get('AI_CONSENSUS_PRECHECK_ENABLED', False)
+        self.consensus_agree_threshold = current_app.config.get('AI_CONSENSUS_AGREE_THRESHOLD', 0.85)
+        self.consensus_disagree_threshold = current_app.config.get('AI_CONSENSUS_DISAGREE_THRESHOLD', 0.15)
+        # Opt-in reuse of recent analyses of near-identical goals (None when disabled)
+        self.goal_cache = get_goal_cache(current_app.config)
+        self.goal_cache_model = current_app.config.get('AI_GOAL_CACHE_PERSONALIZE_MODEL', 'deepseek')
 
     def start_socratic_session(self, user_id: str, initial_goal: str) -> dict:
         """Creates a session document and asks the first question."""
         session_ref = self.db.collection('ai_sessions').document()
-        session_id = session_ref.id
-        
+        session_data = self._new_socratic_session(session_ref.id, user_id, initial_goal)
+        session_ref.set(session_data)
+        return {"sessionId": session_ref.id, "question": session_data['questions'][0]}
+
+    def continue_socratic_session(self, session_id: str, answer: str) -> dict:
+        """Processes a user's answer and either asks another question or refines the goal."""
+        session_ref = self.db.collection('ai_sessions').document(session_id)
+        session_doc = session_ref.get()
+        if not session_doc.exists:
+            raise ValueError("AI session not found.")
+
+        session_data = session_doc.to_dict()
+        session_data.setdefault('userResponses', []).append(answer)
+        trace = SessionTrace()
+        is_complete = len(session_data['userResponses']) >= MAX_SOCRATIC_QUESTIONS
+        span, messages = self._socratic_turn_messages(session_data, is_complete)
+        with trace.span(span):
+            reply = self.openai_service.query_model("deepseek", messages, priority=PRIORITY_INTERACTIVE)
+        fields, result = self._socratic_turn_result(session_id, session_data, is_complete, reply, trace)
+        session_ref.update(fields)
+        return result
+
+    async def start_socratic_session_async(self, user_id: str, initial_goal: str) -> dict:
+        """start_socratic_session on the async Firestore client (the native async request path)."""
+        session_ref = self.async_db.collection('ai_sessions').document()
+        session_data = self._new_socratic_session(session_ref.id, user_id, initial_goal)
+        await session_ref.set(session_data)
+        return {"sessionId": session_ref.id, "question": session_data['questions'][0]}
+
+    async def continue_socratic_session_async(self, session_id: str, answer: str) -> dict:
+        """continue_socratic_session without blocking: Firestore and the LLM call are awaited."""
+        session_ref = self.async_db.collection('ai_sessions').document(session_id)
+        session_doc = await session_ref.get()
+        if not session_doc.exists:
+            raise ValueError("AI session not found.")
+
+        session_data = session_doc.to_dict()
+        session_data.setdefault('userResponses', []).append(answer)
+        trace = SessionTrace()
+        is_complete = len(session_data['userResponses']) >= MAX_SOCRATIC_QUESTIONS
+        span, messages = self._socratic_turn_messages(session_data, is_complete)
+        with trace.span(span):
+            reply = await self.openai_service.query_model_async("deepseek", messages, priority=PRIORITY_INTERACTIVE)
+        fields, result = self._socratic_turn_result(session_id, session_data, is_complete, reply, trace)
+        await session_ref.update(fields)
+        return result
+
+    def _new_socratic_session(self, session_id: str, user_id: str, initial_goal: str) -> dict:
         first_question = "What is the single most important outcome you hope to achieve from this opportunity?"
-        
-        session_data = {
+        return {
             "id": session_id,
             "userId": user_id,
             "initialGoal": initial_goal,
@@ -31,41 +120,30 @@ class AIAnalysisService:
             "createdAt": datetime.now(),
             "updatedAt": datetime.now()
         }
-        session_ref.set(session_data)
-        
-        return {"sessionId": session_id, "question": first_question}
 
-    def continue_socratic_session(self, session_id: str, answer: str) -> dict:
-        """Processes a user's answer and either asks another question or refines the goal."""
-        session_ref = self.db.collection('ai_sessions').document(session_id)
-        session_doc = session_ref.get()
-        if not session_doc.exists:
-            raise ValueError("AI session not found.")
-        
-        session_data = session_doc.to_dict()
-        session_data.setdefault('userResponses', []).append(answer)
-        
-        if len(session_data['userResponses']) >= MAX_SOCRATIC_QUESTIONS:
-            refined_goal = self._refine_goal_from_conversation(session_data)
-            session_ref.update({
-                'userResponses': session_data['userResponses'],
-                'refinedGoal': refined_goal,
-                'status': 'questioning_completed',
-                'updatedAt': datetime.now()
-            })
-            return {"isComplete": True, "refinedGoal": refined_goal, "sessionId": session_id}
-        else:
-            next_question = self._get_next_socratic_question(session_data)
-            session_data.setdefault('questions', []).append(next_question)
-            session_ref.update({
-                'userResponses': session_data['userResponses'],
-                'questions': session_data['questions'],
-                'updatedAt': datetime.now()
-            })
-            return {"isComplete": False, "question": next_question, "sessionId": session_id}
+    def _socratic_turn_messages(self, session_data: dict, is_complete: bool) -> tuple:
+        """(span name, messages) for the LLM call that answers this turn."""
+        if is_complete:
+            return 'socraticRefine', self._refine_goal_messages(session_data)
+        return 'socraticQuestion', self._next_question_messages(session_data)
+
+    def _socratic_turn_result(self, session_id: str, session_data: dict, is_complete: bool, reply: str, trace: SessionTrace) -> tuple:
+        """(session document update, API result) for a finished turn."""
+        turn = len(session_data['userResponses'])
+        fields = {
+            'userResponses': session_data['userResponses'],
+            f'telemetry.socratic.turn{turn}': trace.compact()['totals'],
+            'updatedAt': datetime.now()
+        }
+        if is_complete:
+            fields.update({'refinedGoal': reply, 'status': 'questioning_completed'})
+            return fields, {"isComplete": True, "refinedGoal": reply, "sessionId": session_id}
+        session_data.setdefault('questions', []).append(reply)
+        fields['questions'] = session_data['questions']
+        return fields, {"isComplete": False, "question": reply, "sessionId": session_id}
 
-    def _get_next_socratic_question(self, session_data: dict) -> str:
-        """Uses AI to generate the next logical question based on conversation history."""
+    def _next_question_messages(self, session_data: dict) -> list:
+        """Prompt for the next logical question based on conversation history."""
         conversation_history = f"Initial Goal: {session_data['initialGoal']}\n\n"
         for i, q in enumerate(session_data['questions']):
             conversation_history += f"Q: {q}\n"
@@ -73,102 +151,576 @@ class AIAnalysisService:
                 conversation_history += f"A: {session_data['userResponses'][i]}\n"
         
         prompt = f"Based on this conversation, ask the single most insightful follow-up question to deeply understand the user's priorities. The question should be open-ended. Return only the question text.\n\nHistory:\n{conversation_history}"
-        messages = [{"role": "system", "content": SYSTEM_PROMPTS['socratic_questioner']}, {"role": "user", "content": prompt}]
-        return self.openai_service.query_model("deepseek", messages)
+        return [{"role": "system", "content": SYSTEM_PROMPTS['socratic_questioner']}, {"role": "user", "content": prompt}]
 
-    def _refine_goal_from_conversation(self, session_data: dict) -> str:
-        """Uses AI to summarize the conversation into a refined goal."""
+    def _refine_goal_messages(self, session_data: dict) -> list:
+        """Prompt that summarizes the conversation into a refined goal."""
         conversation_history = f"Initial Goal: {session_data['initialGoal']}\n\n"
         for i, q in enumerate(session_data['questions']):
             conversation_history += f"Q: {q}\nA: {session_data.get('userResponses', [])[i]}\n"
             
         prompt = f"Synthesize the following conversation into a concise, actionable goal for an AI career advisory panel. The goal should be a single paragraph that captures all the user's stated priorities and concerns.\n\nConversation:\n{conversation_history}"
-        messages = [{"role": "system", "content": SYSTEM_PROMPTS['summarizer']}, {"role": "user", "content": prompt}]
-        return self.openai_service.query_model("deepseek", messages)
+        return [{"role": "system", "content": SYSTEM_PROMPTS['summarizer']}, {"role": "user", "content": prompt}]
+
+    def full_ai_analysis_flow(self, user_id: str, refined_goal: str, session_id: str, mark_failed: bool = True) -> dict:
+        """The main AI debate flow, run start to finish by one Celery task on a thread pool.
 
-    def full_ai_analysis_flow(self, user_id: str, refined_goal: str, session_id: str) -> dict:
-        """The main AI debate flow, designed to be run synchronously in a Celery task."""
+        Resumable: every persona response and stage result is checkpointed on the session as it
+        completes, and a rerun for the same session skips whatever already finished. When
+        `mark_failed` is False (the task will retry) a failure leaves the session 'retrying'.
+        The same steps also run as separate tasks (see app.tasks.build_ai_analysis_workflow).
+        """
+        writer = self._session_writer(session_id)
+        trace = self._session_trace(session_id)
         try:
-            session_ref = self.db.collection('ai_sessions').document(session_id)
-            session_ref.update({'status': 'debate_in_progress', 'updatedAt': datetime.now()})
+            if not self.start_analysis(session_id, refined_goal, user_id):
+                return {"success": True, "sessionId": session_id}
 
-            responses = self._conduct_round_table_debate(session_id, refined_goal)
-            critique = self._devil_advocate_analysis(session_id, responses)
-            consensus_result = self._build_consensus(session_id, responses, critique)
-            
-            self.complete_ai_analysis_record(user_id, session_id)
-            
-            session_ref.update({'status': 'completed', 'updatedAt': datetime.now()})
+            with trace.span('debate'):
+                self._conduct_round_table_debate(session_id, refined_goal)
+            writer.flush()
+            with trace.span('critique'):
+                self.devil_advocate_analysis(session_id)
+            writer.flush()
+            for round_number in range(1, MAX_CONSENSUS_ITERATIONS + 1):
+                with trace.span(f'consensusRound{round_number}'):
+                    self.prepare_consensus_round(session_id, round_number)
+                    self._revise_concurrently(session_id, round_number)
+                    if self.settle_consensus_round(session_id, round_number) is not None:
+                        break
+
+            self.finish_analysis(user_id, session_id)
+            self._flush_with_write_metrics(session_id, writer)
             return {"success": True, "sessionId": session_id}
         except Exception as e:
             logger.error(f"Full AI analysis failed for session {session_id}: {e}", exc_info=True)
-            self.db.collection('ai_sessions').document(session_id).update({
-                'status': 'failed', 'error': str(e), 'updatedAt': datetime.now()
-            })
+            self.mark_analysis_failed(session_id, str(e), final=mark_failed, write_metrics=True)
             return {"success": False, "error": "AI analysis process failed."}
+        finally:
+            self._forget_session(session_id)
 
-    def _conduct_round_table_debate(self, session_id: str, refined_goal: str) -> dict:
-        """Conducts the initial round of analysis from all primary personas."""
-        personas = ["deepseek", "maverick", "qwen", "glm"]
-        responses = {}
-        prompt = f"Given the user's goal, provide your expert analysis and recommendations. Goal: '{refined_goal}'"
-        session_ref = self.db.collection('ai_sessions').document(session_id)
-        
-        for persona in personas:
-            try:
-                response_text = self.openai_service.query_persona(persona, prompt)
-                responses[persona] = response_text
-                session_ref.update({f'personas.{persona}.initialResponse': response_text})
-            except Exception as e:
-                logger.warning(f"Persona {persona} failed in debate for session {session_id}: {e}")
-                responses[persona] = "This expert was unavailable for comment."
-        return responses
+    # --- Analysis steps ---
+    # Each step is idempotent: it skips work already checkpointed on the session, so the steps can
+    # be retried or redelivered individually, in this process or on any Celery worker.
+
+    def start_analysis(self, session_id: str, refined_goal: str, user_id: str = None) -> bool:
+        """Marks the debate as started. Returns False if the session already completed."""
+        checkpoint = self._checkpoint(session_id)
+        if checkpoint.session_status == 'completed':
+            logger.info(f"Analysis for session {session_id} already completed; nothing to resume")
+            return False
+        resumed = checkpoint.completed_keys()
+        if resumed:
+            logger.info(f"Resuming analysis for session {session_id} from checkpoints {resumed}")
+        checkpoint.refined_goal = refined_goal
+        if self.goal_cache is not None and user_id and not resumed:
+            self._reuse_similar_analysis(session_id, refined_goal, user_id)
+
+        prompt = self._debate_prompt(refined_goal)
+        pending = [persona for persona in DEBATE_PERSONAS if not checkpoint.has(debate_key(persona))]
+        writer = self._session_writer(session_id)
+        writer.update({'status': 'debate_in_progress', 'updatedAt': datetime.now()})
+        if self.goal_cache is not None:
+            # finish_analysis indexes the analysis under the goal it actually ran with
+            writer.update({'refinedGoal': refined_goal})
+        if pending:
+            writer.update({'tokenUsage.debate': {'promptTokens': sum(self._persona_prompt_tokens(p, prompt) for p in pending)}})
+        writer.flush()
+        progress = self._progress_channel(session_id)
+        if progress: progress.stage('debate_in_progress')
+        return True
+
+    def debate_as_persona(self, session_id: str, refined_goal: str, persona: str):
+        """One persona's initial analysis. Returns None if it could not be produced."""
+        checkpoint = self._checkpoint(session_id)
+        key = debate_key(persona)
+        if checkpoint.has(key):
+            self._restore_persona(session_id, 'debate', persona, checkpoint.get(key))
+            return checkpoint.get(key)
+        response_text = self._ask_persona(session_id, 'debate', persona, self._debate_prompt(refined_goal))
+        self._record_debate_response(session_id, persona, response_text)
+        return response_text
 
-    def _devil_advocate_analysis(self, session_id: str, responses: dict) -> str:
+    def devil_advocate_analysis(self, session_id: str) -> str:
         """Gets a critique of the initial analyses."""
-        formatted_responses = json.dumps(responses, indent=2)
+        checkpoint = self._checkpoint(session_id)
+        self._enter_stage(session_id, 'critique_in_progress')
+        if checkpoint.has(CRITIQUE_KEY):
+            critique = checkpoint.get(CRITIQUE_KEY)
+            self._restore_persona(session_id, 'critique', "grok", critique)
+            return critique
+
+        formatted_responses = json.dumps(self._round_responses(checkpoint, 0), indent=2)
         prompt = f"Review the following expert analyses regarding a user's goal. Your task is to play devil's advocate. Identify potential flaws, risks, overlooked details, and conflicting advice in their recommendations. Be concise and direct.\n\nAnalyses:\n{formatted_responses}"
-        critique = self.openai_service.query_persona("grok", prompt)
-        self.db.collection('ai_sessions').document(session_id).update({'personas.grok.critique': critique})
+        critique = self._ask_persona(session_id, 'critique', "grok", prompt)
+        checkpoint.record(CRITIQUE_KEY, critique, {
+            'personas.grok.critique': critique,
+            'tokenUsage.critique': {'promptTokens': self._persona_prompt_tokens("grok", prompt)},
+        })
         return critique
 
-    def _build_consensus(self, session_id: str, initial_responses: dict, critique: str) -> dict:
-        """Iteratively refines analyses to reach consensus or a final compromise."""
-        current_responses = initial_responses
-        
-        for i in range(MAX_CONSENSUS_ITERATIONS):
-            # Revise analyses
-            revised_responses = {}
-            for persona, previous_response in current_responses.items():
-                prompt = f"Your previous analysis was: '{previous_response}'.\nOther experts said: {json.dumps({k: v for k, v in current_responses.items() if k != persona})}\n\nA critique was raised: '{critique}'.\n\nPlease provide a revised, improved analysis that addresses the critique and considers the other perspectives to move towards a unified recommendation."
-                try:
-                    revised_responses[persona] = self.openai_service.query_persona(persona, prompt)
-                except Exception as e:
-                    logger.warning(f"Persona {persona} failed in consensus round {i+1}: {e}")
-                    revised_responses[persona] = previous_response # Carry over old response on failure
-            current_responses = revised_responses
+    def prepare_consensus_round(self, session_id: str, round_number: int):
+        """Fixes the revision prompts for a round, condensing peer responses once if they are over budget."""
+        checkpoint = self._checkpoint(session_id)
+        if checkpoint.has(OUTCOME_KEY):
+            return
+        if round_number == 1:
+            self._enter_stage(session_id, 'consensus_in_progress')
 
-            # Check for consensus
-            consensus_check_prompt = f"Analyze these revised expert opinions. Have they reached a clear consensus? Respond ONLY with a JSON object containing 'consensus' (boolean), and if true, a 'recommendation' (string summarizing the unified advice) and 'reasoning' (string explaining why it's a consensus).\n\nOpinions:\n{json.dumps(current_responses)}"
-            messages = [{"role": "system", "content": "You are a consensus analyzer. Return valid JSON only."}, {"role": "user", "content": consensus_check_prompt}]
-            
+        round_usage = {}
+        prompts = self._revision_prompts(checkpoint, round_number)
+        # Over budget: swap peer responses for digests from one summarization pass for the whole round
+        if (self.consensus_prompt_token_budget and not checkpoint.has(digests_key(round_number))
+                and max(self._persona_prompt_tokens(p, prompt) for p, prompt in prompts.items()) > self.consensus_prompt_token_budget):
+            digests, round_usage['digestPromptTokens'] = self._digest_responses(self._round_responses(checkpoint, round_number - 1))
+            checkpoint.record(digests_key(round_number), digests)
+            prompts = self._revision_prompts(checkpoint, round_number)
+        round_usage['compacted'] = checkpoint.has(digests_key(round_number))
+        round_usage['revisionPromptTokens'] = sum(self._persona_prompt_tokens(p, prompt) for p, prompt in prompts.items())
+        self._session_writer(session_id).update({f'tokenUsage.consensusRound{round_number}': round_usage})
+
+    def revise_as_persona(self, session_id: str, round_number: int, persona: str):
+        """One persona's revised analysis for a consensus round. Returns None once consensus is settled."""
+        checkpoint = self._checkpoint(session_id)
+        if checkpoint.has(OUTCOME_KEY):
+            return None
+        stage = f'consensus_round_{round_number}'
+        key = revision_key(round_number, persona)
+        if checkpoint.has(key):
+            self._restore_persona(session_id, stage, persona, checkpoint.get(key))
+            return checkpoint.get(key)
+        prompt = self._revision_prompts(checkpoint, round_number)[persona]
+        revised = self._ask_persona(session_id, stage, persona, prompt)
+        checkpoint.record(key, revised)
+        return revised
+
+    def settle_consensus_round(self, session_id: str, round_number: int):
+        """Decides whether the round reached consensus. Returns the consensus result, or None to go on."""
+        checkpoint = self._checkpoint(session_id)
+        writer = self._session_writer(session_id)
+        if checkpoint.has(OUTCOME_KEY):
+            return checkpoint.get(OUTCOME_KEY)
+        # Personas that failed or ran late carry over their previous response
+        current_responses = self._round_responses(checkpoint, round_number)
+
+        # Settle clear agreement or disagreement locally; only ask the model when it is uncertain.
+        # Earlier rounds' pre-checks are recomputed (they are cheap) so every worker reports all rounds.
+        decision = 'uncertain'
+        if self.consensus_precheck:
+            prechecks = [self._precheck_consensus(self._round_responses(checkpoint, n)) for n in range(1, round_number + 1)]
+            writer.update({'metrics.consensusPrecheck': {
+                'rounds': [{'score': score, 'decision': decision} for decision, score, _ in prechecks],
+                'llmCallsSaved': sum(1 for decision, _, _ in prechecks if decision != 'uncertain'),
+            }})
+            decision, score, central = prechecks[-1]
+        if decision != 'uncertain':
+            logger.info(f"Consensus pre-check settled round {round_number} for session {session_id} as '{decision}' (score {score:.2f}); skipped the LLM consensus call")
+            if decision == 'agree':
+                # No synthesis call here: the panel's answer is the expert closest to the others, labelled as theirs
+                result = {"reached": True, "finalRecommendation": current_responses[central], "recommendedBy": central,
+                          "reasoning": f"The experts' revised analyses were {score:.0%} similar, so they were judged to agree. "
+                                       f"The recommendation is the {central} expert's analysis, the one closest to all the others."}
+                return self._settle(session_id, result, current_responses)
+            return None
+
+        # Check for consensus
+        consensus_check_prompt = f"Analyze these revised expert opinions. Have they reached a clear consensus? Respond ONLY with a JSON object containing 'consensus' (boolean), and if true, a 'recommendation' (string summarizing the unified advice) and 'reasoning' (string explaining why it's a consensus).\n\nOpinions:\n{json.dumps(current_responses)}"
+        messages = [{"role": "system", "content": "You are a consensus analyzer. Return valid JSON only."}, {"role": "user", "content": consensus_check_prompt}]
+        writer.update({f'tokenUsage.consensusRound{round_number}.consensusCheckPromptTokens': count_message_tokens(messages)})
+
+        try:
+            consensus_data = checkpoint.get(consensus_check_key(round_number))
+            if consensus_data is None:
+                # A 'consensus': false verdict ends the check; the explanation that follows is not needed
+                consensus_data = self.openai_service.query_json_fields("deepseek", messages, stop_when=lambda fields: fields.get("consensus") is False)
+                checkpoint.record(consensus_check_key(round_number), consensus_data)
+            if consensus_data.get("consensus"):
+                result = {"reached": True, "finalRecommendation": consensus_data["recommendation"], "reasoning": consensus_data["reasoning"]}
+                return self._settle(session_id, result, current_responses)
+        except Exception as e:
+            logger.error(f"Consensus check failed in iteration {round_number}: {e}")
+        return None
+
+    def finish_analysis(self, user_id: str, session_id: str) -> dict:
+        """Mediates a compromise if no round reached consensus, then completes the analysis."""
+        checkpoint = self._checkpoint(session_id)
+        result = checkpoint.get(OUTCOME_KEY)
+        if result is None:
+            result = self._final_compromise(session_id)
+
+        if not checkpoint.has(RECORDED_KEY):
+            if self.goal_cache is not None and not checkpoint.has(GOAL_CACHE_KEY):
+                self._index_analysis(user_id, session_id, result)
+            self.complete_ai_analysis_record(user_id, session_id)
+            checkpoint.record(RECORDED_KEY, True)
+
+        self._session_writer(session_id).update({'status': 'completed', 'updatedAt': datetime.now()})
+        progress = self._progress_channel(session_id)
+        if progress: progress.done()
+        return result
+
+    def mark_analysis_failed(self, session_id: str, error: str, final: bool = True, write_metrics: bool = False):
+        """Records a failed attempt; the session stays 'retrying' unless this was the final one."""
+        writer = self._session_writer(session_id)
+        writer.update({'status': 'failed' if final else 'retrying', 'error': error, 'updatedAt': datetime.now()})
+        try:
+            if write_metrics:
+                self._flush_with_write_metrics(session_id, writer)
+            else:
+                writer.flush()
+        except Exception as flush_error:
+            logger.error(f"Failed to record the failure of session {session_id}: {flush_error}")
+        progress = self._progress_channel(session_id)
+        if progress and final: progress.failed()
+
+    @contextmanager
+    def analysis_step(self, session_id: str, name: str):
+        """Runs one step of a distributed analysis: times it, then persists its writes and telemetry."""
+        trace = self._session_trace(session_id)
+        writer = self._session_writer(session_id)
+        try:
+            with trace.span(name):
+                yield
+        finally:
             try:
-                consensus_data = self.openai_service.query_model("deepseek", messages, is_json=True)
-                if consensus_data.get("consensus"):
-                    result = {"reached": True, "finalRecommendation": consensus_data["recommendation"], "reasoning": consensus_data["reasoning"]}
-                    self.db.collection('ai_sessions').document(session_id).update({'consensus': result, 'finalResponses': current_responses})
-                    return result
+                writer.update({f'telemetry.analysis.spans.{span}': entry for span, entry in trace.compact()['spans'].items()})
+                writer.flush()
             except Exception as e:
-                logger.error(f"Consensus check failed in iteration {i+1}: {e}")
+                logger.error(f"Failed to save step {name} of session {session_id}: {e}")
+            self._forget_session(session_id)
+
+    # --- Helpers ---
+
+    # --- Near-duplicate goal reuse ---
+
+    def _reuse_similar_analysis(self, session_id: str, refined_goal: str, user_id: str) -> bool:
+        """Seeds the analysis from the user's recent one with a near-identical goal and personalizes its advice.
+
+        The borrowed debate, critique and outcome are checkpointed, so every later step (in this
+        process or as a Celery subtask) finds its work done; only the personalization call is made.
+        Only the same user's analyses are reused. Any failure falls back to the full debate.
+        """
+        metrics = get_metrics()
+        try:
+            match = self.goal_cache.lookup(refined_goal, user_id)
+            if match is None:
+                metrics.inc("depanku_goal_cache_lookups_total", outcome="miss")
+                return False
+
+            entry, score = match
+            consensus = entry['consensus']
+            prompt = (f"An expert panel produced the recommendation below for a student whose goal was: \"{entry['goal']}\"\n"
+                      f"This student's goal is: \"{refined_goal}\"\n"
+                      f"Adapt the recommendation so it fits this student's goal exactly, keeping the panel's substance. Return only the recommendation.\n\n"
+                      f"Recommendation:\n{consensus['finalRecommendation']}")
+            messages = [{"role": "system", "content": "You are an expert advisor who tailors recommendations to each student."}, {"role": "user", "content": prompt}]
+            with self._session_trace(session_id).span('personalize'):
+                recommendation = self.openai_service.query_model(self.goal_cache_model, messages)
+        except Exception as e:
+            logger.warning(f"Goal cache reuse failed for session {session_id}; running the full debate: {e}")
+            metrics.inc("depanku_goal_cache_lookups_total", outcome="miss")
+            return False
+        metrics.inc("depanku_goal_cache_lookups_total", outcome="hit")
+
+        llm_calls_saved = max(0, entry.get('llmCalls', 0) - 1)
+        metrics.inc("depanku_goal_cache_llm_calls_saved_total", llm_calls_saved)
+        reuse = {'sourceSessionId': entry['sessionId'], 'similarity': round(score, 3), 'llmCallsSaved': llm_calls_saved}
+        result = {
+            "reached": consensus.get('reached', False),
+            "finalRecommendation": recommendation,
+            "reasoning": f"Adapted from the expert panel's analysis of a near-identical goal. {consensus.get('reasoning', '')}".strip(),
+        }
+        values = {debate_key(persona): text for persona, text in entry['debate'].items()}
+        values.update({CRITIQUE_KEY: entry['critique'], GOAL_CACHE_KEY: reuse, OUTCOME_KEY: result})
+        extra_fields = {f'personas.{persona}.initialResponse': text for persona, text in entry['debate'].items()}
+        extra_fields.update({
+            'personas.grok.critique': entry['critique'],
+            'consensus': result,
+            'finalResponses': entry['finalResponses'],
+            'metrics.goalCache': reuse,
+        })
+        self._checkpoint(session_id).record_many(values, extra_fields)
+        logger.info(f"Session {session_id} reuses the analysis of session {entry['sessionId']} ({score:.0%} similar goal); {llm_calls_saved} LLM calls saved")
+        return True
+
+    def _index_analysis(self, user_id: str, session_id: str, result: dict):
+        """Adds a user's completed analysis to the goal cache (best effort)."""
+        checkpoint = self._checkpoint(session_id)
+        if not checkpoint.refined_goal or not checkpoint.has(CRITIQUE_KEY):
+            return
+        final_round = max((n for n in range(1, MAX_CONSENSUS_ITERATIONS + 1)
+                           if any(checkpoint.has(revision_key(n, p)) for p in DEBATE_PERSONAS)), default=0)
+        try:
+            self.goal_cache.add(checkpoint.refined_goal, user_id, session_id, {
+                'debate': {p: checkpoint.get(debate_key(p)) for p in DEBATE_PERSONAS if checkpoint.has(debate_key(p))},
+                'critique': checkpoint.get(CRITIQUE_KEY),
+                'finalResponses': self._round_responses(checkpoint, final_round),
+                'consensus': result,
+                # Every checkpointed result but the bookkeeping ones stands for one LLM call
+                'llmCalls': len([k for k in checkpoint.completed_keys() if k not in (OUTCOME_KEY, RECORDED_KEY)]),
+            })
+        except Exception as e:
+            logger.warning(f"Failed to index session {session_id} in the goal cache: {e}")
+
+    def _session_writer(self, session_id: str) -> SessionWriteBuffer:
+        """Returns the write buffer that coalesces updates to this session's document."""
+        writer = self._session_writers.get(session_id)
+        if writer is None:
+            writer = self._session_writers[session_id] = SessionWriteBuffer(
+                self.db.collection('ai_sessions').document(session_id),
+                max_pending_fields=self.session_write_max_fields,
+                max_delay=self.session_write_max_delay,
+            )
+        return writer
+
+    def _session_trace(self, session_id: str) -> SessionTrace:
+        """Returns the per-stage timing and LLM usage trace for this session's analysis."""
+        trace = self._session_traces.get(session_id)
+        if trace is None:
+            trace = self._session_traces[session_id] = SessionTrace()
+        return trace
+
+    def _checkpoint(self, session_id: str) -> AnalysisCheckpoint:
+        """Returns the session's checkpoint, reading it from the session document on first use."""
+        checkpoint = self._checkpoints.get(session_id)
+        if checkpoint is None:
+            session_doc = self.db.collection('ai_sessions').document(session_id).get()
+            session_data = session_doc.to_dict() if session_doc.exists else {}
+            checkpoint = self._checkpoints[session_id] = AnalysisCheckpoint.load(session_data, self._session_writer(session_id))
+        return checkpoint
+
+    def _forget_session(self, session_id: str):
+        self._session_writers.pop(session_id, None)
+        self._session_traces.pop(session_id, None)
+        self._checkpoints.pop(session_id, None)
+
+    def _enter_stage(self, session_id: str, status: str):
+        self._session_writer(session_id).update({'status': status, 'updatedAt': datetime.now()})
+        progress = self._progress_channel(session_id)
+        if progress: progress.stage(status)
+
+    def _restore_persona(self, session_id: str, stage: str, persona: str, text: str):
+        """Replays a checkpointed response to live progress subscribers."""
+        progress = self._progress_channel(session_id)
+        if progress:
+            progress.delta(stage, persona, 0, text)
+            progress.persona_done(stage, persona, ok=True)
+
+    def _flush_with_write_metrics(self, session_id: str, writer: SessionWriteBuffer):
+        """Final flush, recording how many Firestore writes the session cost (this one included)
+        and the analysis telemetry."""
+        writer.update({
+            'metrics.firestore': {'writes': writer.writes + 1, 'fieldUpdates': writer.field_updates + 2},
+            'telemetry.analysis': self._session_trace(session_id).compact(),
+        })
+        writer.flush()
+        logger.info(f"Session {session_id} used {writer.writes} Firestore writes for {writer.field_updates} field updates")
+
+    def _progress_channel(self, session_id: str):
+        if self.progress_broker is None:
+            return None
+        return ProgressChannel(self.progress_broker, session_id)
+
+    def _ask_persona(self, session_id: str, stage: str, persona: str, prompt: str) -> str:
+        """Queries a persona, streaming its partial output to the session's progress channel when enabled."""
+        progress = self._progress_channel(session_id)
+        if progress is None:
+            return self.openai_service.query_persona(persona, prompt, timeout=self.persona_timeout)
+
+        deadline = time.monotonic() + self.persona_timeout if self.persona_timeout else None
+        text, pending = '', ''
+        last_flush = time.monotonic()
+        stream = self.openai_service.stream_persona(persona, prompt, timeout=self.persona_timeout)
+        try:
+            for token in stream:
+                pending += token
+                now = time.monotonic()
+                if len(pending) >= PROGRESS_FLUSH_CHARS or now - last_flush >= PROGRESS_FLUSH_INTERVAL:
+                    progress.delta(stage, persona, len(text), pending)
+                    text, pending, last_flush = text + pending, '', now
+                # The client timeout is per read, so enforce the whole-call deadline here
+                if deadline and now > deadline:
+                    raise TimeoutError(f"Persona {persona} exceeded {self.persona_timeout}s while streaming.")
+        except Exception:
+            progress.persona_done(stage, persona, ok=False)
+            raise
+        finally:
+            stream.close()
+        if pending:
+            progress.delta(stage, persona, len(text), pending)
+            text += pending
+        progress.persona_done(stage, persona, ok=True)
+        return text
+
+    def _debate_prompt(self, refined_goal: str) -> str:
+        return f"Given the user's goal, provide your expert analysis and recommendations. Goal: '{refined_goal}'"
 
-        # If loop finishes, create a final compromise
+    def _record_debate_response(self, session_id: str, persona: str, response_text: str):
+        self._checkpoint(session_id).record(debate_key(persona), response_text, {f'personas.{persona}.initialResponse': response_text})
+
+    def _conduct_round_table_debate(self, session_id: str, refined_goal: str) -> dict:
+        """Conducts the initial round of analysis from all primary personas concurrently."""
+        checkpoint = self._checkpoint(session_id)
+        prompt = self._debate_prompt(refined_goal)
+
+        for persona in DEBATE_PERSONAS:
+            if checkpoint.has(debate_key(persona)):
+                self._restore_persona(session_id, 'debate', persona, checkpoint.get(debate_key(persona)))
+        calls = {
+            persona: (lambda p=persona: self._ask_persona(session_id, 'debate', p, prompt))
+            for persona in DEBATE_PERSONAS if not checkpoint.has(debate_key(persona))
+        }
+        self._run_personas_concurrently(
+            calls,
+            max_workers=self.debate_max_concurrency,
+            stage_timeout=self.debate_stage_timeout,
+            stage_label=f"debate for session {session_id}",
+            on_result=lambda persona, response_text: self._record_debate_response(session_id, persona, response_text),
+        )
+
+        # Preserve the persona order and fall back for anyone who failed or missed the deadline
+        return self._round_responses(checkpoint, 0)
+
+    def _revise_concurrently(self, session_id: str, round_number: int):
+        """Revises every persona's analysis in parallel; the round ends when all answer or the deadline passes."""
+        checkpoint = self._checkpoint(session_id)
+        if checkpoint.has(OUTCOME_KEY):
+            return
+        stage = f'consensus_round_{round_number}'
+        prompts = self._revision_prompts(checkpoint, round_number)
+        for persona in prompts:
+            if checkpoint.has(revision_key(round_number, persona)):
+                self._restore_persona(session_id, stage, persona, checkpoint.get(revision_key(round_number, persona)))
+        calls = {
+            persona: (lambda p=persona, prompt=prompt: self._ask_persona(session_id, stage, p, prompt))
+            for persona, prompt in prompts.items() if not checkpoint.has(revision_key(round_number, persona))
+        }
+        self._run_personas_concurrently(
+            calls,
+            max_workers=self.consensus_max_concurrency,
+            stage_timeout=self.consensus_round_timeout,
+            stage_label=f"consensus round {round_number} for session {session_id}",
+            on_result=lambda persona, text: checkpoint.record(revision_key(round_number, persona), text),
+        )
+
+    def _run_personas_concurrently(self, calls: dict, max_workers: int, stage_timeout: float, stage_label: str, on_result=None) -> dict:
+        """Runs {persona: callable} on a bounded thread pool until all finish or the stage deadline passes.
+
+        Returns {persona: result} for the calls that succeeded in time. Failed and late personas are
+        left out so the caller can apply its own fallback. `on_result` is invoked on the calling
+        thread as each persona completes.
+        """
+        results = {}
+        if not calls:
+            return results
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(calls))), thread_name_prefix='ai-persona')
+        # Each call runs in a copy of this context so its LLM usage lands on the current telemetry span
+        futures = {executor.submit(contextvars.copy_context().run, call): persona for persona, call in calls.items()}
+        try:
+            for future in as_completed(futures, timeout=stage_timeout):
+                persona = futures[future]
+                try:
+                    results[persona] = future.result()
+                except Exception as e:
+                    logger.warning(f"Persona {persona} failed in {stage_label}: {e}")
+                    continue
+                if on_result:
+                    try:
+                        on_result(persona, results[persona])
+                    except Exception as e:
+                        logger.error(f"Failed to record {persona} result in {stage_label}: {e}")
+        except FuturesTimeoutError:
+            late = [persona for future, persona in futures.items() if not future.done()]
+            logger.warning(f"Deadline of {stage_timeout}s passed in {stage_label}; no answer from {late}")
+        finally:
+            # Don't block on stragglers; their per-call timeout bounds how long they linger.
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def _round_responses(self, checkpoint: AnalysisCheckpoint, round_number: int) -> dict:
+        """Each persona's latest analysis after `round_number` (0 is the debate), in persona order."""
+        responses = {persona: checkpoint.get(debate_key(persona), UNAVAILABLE_RESPONSE) for persona in DEBATE_PERSONAS}
+        for n in range(1, round_number + 1):
+            responses = {persona: checkpoint.get(revision_key(n, persona), previous) for persona, previous in responses.items()}
+        return responses
+
+    def _revision_prompts(self, checkpoint: AnalysisCheckpoint, round_number: int) -> dict:
+        previous = self._round_responses(checkpoint, round_number - 1)
+        peers = checkpoint.get(digests_key(round_number)) or previous
+        critique = checkpoint.get(CRITIQUE_KEY, '')
+        return {
+            persona: self._revision_prompt(previous_response, {k: peers.get(k, previous[k]) for k in previous if k != persona}, critique)
+            for persona, previous_response in previous.items()
+        }
+
+    def _settle(self, session_id: str, result: dict, final_responses: dict) -> dict:
+        self._checkpoint(session_id).record(OUTCOME_KEY, result, {'consensus': result, 'finalResponses': final_responses})
+        return result
+
+    def _final_compromise(self, session_id: str) -> dict:
+        """Mediates a compromise between the experts' final positions."""
+        checkpoint = self._checkpoint(session_id)
+        current_responses = self._round_responses(checkpoint, MAX_CONSENSUS_ITERATIONS)
         compromise_prompt = f"These experts could not agree. Act as a final mediator. Synthesize their conflicting final opinions into a single, balanced, and actionable recommendation for the user. Explain the key tradeoffs.\n\nFinal Opinions:\n{json.dumps(current_responses)}"
         messages = [{"role": "system", "content": "You are an expert mediator who creates balanced recommendations."}, {"role": "user", "content": compromise_prompt}]
-        compromise_text = self.openai_service.query_model("maverick", messages) # Use a strong model for this
-        
+        compromise_text = checkpoint.get(COMPROMISE_KEY)
+        if compromise_text is None:
+            with self._session_trace(session_id).span('compromise'):
+                compromise_text = self.openai_service.query_model("maverick", messages) # Use a strong model for this
+            checkpoint.record(COMPROMISE_KEY, compromise_text)
+
         result = {"reached": False, "finalRecommendation": compromise_text, "reasoning": "A final compromise was generated after the experts could not reach full consensus."}
-        self.db.collection('ai_sessions').document(session_id).update({'consensus': result, 'finalResponses': current_responses})
-        return result
+        self._session_writer(session_id).update({'tokenUsage.compromise': {'promptTokens': count_message_tokens(messages)}})
+        return self._settle(session_id, result, current_responses)
+
+    def _precheck_consensus(self, responses: dict) -> tuple:
+        """Returns ('agree' | 'disagree' | 'uncertain', score, most central persona) without an LLM call."""
+        available = {persona: text for persona, text in responses.items() if text and text != UNAVAILABLE_RESPONSE}
+        score, central = agreement_score(available)
+        if score is None:
+            return 'uncertain', None, central
+        score = round(score, 4)
+        if score >= self.consensus_agree_threshold:
+            return 'agree', score, central
+        if score <= self.consensus_disagree_threshold:
+            return 'disagree', score, central
+        return 'uncertain', score, central
+
+    def _revision_prompt(self, previous_response: str, peer_responses: dict, critique: str) -> str:
+        return f"Your previous analysis was: '{previous_response}'.\nOther experts said: {json.dumps(peer_responses)}\n\nA critique was raised: '{critique}'.\n\nPlease provide a revised, improved analysis that addresses the critique and considers the other perspectives to move towards a unified recommendation."
+
+    def _persona_prompt_tokens(self, persona: str, prompt: str) -> int:
+        return count_message_tokens([{"content": SYSTEM_PROMPTS.get(persona, "")}, {"content": prompt}])
+
+    def _digest_responses(self, responses: dict) -> tuple:
+        """Returns ({persona: digest}, summarization prompt tokens).
+
+        Responses without a cached digest are condensed together in a single call; if that call
+        fails or skips a persona, the response is truncated instead.
+        """
+        digests = {persona: self.digest_cache.get(text) for persona, text in responses.items()}
+        missing = {persona: responses[persona] for persona, digest in digests.items() if digest is None}
+        if not missing:
+            return digests, 0
+
+        prompt = f"Condense each expert's analysis below to at most {self.digest_max_words} words. Keep their concrete recommendations, key reasons and any points of disagreement. Respond ONLY with a JSON object mapping each expert's name to its condensed analysis.\n\nAnalyses:\n{json.dumps(missing)}"
+        messages = [{"role": "system", "content": SYSTEM_PROMPTS['summarizer']}, {"role": "user", "content": prompt}]
+        try:
+            condensed = self.openai_service.query_model("deepseek", messages, temperature=0.2, is_json=True)
+        except Exception as e:
+            logger.warning(f"Digest summarization failed, truncating responses instead: {e}")
+            condensed = {}
+
+        for persona, text in missing.items():
+            digest = condensed.get(persona)
+            if isinstance(digest, str) and digest.strip():
+                digest = digest.strip()
+                self.digest_cache.put(text, digest)
+            else:
+                digest = truncate_to_tokens(text, self.digest_max_words * 2)
+            digests[persona] = digest
+        return digests, count_message_tokens(messages)
 
     def complete_ai_analysis_record(self, user_id: str, session_id: str):
         """Updates the user's remaining analysis count and logs the completed analysis."""
@@ -186,7 +738,8 @@ class AIAnalysisService:
                 if remaining > 0:
                     user_ref.update({'subscription.aiAnalysesRemaining': remaining - 1})
 
-            analysis_ref = self.db.collection('ai_analyses').document()
+            # Keyed by session so a resumed analysis can never log itself twice
+            analysis_ref = self.db.collection('ai_analyses').document(session_id)
             analysis_ref.set({
                 'userId': user_id,
                 'sessionId': session_id,
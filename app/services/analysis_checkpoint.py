@@ -0,0 +1,99 @@
+# --- app/services/analysis_checkpoint.py ---
+import copy
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FIELD = 'checkpoints'
+
+
+def debate_key(persona: str) -> str:
+    return f"debate.{persona}"
+
+
+def revision_key(round_number: int, persona: str) -> str:
+    return f"round{round_number}.{persona}"
+
+
+def digests_key(round_number: int) -> str:
+    return f"round{round_number}.digests"
+
+
+def consensus_check_key(round_number: int) -> str:
+    return f"round{round_number}.check"
+
+
+CRITIQUE_KEY = 'critique'
+COMPROMISE_KEY = 'compromise'
+# The settled result (consensus or compromise); once present, remaining rounds are skipped
+OUTCOME_KEY = 'outcome'
+RECORDED_KEY = 'recorded'
+# Set when the analysis was seeded from a near-identical goal's analysis (see goal_cache.py)
+GOAL_CACHE_KEY = 'goalCache'
+
+
+class AnalysisCheckpoint:
+    """The completed work of one analysis, keyed by idempotent stage keys.
+
+    Keys are stable for a given session (e.g. 'debate.qwen', 'round2.check'), so a retried or
+    redelivered task can look up what already finished and skip it. Results are stored under
+    `checkpoints.<key>` on the session document and written through the session's write buffer,
+    which is flushed as soon as a checkpoint is recorded so a crash loses no paid-for LLM output.
+    """
+
+    def __init__(self, writer, saved: dict = None, session_status: str = None, refined_goal: str = None):
+        self.writer = writer
+        self.session_status = session_status
+        self.refined_goal = refined_goal
+        self._saved = copy.deepcopy(saved) if saved else {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, session_data: dict, writer):
+        session_data = session_data or {}
+        return cls(writer, session_data.get(CHECKPOINT_FIELD), session_data.get('status'), session_data.get('refinedGoal'))
+
+    def get(self, key: str, default=None):
+        node = self._saved
+        for part in key.split('.'):
+            if not isinstance(node, dict) or part not in node:
+                return default
+            node = node[part]
+        return node
+
+    def has(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def record(self, key: str, value, extra_fields: dict = None):
+        """Stores a stage result durably, together with any fields that belong to the same step."""
+        self.record_many({key: value}, extra_fields)
+
+    def record_many(self, values: dict, extra_fields: dict = None):
+        """Stores several stage results in one write."""
+        with self._lock:
+            for key, value in values.items():
+                node = self._saved
+                parts = key.split('.')
+                for part in parts[:-1]:
+                    node = node.setdefault(part, {})
+                node[parts[-1]] = value
+        self.writer.update({**(extra_fields or {}), **{f"{CHECKPOINT_FIELD}.{key}": value for key, value in values.items()}})
+        self.writer.flush()
+
+    def completed_keys(self) -> list:
+        keys = []
+
+        def walk(node, prefix):
+            for name, value in node.items():
+                path = f"{prefix}.{name}" if prefix else name
+                # Only round maps nest further; their 'check' and 'digests' entries are results
+                if isinstance(value, dict) and name.startswith('round') and name[5:].isdigit():
+                    walk(value, path)
+                elif isinstance(value, dict) and name == 'debate':
+                    walk(value, path)
+                else:
+                    keys.append(path)
+
+        walk(self._saved, '')
+        return keys
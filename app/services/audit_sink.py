@@ -0,0 +1,421 @@
+# --- app/services/audit_sink.py ---
+"""Moderation audit log sinks, plus an offline query and compaction tool for the segment files.
+
+Usage (no app or Firestore needed):
+    python -m app.services.audit_sink query --dir instance/moderation_audit [--since 2026-01-01]
+                                            [--until ...] [--source ai_context_filter]
+                                            [--owner USER_ID] [--rejected] [--include-active]
+    python -m app.services.audit_sink compact --dir instance/moderation_audit [--max-age-days 365]
+                                              [--target-bytes 268435456] [--stale-after 3600]
+"""
+import argparse
+import atexit
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+FIRESTORE_MAX_BATCH = 500  # Firestore's cap on writes per batch
+ACTIVE_SUFFIX = '.jsonl.active'
+SEGMENT_SUFFIXES = ('.jsonl', '.jsonl.gz')
+
+
+class BufferedAuditSink:
+    """Buffers audit records in memory and writes them from a background thread.
+
+    A flush happens once `batch_size` records are waiting or the oldest has waited `flush_interval`
+    seconds, whichever comes first, so `write` never waits on storage. At most `max_buffer` records
+    are held; beyond that (storage down for a long time) the oldest are dropped and counted.
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 2.0, max_buffer: int = 10000, name: str = 'audit'):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.name = name
+        self._buffer = deque(maxlen=max(self.batch_size, max_buffer))
+        self._cond = threading.Condition()
+        self._oldest_at = None
+        self._writing = False
+        self._closed = False
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+
+    def write(self, record: dict):
+        with self._cond:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    logger.warning(f"{self.name} audit buffer is full; dropped {self.dropped} records so far")
+            self._buffer.append(record)
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-audit-flusher", daemon=True)
+                self._thread.start()
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self, timeout: float = 30.0):
+        """Writes every buffered record now; returns once the buffer is empty or `timeout` passes."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while self._writing and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                if not self._buffer or time.monotonic() >= deadline:
+                    return
+                batch = self._take()
+            self._write_safely(batch)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.flush()
+
+    def _take(self) -> list:
+        # Called with the condition held
+        batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        self._oldest_at = time.monotonic() if self._buffer else None
+        self._writing = True
+        return batch
+
+    def _write_safely(self, batch: list):
+        try:
+            self._write_batch(batch)
+            written = len(batch)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} {self.name} audit records: {e}")
+            written = 0
+        with self._cond:
+            self.written += written
+            self._writing = False
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._buffer) >= self.batch_size and not self._writing:
+                        break
+                    if self._oldest_at is not None and not self._writing:
+                        remaining = self._oldest_at + self.flush_interval - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+                batch = self._take()
+            self._write_safely(batch)
+
+    def _write_batch(self, records: list):
+        raise NotImplementedError
+
+
+class FirestoreAuditSink(BufferedAuditSink):
+    """Writes audit records to a Firestore collection, up to 500 per batched commit."""
+
+    def __init__(self, db_client, collection: str = 'moderation_logs', **kwargs):
+        kwargs['batch_size'] = min(kwargs.get('batch_size', FIRESTORE_MAX_BATCH), FIRESTORE_MAX_BATCH)
+        super().__init__(name='firestore', **kwargs)
+        self.db = db_client
+        self.collection = collection
+
+    def _write_batch(self, records: list):
+        batch = self.db.batch()
+        collection = self.db.collection(self.collection)
+        for record in records:
+            batch.set(collection.document(), record)
+        batch.commit()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class SegmentAuditSink(BufferedAuditSink):
+    """Appends audit records as JSON lines to local segment files, rotated by size.
+
+    The segment being written ends in '.jsonl.active'. Once it reaches `max_segment_bytes` it is
+    closed as '.jsonl.gz' (or '.jsonl' without `compress`) and never changes again, which is what
+    the query and compact commands read. Every process writes its own segments.
+    """
+
+    def __init__(self, directory: str, max_segment_bytes: int = 64 * 1024 * 1024, compress: bool = True, **kwargs):
+        super().__init__(name='segments', **kwargs)
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.compress = compress
+        self._file = None
+        self._path = None
+        self._sequence = 0
+
+    def close(self):
+        super().close()
+        with self._cond:
+            self._close_segment()
+
+    def _write_batch(self, records: list):
+        data = ''.join(json.dumps(record, ensure_ascii=False, default=_json_default) + '\n' for record in records).encode('utf-8')
+        if self._file is None:
+            self._open_segment()
+        self._file.write(data)
+        self._file.flush()
+        if self._file.tell() >= self.max_segment_bytes:
+            self._close_segment()
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+        self._path = os.path.join(self.directory, f"moderation-{stamp}-{os.getpid()}-{self._sequence:04d}{ACTIVE_SUFFIX}")
+        self._file = open(self._path, 'ab')
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        try:
+            _seal_segment(self._path, self.compress)
+        except OSError as e:
+            logger.error(f"Failed to close audit segment {self._path}: {e}")
+
+
+def _seal_segment(path: str, compress: bool) -> str:
+    """Turns an active segment into a closed one; returns the closed path."""
+    base = path[:-len(ACTIVE_SUFFIX)]
+    if not compress:
+        os.replace(path, base + '.jsonl')
+        return base + '.jsonl'
+    with open(path, 'rb') as src, gzip.open(base + '.jsonl.gz.tmp', 'wb') as dst:
+        while chunk := src.read(1024 * 1024):
+            dst.write(chunk)
+    os.replace(base + '.jsonl.gz.tmp', base + '.jsonl.gz')
+    os.remove(path)
+    return base + '.jsonl.gz'
+
+
+class MultiAuditSink:
+    """Sends every record to several sinks."""
+
+    def __init__(self, sinks: list):
+        self.sinks = sinks
+
+    def write(self, record: dict):
+        for sink in self.sinks:
+            sink.write(record)
+
+    def flush(self, timeout: float = 30.0):
+        for sink in self.sinks:
+            sink.flush(timeout)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _sink, _sink_lock
+    # Records buffered before the fork belong to the parent, which flushes them
+    _sink = None
+    _sink_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_audit_sink(config, db_client):
+    """Returns the process-wide moderation audit sink chosen by MODERATION_AUDIT_SINK, or None for 'none'.
+
+    MODERATION_AUDIT_SINK is a comma-separated list of 'firestore' (batched writes to
+    moderation_logs) and 'segments' (rotated local JSONL files).
+    """
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                buffering = {
+                    'flush_interval': config.get('MODERATION_AUDIT_FLUSH_INTERVAL', 2.0),
+                    'max_buffer': config.get('MODERATION_AUDIT_MAX_BUFFER', 10000),
+                    'batch_size': config.get('MODERATION_AUDIT_BATCH_SIZE', FIRESTORE_MAX_BATCH),
+                }
+                sinks = []
+                for backend in (b.strip() for b in config.get('MODERATION_AUDIT_SINK', 'firestore').split(',')):
+                    if backend == 'firestore':
+                        sinks.append(FirestoreAuditSink(db_client, **buffering))
+                    elif backend == 'segments':
+                        sinks.append(SegmentAuditSink(
+                            config.get('MODERATION_AUDIT_SEGMENT_DIR', 'instance/moderation_audit'),
+                            max_segment_bytes=config.get('MODERATION_AUDIT_SEGMENT_MAX_BYTES', 64 * 1024 * 1024),
+                            compress=config.get('MODERATION_AUDIT_COMPRESS', True),
+                            **buffering,
+                        ))
+                    elif backend not in ('', 'none'):
+                        logger.warning(f"Unknown moderation audit sink '{backend}' ignored")
+                _sink = MultiAuditSink(sinks) if sinks else False
+    return _sink or None
+
+
+def close_audit_sink():
+    """Flushes and closes this process' audit sink, if one was created."""
+    global _sink
+    with _sink_lock:
+        sink, _sink = _sink, None
+    if sink:
+        sink.close()
+
+
+atexit.register(close_audit_sink)
+
+
+# --- Offline tools over the segment files ---
+
+def list_segments(directory: str, include_active: bool = False) -> list:
+    """Segment paths in name (creation time) order; active ones only when asked for."""
+    suffixes = SEGMENT_SUFFIXES + ((ACTIVE_SUFFIX,) if include_active else ())
+    try:
+        names = sorted(n for n in os.listdir(directory) if n.endswith(suffixes))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, n) for n in names]
+
+
+def read_segment(path: str):
+    """Yields the records in one segment, skipping a torn last line of an active segment."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping an unreadable line in {path}")
+
+
+def _matches(record: dict, since: str = None, until: str = None, source: str = None, owner: str = None, rejected: bool = False) -> bool:
+    timestamp = record.get('timestamp') or ''
+    if since and timestamp < since:
+        return False
+    if until and timestamp >= until:
+        return False
+    if source and record.get('source') != source:
+        return False
+    if owner and record.get('ownerId') != owner:
+        return False
+    if rejected and (record.get('moderation_result') or {}).get('approved', True):
+        return False
+    return True
+
+
+def query(directory: str, include_active: bool = False, **filters):
+    """Yields the audit records in `directory` that pass the filters of _matches."""
+    for path in list_segments(directory, include_active):
+        for record in read_segment(path):
+            if _matches(record, **filters):
+                yield record
+
+
+def compact(directory: str, max_age_days: float = None, target_bytes: int = 256 * 1024 * 1024, stale_after: float = 3600) -> dict:
+    """Merges closed segments into time-ordered compressed segments of about `target_bytes`.
+
+    Records older than `max_age_days` are dropped. Active segments not written for `stale_after`
+    seconds (left by a process that died) are compacted too; live ones are left alone.
+    """
+    now = time.time()
+    inputs = list_segments(directory)
+    inputs += [p for p in list_segments(directory, include_active=True)
+               if p.endswith(ACTIVE_SUFFIX) and now - os.path.getmtime(p) > stale_after]
+    if not inputs:
+        return {"inputs": 0, "outputs": 0, "records": 0, "dropped": 0}
+
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat() if max_age_days else None
+    records, dropped = [], 0
+    for path in inputs:
+        for record in read_segment(path):
+            if cutoff and (record.get('timestamp') or '') < cutoff:
+                dropped += 1
+            else:
+                records.append(record)
+    records.sort(key=lambda r: r.get('timestamp') or '')
+
+    outputs, chunk, chunk_bytes = [], [], 0
+    for record in records:
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        chunk.append(line)
+        chunk_bytes += len(line)
+        if chunk_bytes >= target_bytes:
+            outputs.append(_write_compacted(directory, chunk, len(outputs)))
+            chunk, chunk_bytes = [], 0
+    if chunk:
+        outputs.append(_write_compacted(directory, chunk, len(outputs)))
+
+    for path in inputs:
+        if path not in outputs:
+            os.remove(path)
+    return {"inputs": len(inputs), "outputs": len(outputs), "records": len(records), "dropped": dropped}
+
+
+def _write_compacted(directory: str, lines: list, index: int) -> str:
+    first = json.loads(lines[0]).get('timestamp') or 'unknown'
+    stamp = ''.join(c for c in first if c.isalnum())[:15]
+    path = os.path.join(directory, f"compacted-{stamp}-{os.getpid()}-{index:04d}.jsonl.gz")
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+        f.writelines(lines)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    query_parser = commands.add_parser('query', help="print matching records as JSON lines")
+    query_parser.add_argument('--dir', required=True)
+    query_parser.add_argument('--since', help="ISO timestamp (inclusive)")
+    query_parser.add_argument('--until', help="ISO timestamp (exclusive)")
+    query_parser.add_argument('--source', help="e.g. basic_keyword_filter, ai_context_filter, error_fallback")
+    query_parser.add_argument('--owner')
+    query_parser.add_argument('--rejected', action='store_true', help="only rejected content")
+    query_parser.add_argument('--include-active', action='store_true', help="also read segments still being written")
+    query_parser.add_argument('--count', action='store_true', help="print only the number of matches")
+
+    compact_parser = commands.add_parser('compact', help="merge closed segments and apply retention")
+    compact_parser.add_argument('--dir', required=True)
+    compact_parser.add_argument('--max-age-days', type=float)
+    compact_parser.add_argument('--target-bytes', type=int, default=256 * 1024 * 1024)
+    compact_parser.add_argument('--stale-after', type=float, default=3600)
+
+    args = parser.parse_args(argv)
+    if args.command == 'compact':
+        print(json.dumps(compact(args.dir, args.max_age_days, args.target_bytes, args.stale_after)))
+        return 0
+
+    matches = query(args.dir, include_active=args.include_active, since=args.since, until=args.until,
+                    source=args.source, owner=args.owner, rejected=args.rejected)
+    if args.count:
+        print(sum(1 for _ in matches))
+        return 0
+    for record in matches:
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
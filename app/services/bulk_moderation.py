@@ -0,0 +1,180 @@
+# --- app/services/bulk_moderation.py ---
+import json
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from google.api_core.exceptions import FailedPrecondition
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from .moderation_service import ModerationService, moderation_update
+from .openai_service import OpenAIService
+from .rate_limiter import PRIORITY_BACKGROUND, LocalTokenBuckets, RateLimiter
+from .search_index import sync_organizations
+
+logger = logging.getLogger(__name__)
+
+FIRESTORE_MAX_BATCH = 500
+
+
+class BulkModerationRunner:
+    """Re-moderates the organizations collection, e.g. after the keyword list or prompt changed.
+
+    Organizations are read in pages ordered by document id. Each page is split into chunks of
+    MODERATION_BATCH_SIZE, which `workers` threads moderate through ModerationService.moderate_contents
+    (one batched LLM request per chunk), taking at most `llm_rate` chunks per second. Verdicts are
+    written back in batched updates (and to the search index) and the last finished page is checkpointed, so an interrupted
+    run resumes where it stopped. An organization whose AI check failed keeps its current status and
+    is listed in the checkpoint's 'failed' ids. Each write is conditional on the document's update_time
+    from the page read, so an organization edited while its chunk was with the LLM is skipped and
+    counted as 'stale' rather than overwritten with a verdict on old content.
+    """
+
+    def __init__(self, db_client, workers: int = 4, page_size: int = 200, llm_rate: float = 2.0,
+                 statuses: tuple = ('approved', 'rejected'), checkpoint_path: str = None, dry_run: bool = False,
+                 limit: int = None):
+        self.db = db_client
+        self.workers = max(1, workers)
+        self.page_size = page_size
+        self.statuses = list(statuses)
+        self.checkpoint_path = checkpoint_path
+        self.dry_run = dry_run
+        self.limit = limit
+        self.chunk_size = current_app.config.get('MODERATION_BATCH_SIZE', 8)
+        # Only this run's requests count against the rate; shared traffic still goes through the global limiter
+        self.throttle = RateLimiter(LocalTokenBuckets(), global_rate=llm_rate, global_burst=max(1.0, llm_rate),
+                                    max_waits={PRIORITY_BACKGROUND: float('inf')})
+        self._app = current_app._get_current_object()
+
+    def run(self, resume: bool = False) -> dict:
+        state = self._load_checkpoint() if resume else None
+        state = state or {"lastId": None, "totals": {}, "failed": [], "elapsedSeconds": 0.0, "done": False}
+        if state["done"]:
+            logger.info("Checkpoint says the previous run finished; nothing to resume.")
+            return self._report(state, 0.0)
+        totals = state["totals"]
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='remoderate') as pool:
+            while self.limit is None or totals.get("scanned", 0) < self.limit:
+                docs = self._page(state["lastId"])
+                if self.limit is not None:
+                    docs = docs[:self.limit - totals.get("scanned", 0)]
+                if not docs:
+                    state["done"] = True
+                    break
+
+                orgs = [(doc.id, doc.to_dict()) for doc in docs]
+                update_times = {doc.id: doc.update_time for doc in docs}
+                chunks = [orgs[i:i + self.chunk_size] for i in range(0, len(orgs), self.chunk_size)]
+                updates = []
+                for chunk, results in zip(chunks, pool.map(self._moderate_chunk, chunks)):
+                    for (org_id, org_data), result in zip(chunk, results):
+                        if result is None or result.get('level') in ('ai_error', 'fallback'):
+                            state["failed"].append(org_id)
+                            _add(totals, "failed")
+                            continue
+                        updates.append((org_id, org_data, update_times[org_id], moderation_update(org_id, org_data, result)))
+                _add(totals, "scanned", len(orgs))
+                _add(totals, "llmBatches", len(chunks))
+
+                written = self._write(updates)
+                _add(totals, "stale", len(updates) - len(written))
+                for _, org_data, _, update in written:
+                    _add(totals, update['status'])
+                    if update['status'] != org_data.get('status'):
+                        _add(totals, "changed")
+                state["lastId"] = orgs[-1][0]
+                state["elapsedSeconds"] += time.perf_counter() - started
+                started = time.perf_counter()
+                self._save_checkpoint(state)
+                logger.info(f"Re-moderated {totals['scanned']} organizations (last id {state['lastId']})")
+
+        state["elapsedSeconds"] += time.perf_counter() - started
+        self._save_checkpoint(state)
+        return self._report(state, state["elapsedSeconds"])
+
+    def _page(self, last_id: str) -> list:
+        query = self.db.collection('organizations')
+        if self.statuses:
+            query = query.where(filter=FieldFilter('status', 'in', self.statuses))
+        query = query.order_by('__name__').limit(self.page_size)
+        if last_id:
+            query = query.start_after({'__name__': last_id})
+        return list(query.stream())
+
+    def _moderate_chunk(self, chunk: list) -> list:
+        self.throttle.acquire('moderation', PRIORITY_BACKGROUND)
+        with self._app.app_context():
+            try:
+                return ModerationService(self.db, OpenAIService()).moderate_contents([org_data for _, org_data in chunk])
+            except Exception as e:
+                logger.error(f"Re-moderating {len(chunk)} organizations failed: {e}")
+                return [None] * len(chunk)
+
+    def _write(self, updates: list) -> list:
+        """Writes the verdicts, each only if its organization is unchanged since it was read; returns those written."""
+        if self.dry_run or not updates:
+            return updates
+        written = []
+        for start in range(0, len(updates), FIRESTORE_MAX_BATCH):
+            chunk = updates[start:start + FIRESTORE_MAX_BATCH]
+            batch = self.db.batch()
+            for org_id, _, update_time, update in chunk:
+                batch.update(self.db.collection('organizations').document(org_id), update,
+                             option=self.db.write_option(last_update_time=update_time))
+            try:
+                batch.commit()
+                written.extend(chunk)
+                continue
+            except FailedPrecondition:
+                logger.info("An organization changed during re-moderation; writing this batch one by one")
+            # A batch is all or nothing, so fall back to per-document writes and skip the stale ones
+            for item in chunk:
+                org_id, _, update_time, update = item
+                try:
+                    self.db.collection('organizations').document(org_id).update(
+                        update, option=self.db.write_option(last_update_time=update_time))
+                    written.append(item)
+                except FailedPrecondition:
+                    logger.info(f"Organization {org_id} changed since it was read; leaving it as is")
+        sync_organizations(self._app.config, [(org_id, org_data, update['status']) for org_id, org_data, _, update in written])
+        return written
+
+    def _report(self, state: dict, elapsed: float) -> dict:
+        totals = state["totals"]
+        scanned = totals.get("scanned", 0)
+        return {
+            **{key: totals.get(key, 0) for key in ("scanned", "approved", "rejected", "changed", "failed", "stale", "llmBatches")},
+            "failedIds": state["failed"],
+            "complete": state["done"],
+            "dryRun": self.dry_run,
+            "elapsedSeconds": round(elapsed, 3),
+            "orgsPerSecond": round(scanned / elapsed, 2) if elapsed > 0 else 0.0,
+            "llmBatchesPerSecond": round(totals.get("llmBatches", 0) / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+    def _load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            state = json.load(f)
+        logger.info(f"Resuming re-moderation after organization {state.get('lastId')}")
+        return state
+
+    def _save_checkpoint(self, state: dict):
+        if not self.checkpoint_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.checkpoint_path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.remoderate.')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+
+def _add(totals: dict, key: str, amount: int = 1):
+    totals[key] = totals.get(key, 0) + amount
@@ -0,0 +1,158 @@
+# --- app/services/goal_cache.py ---
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from .agreement import _STOPWORDS, _TOKEN_RE
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 64
+_SUFFIXES = ('ing', 'ed', 'es', 's')
+
+
+def _stem(term: str) -> str:
+    # Just enough folding that "keeping a job" and "keep jobs" fingerprint alike
+    for suffix in _SUFFIXES:
+        if term.endswith(suffix) and len(term) - len(suffix) >= 3:
+            return term[:-len(suffix)]
+    return term
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of a goal's content words and word pairs; near-identical goals differ in few bits."""
+    terms = [_stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS and len(t) > 2]
+    features = {}
+    for term in terms:
+        features[term] = features.get(term, 0) + 1
+    # Word pairs make "part-time job, top program" and "top job, part-time program" differ
+    for first, second in zip(terms, terms[1:]):
+        features[f"{first} {second}"] = features.get(f"{first} {second}", 0) + 1
+
+    weights = [0] * FINGERPRINT_BITS
+    for feature, weight in features.items():
+        digest = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += weight if digest >> bit & 1 else -weight
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def similarity(a: int, b: int) -> float:
+    """Share of fingerprint bits two goals agree on (1.0 for identical content)."""
+    return 1.0 - bin(a ^ b).count('1') / FINGERPRINT_BITS
+
+
+class GoalCache:
+    """Completed analyses indexed by the SimHash of their refined goal, persisted to a local JSON file.
+
+    A new analysis whose goal is at least `threshold` similar to a recent one by the same user can
+    start from that analysis' persona responses; analyses are never shared between users. The file is rewritten atomically and re-read when another process
+    on the host has changed it; concurrent writers may drop each other's newest entry, which only
+    costs a future cache miss.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.9, max_entries: int = 200, max_age: float = 7 * 24 * 3600):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = []
+        self._mtime = None
+        self._stats = {"lookups": 0, "hits": 0, "llmCallsSaved": 0}
+
+    def lookup(self, goal: str, user_id: str):
+        """Returns (entry, similarity) for the user's most similar recent analysis above the threshold, or None."""
+        fingerprint = simhash(goal)
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            self._reload()
+            best, best_score = None, self.threshold
+            for entry in self._entries:
+                if entry["createdAt"] < cutoff or entry.get("userId") != user_id:
+                    continue
+                score = similarity(fingerprint, entry["fingerprint"])
+                if score >= best_score:
+                    best, best_score = entry, score
+            self._stats["lookups"] += 1
+            if best is None:
+                return None
+            self._stats["hits"] += 1
+            self._stats["llmCallsSaved"] += max(0, best.get("llmCalls", 0) - 1)
+            return best, best_score
+
+    def add(self, goal: str, user_id: str, session_id: str, analysis: dict):
+        """Indexes a user's completed analysis: its debate, critique, final responses, consensus and LLM call count."""
+        entry = {"fingerprint": simhash(goal), "goal": goal, "userId": user_id, "sessionId": session_id, "createdAt": time.time(), **analysis}
+        with self._lock:
+            self._reload()
+            self._entries = [e for e in self._entries if e["sessionId"] != session_id] + [entry]
+            self._entries = self._entries[-self.max_entries:]
+            self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hitRate"] = round(stats["hits"] / stats["lookups"], 3) if stats["lookups"] else 0.0
+        return stats
+
+    def _reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._entries = json.load(f)
+            self._mtime = mtime
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read the goal cache at {self.path}: {e}")
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.goal_cache.')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._mtime = os.path.getmtime(self.path)
+        except OSError as e:
+            logger.warning(f"Could not write the goal cache at {self.path}: {e}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _cache, _cache_lock
+    _cache = None
+    _cache_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_goal_cache(config):
+    """Returns the process-wide goal cache, or None unless AI_GOAL_CACHE_ENABLED is set."""
+    global _cache
+    if not config.get('AI_GOAL_CACHE_ENABLED', False):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = GoalCache(
+                    config.get('AI_GOAL_CACHE_PATH', 'instance/goal_cache.json'),
+                    threshold=config.get('AI_GOAL_CACHE_THRESHOLD', 0.9),
+                    max_entries=config.get('AI_GOAL_CACHE_MAX_ENTRIES', 200),
+                    max_age=config.get('AI_GOAL_CACHE_MAX_AGE', 7 * 24 * 3600),
+                )
+    return _cache
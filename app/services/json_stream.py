@@ -0,0 +1,89 @@
+# --- app/services/json_stream.py ---
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalJSONObject:
+    """Extracts the top-level fields of a JSON object from text that arrives in pieces.
+
+    `feed` returns the fields whose values became complete with that piece, so a caller can act on
+    a decisive field (e.g. 'consensus': false) before the rest of the object has been generated.
+    Text before the first '{' (such as a markdown fence) is ignored, as in
+    OpenAIService._parse_json_from_response.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.done = False
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._key = None
+        self._token = []  # characters of the key or value currently being read at depth 1
+
+    def feed(self, text: str) -> list:
+        completed = []
+        for char in text:
+            if self.done:
+                break
+            if not self._started:
+                if char == '{':
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                self._token.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if self._depth == 1 and char in ',}':
+                field = self._complete_value()
+                if field is not None:
+                    completed.append(field)
+                if char == '}':
+                    self._depth = 0
+                    self.done = True
+                continue
+            if self._depth == 1 and char == ':' and self._key is None:
+                self._key = self._decode(''.join(self._token)) if self._token else None
+                self._token = []
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+            if not char.isspace() or self._depth > 1:
+                self._token.append(char)
+        return completed
+
+    def _complete_value(self):
+        key, raw = self._key, ''.join(self._token)
+        self._key = None
+        self._token = []
+        if not raw:
+            return None  # '{}' or a trailing comma
+        if not isinstance(key, str):
+            logger.debug(f"Skipping a JSON field without a readable key: {raw[:40]!r}")
+            return None
+        value = self._decode(raw)
+        self.fields[key] = value
+        return key, value
+
+    @staticmethod
+    def _decode(raw: str):
+        try:
+            return json.loads(raw)
+        except ValueError:
+            return None
@@ -0,0 +1,158 @@
+# --- app/services/keyword_filter.py ---
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEYWORDS = [
+    'fuck', 'shit', 'asshole', 'bitch', 'cunt', 'nigger', 'retard',
+    'porn', 'sex', 'xxx', 'adult', 'explicit', 'hate', 'violence',
+    'kill', 'murder', 'suicide', 'scam', 'fraud', 'phishing', 'malware',
+    'illegal', 'drugs', 'weapons', 'guns', 'spam', 'advertisement'
+]
+
+# Common character substitutions used to slip words past a filter ("s3x", "$cam", "@dult")
+_LEET = str.maketrans({'0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '@': 'a', '$': 's', '!': 'i', '|': 'l'})
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(text: str, leet: bool = False) -> str:
+    """Folds case, compatibility forms (full-width, ligatures) and accents; with `leet`, also leetspeak."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    folded = ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    return _WHITESPACE.sub(' ', folded.translate(_LEET) if leet else folded)
+
+
+def _trie_pattern(words: list) -> str:
+    """One regex for all words, factored as a trie so shared prefixes are matched once."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node) -> str:
+        ends = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if ends else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """All blocked keywords compiled into one word-bounded regex, matched in a single pass.
+
+    Keywords and text go through the same normalization, so 'S3X', 'ｓｅｘ' and 'séx' all match 'sex'.
+    Text is scanned both as written and with leetspeak undone, since substitutions like '!' for 'i'
+    would otherwise hide a keyword followed by punctuation ("kill!"). Multi-word keywords match
+    across any run of whitespace.
+    """
+
+    def __init__(self, keywords: list):
+        self._originals = {}
+        for keyword in keywords:
+            keyword = keyword.strip()
+            for normalized in (normalize(keyword), normalize(keyword, leet=True)):
+                if normalized:
+                    self._originals.setdefault(normalized, keyword)
+        self.keywords = list(dict.fromkeys(self._originals.values()))
+        self._pattern = None
+        if self._originals:
+            self._pattern = re.compile(r'\b' + _trie_pattern(sorted(self._originals)).replace(r'\ ', r'\s+') + r'\b')
+
+    def find(self, texts: list) -> list:
+        """The blocked keywords (as listed) found in any of `texts`, in order of first appearance."""
+        if self._pattern is None:
+            return []
+        # Fields are joined with a newline, which is a word boundary, so matches never span two fields
+        joined = '\n'.join(t for t in texts if t)
+        plain, unleeted = normalize(joined), normalize(joined, leet=True)
+        haystack = plain if plain == unleeted else f"{plain}\n{unleeted}"
+        found = {}
+        for match in self._pattern.finditer(haystack):
+            keyword = self._originals.get(_WHITESPACE.sub(' ', match.group(0)))
+            if keyword is not None:
+                found.setdefault(keyword, None)
+        return list(found)
+
+
+def load_keywords(path: str) -> list:
+    """One keyword or phrase per line; blank lines and lines starting with '#' are skipped."""
+    with open(path, encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+class ReloadingKeywordMatcher:
+    """A KeywordMatcher rebuilt whenever its keyword file changes, checked at most every `interval` seconds."""
+
+    def __init__(self, path: str = None, interval: float = 30.0):
+        self.path = path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self._matcher = KeywordMatcher(DEFAULT_KEYWORDS)
+        self._maybe_reload(force=True)
+
+    @property
+    def matcher(self) -> KeywordMatcher:
+        self._maybe_reload()
+        return self._matcher
+
+    def find(self, texts: list) -> list:
+        return self.matcher.find(texts)
+
+    def _maybe_reload(self, force: bool = False):
+        if not self.path:
+            return
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self.path)
+                if mtime == self._mtime:
+                    return
+                matcher = KeywordMatcher(load_keywords(self.path))
+            except OSError as e:
+                # Keep the current list; a missing or unreadable file must not disable the filter
+                logger.warning(f"Could not load moderation keywords from {self.path}: {e}")
+                return
+            self._matcher, self._mtime = matcher, mtime
+            logger.info(f"Loaded {len(matcher.keywords)} moderation keywords from {self.path}")
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _matcher, _matcher_lock
+    _matcher = None
+    _matcher_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_keyword_matcher(config) -> ReloadingKeywordMatcher:
+    """Returns the process-wide keyword matcher, built from MODERATION_KEYWORDS_PATH or the default list."""
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = ReloadingKeywordMatcher(
+                    config.get('MODERATION_KEYWORDS_PATH'),
+                    interval=config.get('MODERATION_KEYWORDS_RELOAD_INTERVAL', 30.0),
+                )
+    return _matcher
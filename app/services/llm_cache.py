@@ -0,0 +1,178 @@
+# --- app/services/llm_cache.py ---
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "llm_cache:"
+REDIS_STATS_KEY = "llm_cache:stats"
+
+
+def make_cache_key(model_id: str, messages: list, temperature: float, max_tokens: int, is_json: bool) -> str:
+    """Stable hash of everything that determines a completion request."""
+    payload = json.dumps(
+        {"model": model_id, "messages": messages, "temperature": temperature, "max_tokens": max_tokens, "json": bool(is_json)},
+        sort_keys=True,
+        separators=(',', ':'),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """Two-tier cache of raw completion text: an in-process LRU bounded by bytes, backed by Redis.
+
+    Entries remember how long the original call took and how many tokens it used, so every hit
+    adds to the seconds/tokens-saved counters.
+    """
+
+    def __init__(self, max_bytes: int, default_ttl: int, model_ttls: dict = None, redis_url: str = None):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.model_ttls = model_ttls or {}
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, raw_entry)
+        self._bytes = 0
+        self._stats = {
+            "hits_local": 0, "hits_redis": 0, "misses": 0, "stores": 0, "evictions": 0,
+            "bytes_served": 0, "seconds_saved": 0.0, "tokens_saved": 0,
+        }
+        self.redis = None
+        if redis_url:
+            import redis
+            self.redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+    def ttl_for(self, model_id: str) -> int:
+        return self.model_ttls.get(model_id, self.default_ttl)
+
+    def get(self, key: str, model_id: str):
+        """Returns the cached entry dict ({'content', 'latency', 'tokens'}) or None."""
+        if self.ttl_for(model_id) <= 0:
+            return None
+
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None:
+                expires_at, raw = item
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                else:
+                    self._drop(key)
+                    item = None
+        if item is not None:
+            return self._record_hit("hits_local", raw)
+
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(REDIS_KEY_PREFIX + key)
+            except Exception as e:
+                logger.warning(f"LLM cache Redis lookup failed: {e}")
+                raw = None
+            if raw is not None:
+                raw = raw.decode('utf-8')
+                with self._lock:
+                    self._put_local(key, raw, self.ttl_for(model_id))
+                return self._record_hit("hits_redis", raw)
+
+        with self._lock:
+            self._stats["misses"] += 1
+        self._incr_shared({"misses": 1})
+        return None
+
+    def set(self, key: str, model_id: str, content: str, latency: float = 0.0, tokens: int = 0):
+        ttl = self.ttl_for(model_id)
+        if ttl <= 0:
+            return
+        raw = json.dumps({"content": content, "latency": latency, "tokens": tokens}, ensure_ascii=False)
+        with self._lock:
+            self._put_local(key, raw, ttl)
+            self._stats["stores"] += 1
+        if self.redis is not None:
+            try:
+                self.redis.set(REDIS_KEY_PREFIX + key, raw, ex=int(ttl))
+            except Exception as e:
+                logger.warning(f"LLM cache Redis store failed: {e}")
+
+    def stats(self) -> dict:
+        """Counters for this process, plus the cluster-wide totals when Redis is configured."""
+        with self._lock:
+            local = dict(self._stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+        result = {"process": local}
+        if self.redis is not None:
+            try:
+                shared = self.redis.hgetall(REDIS_STATS_KEY)
+                result["cluster"] = {k.decode(): float(v) for k, v in shared.items()}
+            except Exception as e:
+                logger.warning(f"LLM cache Redis stats lookup failed: {e}")
+        return result
+
+    # --- internals ---
+
+    def _record_hit(self, counter: str, raw: str) -> dict:
+        entry = json.loads(raw)
+        saved = {
+            counter: 1,
+            "bytes_served": len(raw.encode('utf-8')),
+            "seconds_saved": entry.get("latency", 0.0),
+            "tokens_saved": entry.get("tokens", 0),
+        }
+        with self._lock:
+            for name, amount in saved.items():
+                self._stats[name] += amount
+        self._incr_shared(saved)
+        return entry
+
+    # _put_local and _drop expect the caller to hold self._lock
+    def _put_local(self, key: str, raw: str, ttl: int):
+        size = len(raw.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.time() + ttl, raw)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self._stats["evictions"] += 1
+
+    def _drop(self, key: str):
+        _, raw = self._entries.pop(key)
+        self._bytes -= len(raw.encode('utf-8'))
+
+    def _incr_shared(self, counters: dict):
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for name, amount in counters.items():
+                if amount:
+                    pipe.hincrbyfloat(REDIS_STATS_KEY, name, amount)
+            pipe.execute()
+        except Exception as e:
+            logger.debug(f"LLM cache Redis stats update failed: {e}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(config):
+    """Returns the process-wide response cache, or None when LLM_CACHE_ENABLED is off."""
+    global _cache
+    if not config.get('LLM_CACHE_ENABLED', False):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache(
+                    max_bytes=config.get('LLM_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+                    default_ttl=config.get('LLM_CACHE_DEFAULT_TTL', 3600),
+                    model_ttls=config.get('LLM_CACHE_MODEL_TTLS'),
+                    redis_url=config.get('LLM_CACHE_REDIS_URL'),
+                )
+    return _cache
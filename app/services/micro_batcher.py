@@ -0,0 +1,80 @@
+# --- app/services/micro_batcher.py ---
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Groups items submitted from many threads into batches for one handler call.
+
+    A batch is dispatched once it holds `max_items` items or its oldest item has waited `max_wait`
+    seconds. Up to `max_in_flight` batches run at once; items arriving meanwhile gather into the
+    next batch. `handler(items)` must return one result per item, in order; a result that is an
+    exception instance is raised to that item's caller, and if the handler raises, every item in the
+    batch gets the exception. Items whose future was cancelled before dispatch are left out.
+    """
+
+    def __init__(self, handler, max_items: int = 8, max_wait: float = 0.05, max_in_flight: int = 2, name: str = 'micro-batcher'):
+        self.handler = handler
+        self.max_items = max(1, max_items)
+        self.max_wait = max_wait
+        self.name = name
+        self._cond = threading.Condition()
+        self._pending = []  # (item, future, submitted_at)
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=name)
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item) -> Future:
+        future = Future()
+        with self._cond:
+            self._pending.append((item, future, time.monotonic()))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name=f"{self.name}-collector", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return future
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"batches": self.batches, "items": self.items, "meanBatchSize": round(self.items / self.batches, 2) if self.batches else 0.0}
+
+    def _collect(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = self._pending[0][2] + self.max_wait
+                while len(self._pending) < self.max_items:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending[:self.max_items], self._pending[self.max_items:]
+                self.batches += 1
+                self.items += len(batch)
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: list):
+        # A caller that stopped waiting cancels its future; do not spend the handler on it
+        batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            results = self.handler([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"{self.name} handler returned {len(results)} results for {len(batch)} items")
+        except Exception as e:
+            logger.error(f"{self.name} batch of {len(batch)} failed: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
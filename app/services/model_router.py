@@ -0,0 +1,273 @@
+# --- app/services/model_router.py ---
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# The attempt the current router call is timing; see note_request_start
+_current_attempt = contextvars.ContextVar('llm_router_attempt', default=None)
+
+
+class _Attempt:
+    """One timed call: when its request was actually sent, as opposed to queued for a rate-limit
+    token or concurrency slot. `event` is set once the request is sent or the call has ended."""
+
+    def __init__(self, event):
+        self.started = None
+        self.event = event
+
+    def mark(self):
+        if self.started is None:
+            self.started = time.monotonic()
+        self.event.set()
+
+
+def note_request_start():
+    """Called by the routed function right before it sends the request.
+
+    Latency samples and hedge delays are measured from here, so waiting in the rate limiter or for
+    a concurrency slot neither inflates a model's latency nor triggers a hedge.
+    """
+    attempt = _current_attempt.get()
+    if attempt is not None:
+        attempt.mark()
+
+
+class LatencyTracker:
+    """Rolling window of call latencies and outcomes per model id."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_id: str, latency: float, ok: bool):
+        with self._lock:
+            samples = self._samples.get(model_id)
+            if samples is None:
+                samples = self._samples[model_id] = deque(maxlen=self.window)
+            samples.append((latency, ok))
+
+    def stats(self, model_id: str) -> dict:
+        with self._lock:
+            samples = list(self._samples.get(model_id, ()))
+        if not samples:
+            return {"samples": 0, "p50": None, "p95": None, "errorRate": None}
+        # Latency percentiles only consider successful calls; failures count towards the error rate
+        latencies = sorted(latency for latency, ok in samples if ok)
+        errors = sum(1 for _, ok in samples if not ok)
+        return {
+            "samples": len(samples),
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "errorRate": errors / len(samples),
+        }
+
+    def all_stats(self) -> dict:
+        with self._lock:
+            model_ids = list(self._samples)
+        return {model_id: self.stats(model_id) for model_id in model_ids}
+
+
+def _percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class ModelRouter:
+    """Runs model calls while tracking latency, hedging slow calls to an equivalent model.
+
+    Once a model has enough samples, a call whose request has been in flight for longer than that
+    model's p95 latency gets a duplicate request to the configured equivalent model. The first good
+    answer wins. The loser is cancelled if it has not started yet; otherwise its result is handed
+    to `discard` (or dropped) when it finishes, since the synchronous HTTP client cannot abort an
+    in-flight request. Streamed calls are routed with `first_token=True`: their function returns
+    once the first token arrives, and time to first token is tracked and hedged on separately.
+    """
+
+    def __init__(self, hedge_models: dict = None, min_samples: int = 20, min_delay: float = 1.0,
+                 window: int = 200, max_workers: int = 32):
+        self.hedge_models = hedge_models or {}
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.tracker = LatencyTracker(window)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-hedge')
+        self._counter_lock = threading.Lock()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def hedge_delay(self, model_id: str, first_token: bool = False):
+        """Seconds to wait before hedging a call to `model_id`, or None if it should not be hedged."""
+        if model_id not in self.hedge_models:
+            return None
+        stats = self.tracker.stats(_sample_key(model_id, first_token))
+        if stats["samples"] < self.min_samples or stats["p95"] is None:
+            return None
+        return max(self.min_delay, stats["p95"])
+
+    def call(self, model_id: str, fn, first_token: bool = False, discard=None):
+        """Calls fn(model_id), hedging to the equivalent model when the request runs past its p95."""
+        delay = self.hedge_delay(model_id, first_token)
+        if delay is None:
+            return self._timed(model_id, fn, first_token, _Attempt(threading.Event()))
+
+        # Run in a copy of the caller's context so telemetry attributes the call to its stage
+        attempt = _Attempt(threading.Event())
+        primary = self._executor.submit(contextvars.copy_context().run, self._timed, model_id, fn, first_token, attempt)
+        attempt.event.wait()
+        # A call that ended without sending its request (shed, circuit open) is not hedged
+        wait([primary], timeout=None if attempt.started is None else max(0.0, attempt.started + delay - time.monotonic()))
+        if primary.done():
+            return primary.result()
+
+        hedge_model_id = self.hedge_models[model_id]
+        logger.info(f"Call to {model_id} exceeded its p95 of {delay:.2f}s; hedging to {hedge_model_id}")
+        hedge = self._executor.submit(contextvars.copy_context().run, self._timed, hedge_model_id, fn, first_token, _Attempt(threading.Event()))
+        with self._counter_lock:
+            self.hedges_sent += 1
+
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    first_error = first_error or e
+                    continue
+                for loser in pending:
+                    if not loser.cancel() and discard is not None:
+                        loser.add_done_callback(lambda f: discard(f.result()) if f.exception() is None else None)
+                if future is hedge:
+                    with self._counter_lock:
+                        self.hedges_won += 1
+                return result
+        raise first_error
+
+    async def call_async(self, model_id: str, fn):
+        """Async counterpart of call for a coroutine function fn(model_id).
+
+        Unlike the threaded path, the losing request is cancelled outright, which closes its connection.
+        """
+        delay = self.hedge_delay(model_id)
+        if delay is None:
+            return await self._timed_async(model_id, fn, _Attempt(asyncio.Event()))
+
+        # Tasks run in a copy of the caller's context, so telemetry still attributes the call to its stage
+        attempt = _Attempt(asyncio.Event())
+        primary = asyncio.ensure_future(self._timed_async(model_id, fn, attempt))
+        tasks = {primary}
+        try:
+            await attempt.event.wait()
+            await asyncio.wait(tasks, timeout=None if attempt.started is None else max(0.0, attempt.started + delay - time.monotonic()))
+            if primary.done():
+                return primary.result()
+
+            hedge_model_id = self.hedge_models[model_id]
+            logger.info(f"Call to {model_id} exceeded its p95 of {delay:.2f}s; hedging to {hedge_model_id}")
+            hedge = asyncio.ensure_future(self._timed_async(hedge_model_id, fn, _Attempt(asyncio.Event())))
+            tasks.add(hedge)
+            with self._counter_lock:
+                self.hedges_sent += 1
+
+            pending = set(tasks)
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        first_error = first_error or task.exception()
+                        continue
+                    if task is hedge:
+                        with self._counter_lock:
+                            self.hedges_won += 1
+                    return task.result()
+            raise first_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {"models": self.tracker.all_stats(), "hedgesSent": self.hedges_sent, "hedgesWon": self.hedges_won}
+
+    def _timed(self, model_id: str, fn, first_token: bool, attempt: _Attempt):
+        token = _current_attempt.set(attempt)
+        queued = time.monotonic()
+        try:
+            result = fn(model_id)
+        except Exception:
+            self._record(model_id, first_token, attempt, queued, ok=False)
+            raise
+        finally:
+            _current_attempt.reset(token)
+            attempt.event.set()
+        self._record(model_id, first_token, attempt, queued, ok=True)
+        return result
+
+    async def _timed_async(self, model_id: str, fn, attempt: _Attempt):
+        token = _current_attempt.set(attempt)
+        queued = time.monotonic()
+        try:
+            result = await fn(model_id)
+        except Exception:
+            self._record(model_id, False, attempt, queued, ok=False)
+            raise
+        finally:
+            _current_attempt.reset(token)
+            attempt.event.set()
+        self._record(model_id, False, attempt, queued, ok=True)
+        return result
+
+    def _record(self, model_id: str, first_token: bool, attempt: _Attempt, queued: float, ok: bool):
+        # A call that failed before sending its request (shed, circuit open) says nothing about latency
+        if attempt.started is None and not ok:
+            return
+        self.tracker.record(_sample_key(model_id, first_token), time.monotonic() - (attempt.started or queued), ok=ok)
+
+
+def first_token_key(model_id: str) -> str:
+    """The tracker key under which a model's time-to-first-token samples are kept."""
+    return f"{model_id}#first-token"
+
+
+def _sample_key(model_id: str, first_token: bool) -> str:
+    return first_token_key(model_id) if first_token else model_id
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # The parent's executor threads do not exist in a forked child; start from a fresh router
+    global _router, _router_lock
+    _router = None
+    _router_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_model_router(config) -> ModelRouter:
+    """Returns the process-wide model router."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter(
+                    hedge_models=config.get('OPENROUTER_HEDGE_MODELS'),
+                    min_samples=config.get('OPENROUTER_HEDGE_MIN_SAMPLES', 20),
+                    min_delay=config.get('OPENROUTER_HEDGE_MIN_DELAY', 1.0),
+                    window=config.get('OPENROUTER_LATENCY_WINDOW', 200),
+                )
+    return _router
@@ -1,28 +1,74 @@
 # --- app/services/moderation_service.py (CORRECTED) ---
 
+import hashlib
+import json
 import logging
-import re
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
 from typing import Dict, List
 
+from billiard.process import current_process
+from flask import current_app, has_app_context
+
 from .openai_service import OpenAIService # Correct import
+from .openai_client_pool import REQUEST_MAX_SECONDS
+from .audit_sink import get_audit_sink
+from .keyword_filter import get_keyword_matcher
+from .micro_batcher import MicroBatcher
+from .rate_limiter import PRIORITY_BACKGROUND
+from .resilience import ModelUnavailableError
 
 logger = logging.getLogger(__name__)
 
+MODERATION_CRITERIA = "The content must be free of hate speech, explicit material, scams, violence, and illegal activities."
+# Bump to re-moderate every organization on its next edit, e.g. after the criteria above change
+MODERATION_HASH_VERSION = 1
+
+
+class NoBatchVerdict(Exception):
+    """A batched moderation request gave no usable verdict for this item."""
+
+
+def moderation_content_hash(content_data: Dict) -> str:
+    """Canonical hash of the fields moderation reads (name, description, tags).
+
+    Organizations store it with their verdict, so an edit that leaves these fields unchanged can
+    keep its approval without being moderated again. Tag order does not matter.
+    """
+    canonical = json.dumps({
+        'v': MODERATION_HASH_VERSION,
+        'name': str(content_data.get('name') or ''),
+        'description': str(content_data.get('description') or ''),
+        'tags': sorted(str(tag) for tag in content_data.get('tags') or []),
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def moderation_update(org_id: str, org_data: Dict, moderation_result: Dict) -> Dict:
+    """The organization fields to write for a moderation verdict, with the hash of the content it judged."""
+    update_data = {
+        'aiModeration': moderation_result,
+        'moderationHash': moderation_content_hash(org_data),
+        'updatedAt': datetime.now()
+    }
+
+    if moderation_result.get('approved', True):
+        update_data['status'] = 'approved'
+        logger.info(f"Organization {org_id} approved by moderation.")
+    else:
+        update_data['status'] = 'rejected'
+        logger.warning(f"Organization {org_id} rejected by moderation. Reasons: {moderation_result.get('reasons')}")
+    return update_data
+
 class ModerationService:
     # MODIFIED: Accepts the new openai_service
     def __init__(self, db_client, openai_service: OpenAIService):
         self.db = db_client
         self.openai_service = openai_service
-        self.basic_keywords = self._load_basic_keywords()
-
-    def _load_basic_keywords(self) -> List[str]:
-        return [
-            'fuck', 'shit', 'asshole', 'bitch', 'cunt', 'nigger', 'retard',
-            'porn', 'sex', 'xxx', 'adult', 'explicit', 'hate', 'violence', 
-            'kill', 'murder', 'suicide', 'scam', 'fraud', 'phishing', 'malware',
-            'illegal', 'drugs', 'weapons', 'guns', 'spam', 'advertisement'
-        ]
+        # Compiled once per process from MODERATION_KEYWORDS_PATH (hot-reloaded) or the built-in list
+        self.keyword_matcher = get_keyword_matcher(current_app.config if has_app_context() else {})
 
     # MODIFIED: Removed async/await, as this now runs in a Celery worker
     def moderate_content(self, content_data: Dict) -> Dict:
@@ -34,11 +80,15 @@ class ModerationService:
                 self._log_moderation_result(content_data, basic_result, 'basic_keyword_filter')
                 return basic_result
             
-            # If basic check passes, proceed to AI moderation.
-            ai_result = self._ai_moderation_check(content_data)
+            # If basic check passes, proceed to AI moderation, shared with concurrent requests when batching is on.
+            batcher = get_moderation_batcher(current_app.config) if has_app_context() else None
+            ai_result = self._batched_ai_moderation_check(batcher, content_data) if batcher else self._ai_moderation_check(content_data)
             self._log_moderation_result(content_data, ai_result, 'ai_context_filter')
             return ai_result
-            
+
+        except ModelUnavailableError:
+            # Shed or circuit open: nothing was checked, so let the caller retry rather than approve
+            raise
         except Exception as e:
             logger.error(f"Moderation service failed: {e}", exc_info=True)
             # As a fallback, if AI fails, trust the basic check.
@@ -47,26 +97,38 @@ class ModerationService:
             self._log_moderation_result(content_data, fallback_result, 'error_fallback')
             return fallback_result
 
+    def moderate_contents(self, contents: List[Dict]) -> List[Dict]:
+        """Moderates several items with one AI request per MODERATION_BATCH_SIZE items; results are in input order."""
+        results = [None] * len(contents)
+        pending = []
+        for i, content_data in enumerate(contents):
+            basic_result = self._basic_keyword_check(content_data)
+            if basic_result['approved']:
+                pending.append(i)
+            else:
+                self._log_moderation_result(content_data, basic_result, 'basic_keyword_filter')
+                results[i] = basic_result
+
+        batch_size = current_app.config.get('MODERATION_BATCH_SIZE', 8) if has_app_context() else 8
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            for i, ai_result in zip(chunk, self._ai_moderation_batch([contents[i] for i in chunk])):
+                self._log_moderation_result(contents[i], ai_result, 'ai_context_filter')
+                results[i] = ai_result
+        return results
+
     def _basic_keyword_check(self, content_data: Dict) -> Dict:
-        """Performs a simple, fast keyword check on key text fields."""
-        reasons = set()
+        """Performs a simple, fast keyword check on key text fields, in one pass over all of them."""
         text_to_check = [
             str(content_data.get('name', '')),
             str(content_data.get('description', '')),
         ]
         if content_data.get('tags'):
-            text_to_check.extend(content_data['tags'])
-
-        for text in text_to_check:
-            if not text: continue
-            text_lower = text.lower()
-            for keyword in self.basic_keywords:
-                # Use word boundaries to avoid matching parts of words
-                if re.search(rf'\b{re.escape(keyword)}\b', text_lower):
-                    reasons.add(f"Contains blocked keyword: '{keyword}'")
-        
+            text_to_check.extend(str(tag) for tag in content_data['tags'])
+
+        reasons = [f"Contains blocked keyword: '{keyword}'" for keyword in self.keyword_matcher.find(text_to_check)]
         if reasons:
-            return {'approved': False, 'level': 'basic', 'reasons': list(reasons)}
+            return {'approved': False, 'level': 'basic', 'reasons': reasons}
         return {'approved': True, 'level': 'basic'}
     
     # MODIFIED: Removed async/await
@@ -76,7 +138,7 @@ class ModerationService:
         
         moderation_prompt = f"""
         Analyze the following content for an educational platform for students.
-        The content must be free of hate speech, explicit material, scams, violence, and illegal activities.
+        {MODERATION_CRITERIA}
         Respond ONLY with a valid JSON object with three keys:
         1. "approved": a boolean (true or false).
         2. "confidence": an integer between 0 and 100.
@@ -93,23 +155,107 @@ class ModerationService:
         ]
         
         try:
-            # Use the synchronous query_model method with JSON mode
-            result = self.openai_service.query_model("deepseek", messages, is_json=True)
+            # Streamed JSON mode: an approval is final, so stop generating once "approved": true arrives
+            result = self.openai_service.query_json_fields("deepseek", messages, stop_when=lambda fields: fields.get("approved") is True, priority=PRIORITY_BACKGROUND)
+            result.setdefault('reasons', [])
             # Add level for consistency
             result['level'] = 'ai'
             return result
+        except ModelUnavailableError:
+            raise
         except Exception as e:
             logger.error(f"AI moderation query failed: {e}")
             # Fallback if the AI call itself fails
             return {'approved': True, 'confidence': 0, 'reasons': ['AI moderation check failed to execute.'], 'level': 'ai_error'}
 
+    def _batched_ai_moderation_check(self, batcher: MicroBatcher, content_data: Dict) -> Dict:
+        """_ai_moderation_check through the shared micro-batcher.
+
+        Waits at most for the batch to fill plus the worst case of the one batched request (rate-limit
+        and concurrency waits, then every SDK attempt timing out). An item the batch gave no verdict
+        for is moderated on its own here, on the caller's thread and time.
+        """
+        config = current_app.config
+        timeout = (batcher.max_wait + config.get('OPENROUTER_PRIORITY_MAX_WAIT', {}).get(PRIORITY_BACKGROUND, 10.0)
+                   + config.get('OPENROUTER_CONCURRENCY_MAX_WAIT', 5.0) + REQUEST_MAX_SECONDS)
+        future = batcher.submit(content_data)
+        try:
+            return future.result(timeout=timeout)
+        except NoBatchVerdict:
+            return self._ai_moderation_check(content_data)
+        except FutureTimeoutError:
+            # Still queued behind busy batches: withdraw it so no LLM call is spent on it
+            future.cancel()
+            # Unanswered is unchecked: let the caller retry rather than fall back to approval
+            raise ModelUnavailableError(f"Batched AI moderation gave no verdict within {timeout:.0f}s.")
+
+    def _ai_moderation_batch(self, contents: List[Dict], fallback: bool = True) -> List[Dict]:
+        """Moderates several items in one JSON-mode request, with a verdict per item.
+
+        An item whose verdict is missing or malformed, or every item if the request or its JSON
+        fails, is moderated on its own with _ai_moderation_check instead; without `fallback`, its
+        result is a NoBatchVerdict for the caller to handle.
+        """
+        if len(contents) == 1:
+            return [self._ai_moderation_check(contents[0])]
+
+        items = [{"id": str(i), "name": c.get('name'), "description": c.get('description')} for i, c in enumerate(contents)]
+        moderation_prompt = f"""
+        Analyze each of the following items for an educational platform for students.
+        {MODERATION_CRITERIA}
+        Judge every item on its own. Respond ONLY with a valid JSON object with one key, "results":
+        an array with one object per item, each with four keys:
+        1. "id": the item's id, unchanged.
+        2. "approved": a boolean (true or false).
+        3. "confidence": an integer between 0 and 100.
+        4. "reasons": an array of strings explaining the decision if not approved.
+
+        Items:
+        {json.dumps(items, ensure_ascii=False)}
+        """
+        messages = [
+            {"role": "system", "content": "You are a content moderator. Your only output must be a valid JSON object."},
+            {"role": "user", "content": moderation_prompt}
+        ]
+
+        verdicts = {}
+        try:
+            response = self.openai_service.query_model("deepseek", messages, is_json=True, priority=PRIORITY_BACKGROUND)
+            for verdict in response.get('results', []) if isinstance(response, dict) else []:
+                if isinstance(verdict, dict) and isinstance(verdict.get('approved'), bool):
+                    verdicts.setdefault(str(verdict.get('id')), verdict)
+        except ModelUnavailableError:
+            raise
+        except Exception as e:
+            logger.error(f"Batched AI moderation of {len(contents)} items failed, moderating them one by one: {e}")
+
+        results = []
+        for item, content_data in zip(items, contents):
+            verdict = verdicts.get(item["id"])
+            if verdict is None:
+                results.append(self._ai_moderation_check(content_data) if fallback else NoBatchVerdict(item["id"]))
+                continue
+            reasons = verdict.get('reasons')
+            results.append({
+                'approved': verdict['approved'],
+                'confidence': verdict.get('confidence', 0),
+                'reasons': reasons if isinstance(reasons, list) else [],
+                'level': 'ai',
+            })
+        missing = sum(1 for item in items if item["id"] not in verdicts)
+        if missing:
+            logger.warning(f"Batched AI moderation returned no usable verdict for {missing} of {len(contents)} items")
+        return results
+
     # MODIFIED: Removed async/await
     def _log_moderation_result(self, content_data: Dict, result: Dict, source: str):
-        """Logs moderation results to Firestore for auditing."""
+        """Queues the moderation result for the audit log; the sink writes it in the background, batched."""
         if not self.db: return
         try:
-            log_ref = self.db.collection('moderation_logs').document()
-            log_ref.set({
+            sink = get_audit_sink(current_app.config if has_app_context() else {}, self.db)
+            if sink is None:
+                return
+            sink.write({
                 'timestamp': datetime.now(),
                 'organization_name': content_data.get('name', 'N/A'),
                 'moderation_result': result,
@@ -117,4 +263,52 @@ class ModerationService:
                 'ownerId': content_data.get('ownerId')
             })
         except Exception as e:
-            logger.error(f"Failed to log moderation result: {e}")
\ No newline at end of file
+            logger.error(f"Failed to log moderation result: {e}")
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _batcher, _batcher_lock
+    _batcher = None
+    _batcher_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_moderation_batcher(config):
+    """Returns the process-wide moderation micro-batcher, or None unless MODERATION_BATCH_ENABLED is set.
+
+    Concurrent moderate_content calls in this process (web threads, threaded or gevent Celery
+    pools) share AI requests of up to MODERATION_BATCH_SIZE items, waiting at most
+    MODERATION_BATCH_MAX_WAIT_MS for a batch to fill. Also None in a prefork Celery pool child,
+    which runs one task at a time, so a batch would never hold more than one item.
+    """
+    global _batcher
+    if not config.get('MODERATION_BATCH_ENABLED', False) or _in_prefork_child():
+        return None
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                app = current_app._get_current_object()
+
+                def moderate_batch(contents):
+                    with app.app_context():
+                        return ModerationService(None, OpenAIService())._ai_moderation_batch(contents, fallback=False)
+
+                _batcher = MicroBatcher(
+                    moderate_batch,
+                    max_items=config.get('MODERATION_BATCH_SIZE', 8),
+                    max_wait=config.get('MODERATION_BATCH_MAX_WAIT_MS', 50) / 1000,
+                    max_in_flight=config.get('MODERATION_BATCH_MAX_IN_FLIGHT', 4),
+                    name='moderation-batch',
+                )
+    return _batcher
+
+
+def _in_prefork_child() -> bool:
+    # billiard names prefork pool processes 'ForkPoolWorker-N'
+    return 'PoolWorker' in current_process().name
@@ -0,0 +1,162 @@
+# --- app/services/openai_client_pool.py ---
+import asyncio
+import atexit
+import logging
+import os
+import threading
+import weakref
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from .telemetry import note_http_attempt, note_http_attempt_async
+
+logger = logging.getLogger(__name__)
+
+# Seconds a single HTTP attempt may take (the client retries up to MAX_RETRIES more times)
+REQUEST_TIMEOUT = 45.0
+MAX_RETRIES = 2
+# Longest one request can take through the SDK: every attempt times out, with the SDK's
+# longest backoff (8 s) between attempts
+REQUEST_MAX_SECONDS = (MAX_RETRIES + 1) * REQUEST_TIMEOUT + MAX_RETRIES * 8.0
+
+DEFAULT_HEADERS = {
+    "HTTP-Referer": "https://depanku.id",
+    "X-Title": "Depanku AI",
+}
+
+# One client (and so one HTTP connection pool) per distinct configuration, per process.
+_clients = {}
+# Async clients are bound to the event loop that opened their connections, so they are kept per loop
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+_owner_pid = os.getpid()
+
+
+def _reset_after_fork():
+    """Drops clients inherited from the parent process.
+
+    The pooled sockets belong to the parent, so the child must not reuse or close them;
+    it simply forgets them and builds its own pool on first use.
+    """
+    global _lock, _owner_pid
+    _clients.clear()
+    _async_clients.clear()
+    _lock = threading.Lock()
+    _owner_pid = os.getpid()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_openai_client(config) -> OpenAI:
+    """Returns the process-wide OpenRouter client for this configuration, creating it on first use."""
+    # Covers fork paths that bypass os.register_at_fork (e.g. the raw os.fork syscall in some servers)
+    if os.getpid() != _owner_pid:
+        _reset_after_fork()
+
+    api_key = config.get('OPENROUTER_API_KEY')
+    base_url = config.get('OPENROUTER_BASE_URL')
+    key = (api_key, base_url)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _build_client(config, api_key, base_url)
+            _clients[key] = client
+    return client
+
+
+def get_async_openai_client(config) -> AsyncOpenAI:
+    """Returns the OpenRouter client for the running event loop, creating it on first use.
+
+    Must be called from a coroutine. Serves the native async request path (see app/asgi.py).
+    """
+    if os.getpid() != _owner_pid:
+        _reset_after_fork()
+
+    api_key = config.get('OPENROUTER_API_KEY')
+    base_url = config.get('OPENROUTER_BASE_URL')
+    key = (api_key, base_url)
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = clients[key] = _build_async_client(config, api_key, base_url)
+    return client
+
+
+def _http_client_settings(config) -> dict:
+    http2 = config.get('OPENROUTER_HTTP2', False)
+    if http2 and not _http2_available():
+        logger.warning("OPENROUTER_HTTP2 is enabled but the 'h2' package is not installed; falling back to HTTP/1.1.")
+        http2 = False
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_connections=config.get('OPENROUTER_POOL_MAX_CONNECTIONS', 100),
+            max_keepalive_connections=config.get('OPENROUTER_POOL_MAX_KEEPALIVE', 20),
+            keepalive_expiry=config.get('OPENROUTER_POOL_KEEPALIVE_EXPIRY', 60.0),
+        ),
+        "timeout": REQUEST_TIMEOUT,
+        "follow_redirects": True,
+    }
+
+
+def _build_client(config, api_key: str, base_url: str) -> OpenAI:
+    settings = _http_client_settings(config)
+    http_client = httpx.Client(
+        **settings,
+        # Fires once per HTTP attempt, so SDK retries are counted on the current LLM call
+        event_hooks={'request': [note_http_attempt]},
+    )
+    logger.info(f"Created pooled OpenRouter client in process {os.getpid()} (http2={settings['http2']})")
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        default_headers=DEFAULT_HEADERS,
+        timeout=REQUEST_TIMEOUT,
+        max_retries=MAX_RETRIES,
+        http_client=http_client,
+    )
+
+
+def _build_async_client(config, api_key: str, base_url: str) -> AsyncOpenAI:
+    http_client = httpx.AsyncClient(**_http_client_settings(config), event_hooks={'request': [note_http_attempt_async]})
+    logger.info(f"Created async OpenRouter client in process {os.getpid()}")
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        default_headers=DEFAULT_HEADERS,
+        timeout=REQUEST_TIMEOUT,
+        max_retries=MAX_RETRIES,
+        http_client=http_client,
+    )
+
+
+def close_openai_clients():
+    """Closes every pooled client owned by this process."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            logger.warning(f"Failed to close pooled OpenRouter client: {e}")
+
+
+atexit.register(close_openai_clients)
@@ -1,9 +1,20 @@
 # --- app/services/openai_service.py ---
+import asyncio
+import itertools
 import logging
 import json
 import re
-from openai import OpenAI
+import sys
+import time
+from contextlib import ExitStack
 from flask import current_app
+from .openai_client_pool import get_async_openai_client, get_openai_client
+from .llm_cache import get_response_cache, make_cache_key
+from .model_router import first_token_key, get_model_router, note_request_start
+from .resilience import get_model_guard
+from .rate_limiter import get_rate_limiter, PRIORITY_ANALYSIS
+from .telemetry import llm_call, note_queue_wait
+from .json_stream import IncrementalJSONObject
 
 logger = logging.getLogger(__name__)
 
@@ -19,54 +30,137 @@ SYSTEM_PROMPTS = {
     "summarizer": "You are an expert at synthesizing conversations into concise goals."
 }
 
+class _OpenStream:
+    """A completion stream whose first content token has arrived, holding its guard slot until closed."""
+
+    def __init__(self, stack: ExitStack, chunks, first: list):
+        self._stack = stack
+        self._chunks = chunks
+        self._first = first
+        self._closed = False
+        self.usage = None
+
+    def tokens(self):
+        for chunk in itertools.chain(self._first, self._chunks):
+            if getattr(chunk, 'usage', None):
+                self.usage = chunk.usage
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                yield token
+
+    def close(self, exc_info=(None, None, None)):
+        """Closes the HTTP stream and releases the guard, recording a failure if `exc_info` holds one."""
+        if not self._closed:
+            self._closed = True
+            self._stack.__exit__(*exc_info)
+
+
 class OpenAIService:
-    """A wrapper for the OpenAI client, configured for OpenRouter."""
+    """A wrapper for the OpenAI client, configured for OpenRouter.
+
+    Cheap to construct: the underlying client comes from the process-wide pool.
+    """
     
     def __init__(self):
         self.api_key = current_app.config.get('OPENROUTER_API_KEY')
         if not self.api_key:
             raise ValueError("OPENROUTER_API_KEY is not configured.")
         
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=current_app.config.get('OPENROUTER_BASE_URL'),
-            default_headers={
-                "HTTP-Referer": "https://depanku.id",
-                "X-Title": "Depanku AI",
-            },
-            timeout=45.0,
-            max_retries=2,
-        )
+        # Shared per process so every service instance reuses the same keep-alive connection pool
+        self.client = get_openai_client(current_app.config)
         self.models = current_app.config.get('OPENROUTER_MODELS', {})
+        self.cache = get_response_cache(current_app.config)
+        # Free-text generations are sampled and shared across users, so they are only cached on request
+        self.cache_free_text = current_app.config.get('LLM_CACHE_FREE_TEXT', False)
+        self.router = get_model_router(current_app.config)
+        self.guard = get_model_guard(current_app.config)
+        self.rate_limiter = get_rate_limiter(current_app.config)
+        self.json_early_stop = current_app.config.get('LLM_JSON_EARLY_STOP', True)
 
-    def query_model(self, model_name: str, messages: list, temperature: float = 0.7, max_tokens: int = 2048, is_json=False):
-        """Queries a specific model. Designed to be run inside a Celery task."""
+    def query_model(self, model_name: str, messages: list, temperature: float = 0.7, max_tokens: int = 2048, is_json=False, timeout: float = None, bypass_cache: bool = False, priority: str = PRIORITY_ANALYSIS):
+        """Queries a specific model. Designed to be run inside a Celery task.
+
+        `timeout` overrides the client-wide timeout for this call only. Identical requests are
+        answered from the response cache unless `bypass_cache` is set. `priority` picks the
+        rate-limit class (interactive, analysis or background). Latency, queueing, retries and
+        token usage are recorded against the current telemetry span.
+        """
         model_id = self.models.get(model_name)
         if not model_id:
             raise ValueError(f"Model '{model_name}' not configured in OPENROUTER_MODELS.")
 
+        with llm_call(model_id) as call:
+            return self._query_model(model_id, messages, temperature, max_tokens, is_json, timeout, bypass_cache, priority, call)
+
+    def _query_model(self, model_id, messages, temperature, max_tokens, is_json, timeout, bypass_cache, priority, call):
+        cache_key = None
+        if self._cacheable(is_json, bypass_cache):
+            cache_key = make_cache_key(model_id, messages, temperature, max_tokens, is_json)
+            cached = self.cache.get(cache_key, model_id)
+            if cached is not None:
+                call.cache_hit = True
+                content = cached["content"]
+                return self._parse_json_from_response(content) if is_json else content
+
         try:
-            params = {
-                "model": model_id,
-                "messages": messages,
-                "temperature": temperature,
-                "max_tokens": max_tokens,
-            }
-            if is_json:
-                params["response_format"] = {"type": "json_object"}
-
-            completion = self.client.chat.completions.create(**params)
+            params = self._completion_params(model_id, messages, temperature, max_tokens, is_json, timeout)
+            started = time.monotonic()
+            # The router may answer from a hedged equivalent model when this one is slow
+            completion = self.router.call(model_id, lambda routed_model_id: self._create_completion(routed_model_id, params, priority))
             content = completion.choices[0].message.content
-            
-            if is_json:
-                return self._parse_json_from_response(content)
-            return content
+            usage = getattr(completion, 'usage', None)
+            call.set_usage(usage)
+
+            # Parse before caching so an unusable JSON body is never served again
+            result = self._parse_json_from_response(content) if is_json else content
+            if cache_key and content:
+                self.cache.set(cache_key, model_id, content, latency=time.monotonic() - started, tokens=getattr(usage, 'total_tokens', 0) or 0)
+            return result
 
         except Exception as e:
             logger.error(f"API call to model {model_id} failed: {e}")
             raise
 
-    def query_persona(self, persona: str, user_message: str) -> str:
+    async def query_model_async(self, model_name: str, messages: list, temperature: float = 0.7, max_tokens: int = 2048, is_json=False, timeout: float = None, bypass_cache: bool = False, priority: str = PRIORITY_ANALYSIS):
+        """Async counterpart of query_model, for the native async request path (see app/asgi.py).
+
+        Rate-limit and concurrency waits happen on the event loop, so one worker can keep hundreds
+        of calls in flight; cache lookups run in worker threads since they may reach Redis.
+        """
+        model_id = self.models.get(model_name)
+        if not model_id:
+            raise ValueError(f"Model '{model_name}' not configured in OPENROUTER_MODELS.")
+
+        with llm_call(model_id) as call:
+            cache_key = None
+            if self._cacheable(is_json, bypass_cache):
+                cache_key = make_cache_key(model_id, messages, temperature, max_tokens, is_json)
+                cached = await asyncio.to_thread(self.cache.get, cache_key, model_id)
+                if cached is not None:
+                    call.cache_hit = True
+                    content = cached["content"]
+                    return self._parse_json_from_response(content) if is_json else content
+
+            try:
+                params = self._completion_params(model_id, messages, temperature, max_tokens, is_json, timeout)
+                started = time.monotonic()
+                completion = await self.router.call_async(model_id, lambda routed_model_id: self._create_completion_async(routed_model_id, params, priority))
+                content = completion.choices[0].message.content
+                usage = getattr(completion, 'usage', None)
+                call.set_usage(usage)
+
+                result = self._parse_json_from_response(content) if is_json else content
+                if cache_key and content:
+                    await asyncio.to_thread(self.cache.set, cache_key, model_id, content, latency=time.monotonic() - started, tokens=getattr(usage, 'total_tokens', 0) or 0)
+                return result
+
+            except Exception as e:
+                logger.error(f"API call to model {model_id} failed: {e}")
+                raise
+
+    def query_persona(self, persona: str, user_message: str, timeout: float = None, bypass_cache: bool = False, priority: str = PRIORITY_ANALYSIS) -> str:
         """Queries a specific persona using its pre-defined system prompt."""
         system_prompt = SYSTEM_PROMPTS.get(persona)
         if not system_prompt:
@@ -76,7 +170,200 @@ class OpenAIService:
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_message}
         ]
-        return self.query_model(persona, messages)
+        return self.query_model(persona, messages, timeout=timeout, bypass_cache=bypass_cache, priority=priority)
+
+    def stream_model(self, model_name: str, messages: list, temperature: float = 0.7, max_tokens: int = 2048, timeout: float = None, priority: str = PRIORITY_ANALYSIS, is_json: bool = False, bypass_cache: bool = False):
+        """Queries a specific model with streaming enabled, yielding content tokens as they arrive.
+
+        Goes through the model router like query_model, hedging on time to first token, and shares
+        its response cache: a cached answer is yielded in one piece, and a stream read to the end
+        is cached whole.
+        """
+        model_id = self.models.get(model_name)
+        if not model_id:
+            raise ValueError(f"Model '{model_name}' not configured in OPENROUTER_MODELS.")
+
+        params = self._completion_params(model_id, messages, temperature, max_tokens, is_json, timeout)
+        params["stream"] = True
+        # Ask for a final usage chunk so streamed calls are accounted like the others
+        params["stream_options"] = {"include_usage": True}
+
+        with llm_call(model_id) as call:
+            cache_key = None
+            if self._cacheable(is_json, bypass_cache):
+                cache_key = make_cache_key(model_id, messages, temperature, max_tokens, is_json)
+                cached = self.cache.get(cache_key, model_id)
+                if cached is not None:
+                    call.cache_hit = True
+                    if cached["content"]:
+                        yield cached["content"]
+                    return
+
+            started = time.monotonic()
+            opened = self.router.call(model_id, lambda routed_model_id: self._open_stream(routed_model_id, params, priority),
+                                      first_token=True, discard=_OpenStream.close)
+            content = []
+            try:
+                for token in opened.tokens():
+                    content.append(token)
+                    yield token
+            except BaseException:
+                # Closing early (e.g. on a deadline) drops the HTTP connection and stops the generation
+                opened.close(sys.exc_info())
+                raise
+            opened.close()
+            call.set_usage(opened.usage)
+            if cache_key and content:
+                self.cache.set(cache_key, model_id, "".join(content), latency=time.monotonic() - started, tokens=getattr(opened.usage, 'total_tokens', 0) or 0)
+
+    def query_json_fields(self, model_name: str, messages: list, stop_when, temperature: float = 0.7, max_tokens: int = 2048, timeout: float = None, bypass_cache: bool = False, priority: str = PRIORITY_ANALYSIS) -> dict:
+        """JSON-mode query that can stop as soon as the fields received so far settle the answer.
+
+        Streams the completion and parses top-level fields as they complete; once
+        `stop_when(fields)` is true the stream is closed, which cancels the rest of the generation,
+        and the fields received so far are returned. Complete responses are cached like
+        query_model's; early-stopped fields are cached under a separate partial key and only served
+        to a caller whose `stop_when` accepts them. With LLM_JSON_EARLY_STOP off this is a plain
+        query_model(is_json=True).
+        """
+        if not self.json_early_stop:
+            return self.query_model(model_name, messages, temperature=temperature, max_tokens=max_tokens, is_json=True, timeout=timeout, bypass_cache=bypass_cache, priority=priority)
+
+        model_id = self.models.get(model_name)
+        if not model_id:
+            raise ValueError(f"Model '{model_name}' not configured in OPENROUTER_MODELS.")
+
+        cache_key = partial_key = None
+        if self._cacheable(True, bypass_cache):
+            cache_key = make_cache_key(model_id, messages, temperature, max_tokens, True)
+            partial_key = f"{cache_key}:partial"
+            cached = self.cache.get(cache_key, model_id)
+            fields = None
+            if cached is not None:
+                fields = self._parse_json_from_response(cached["content"])
+            else:
+                cached = self.cache.get(partial_key, model_id)
+                if cached is not None and stop_when(json.loads(cached["content"])):
+                    fields = json.loads(cached["content"])
+            if fields is not None:
+                with llm_call(model_id) as call:
+                    call.cache_hit = True
+                return fields
+
+        parser = IncrementalJSONObject()
+        content = []
+        started = time.monotonic()
+        stream = self.stream_model(model_name, messages, temperature=temperature, max_tokens=max_tokens, timeout=timeout, priority=priority, is_json=True, bypass_cache=True)
+        try:
+            for token in stream:
+                content.append(token)
+                if parser.feed(token) and stop_when(parser.fields):
+                    logger.debug(f"Stopped JSON stream from {model_id} early after fields {list(parser.fields)}")
+                    if partial_key:
+                        self.cache.set(partial_key, model_id, json.dumps(parser.fields, ensure_ascii=False), latency=time.monotonic() - started)
+                    return dict(parser.fields)
+        finally:
+            stream.close()
+
+        text = "".join(content)
+        # A body the incremental parser could not follow still gets the lenient full parse
+        result = dict(parser.fields) if parser.done else self._parse_json_from_response(text)
+        if cache_key and parser.done:
+            self.cache.set(cache_key, model_id, text, latency=time.monotonic() - started)
+        return result
+
+    def stream_persona(self, persona: str, user_message: str, timeout: float = None, priority: str = PRIORITY_ANALYSIS):
+        """Streaming counterpart of query_persona."""
+        system_prompt = SYSTEM_PROMPTS.get(persona)
+        if not system_prompt:
+            raise ValueError(f"Persona '{persona}' is not configured.")
+
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+        return self.stream_model(persona, messages, timeout=timeout, priority=priority)
+
+    def _create_completion(self, model_id: str, params: dict, priority: str = PRIORITY_ANALYSIS):
+        """A single rate-limited, guarded call.
+
+        Fails fast with ModelUnavailableError when the model's circuit is open or the cluster-wide
+        rate limit cannot be met within the priority's maximum wait.
+        """
+        queued = time.monotonic()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(model_id, priority)
+        with self.guard.guard(model_id):
+            note_queue_wait(time.monotonic() - queued)
+            note_request_start()
+            return self.client.chat.completions.create(**{**params, "model": model_id})
+
+    def _open_stream(self, model_id: str, params: dict, priority: str = PRIORITY_ANALYSIS):
+        """Streaming counterpart of _create_completion: returns once the first token has arrived.
+
+        The guard covers the whole stream, so the concurrency slot is held until it is closed.
+        """
+        stack = ExitStack()
+        try:
+            queued = time.monotonic()
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(model_id, priority)
+            stack.enter_context(self.guard.guard(model_id))
+            note_queue_wait(time.monotonic() - queued)
+            note_request_start()
+            stream = self.client.chat.completions.create(**{**params, "model": model_id})
+            stack.callback(stream.close)
+            chunks = iter(stream)
+            first = []
+            for chunk in chunks:
+                first.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+            return _OpenStream(stack, chunks, first)
+        except BaseException as e:
+            if isinstance(e, Exception):
+                logger.error(f"Streaming API call to model {model_id} failed: {e}")
+            stack.__exit__(*sys.exc_info())
+            raise
+
+    async def _create_completion_async(self, model_id: str, params: dict, priority: str = PRIORITY_ANALYSIS):
+        """Async counterpart of _create_completion, on the event loop's own client."""
+        queued = time.monotonic()
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(model_id, priority)
+        async with self.guard.guard_async(model_id):
+            note_queue_wait(time.monotonic() - queued)
+            note_request_start()
+            client = get_async_openai_client(current_app.config)
+            return await client.chat.completions.create(**{**params, "model": model_id})
+
+    def _cacheable(self, is_json: bool, bypass_cache: bool) -> bool:
+        """JSON-mode calls (moderation verdicts, consensus checks) are cached; free text only with LLM_CACHE_FREE_TEXT."""
+        return self.cache is not None and not bypass_cache and (is_json or self.cache_free_text)
+
+    def _completion_params(self, model_id: str, messages: list, temperature: float, max_tokens: int, is_json: bool, timeout: float) -> dict:
+        params = {
+            "model": model_id,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        if is_json:
+            params["response_format"] = {"type": "json_object"}
+        if timeout is not None:
+            params["timeout"] = timeout
+        return params
+
+    def model_status(self) -> dict:
+        """Breaker state, concurrency limit and rolling latency for every configured model."""
+        model_ids = sorted(set(self.models.values()) | set(self.router.hedge_models.values()))
+        latency = self.router.tracker
+        status = self.guard.status(model_ids)
+        for model_id in model_ids:
+            status[model_id]["latency"] = latency.stats(model_id)
+            status[model_id]["firstTokenLatency"] = latency.stats(first_token_key(model_id))
+        shed = dict(self.rate_limiter.shed) if self.rate_limiter is not None else {}
+        return {"models": status, "hedgesSent": self.router.hedges_sent, "hedgesWon": self.router.hedges_won, "rateLimitShed": shed}
 
     def _parse_json_from_response(self, response_text: str) -> dict:
         """Robustly extracts a JSON object from a string."""
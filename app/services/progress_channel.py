@@ -0,0 +1,279 @@
+# --- app/services/progress_channel.py ---
+import asyncio
+import json
+import logging
+import queue
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Terminal event types; subscribers stop listening once they see one of these.
+TERMINAL_EVENTS = ('done', 'failed')
+SNAPSHOT_TTL_SECONDS = 60 * 60
+# Server-sent event streams send a comment this often when idle and close after the maximum
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MAX_STREAM_SECONDS = 15 * 60
+
+
+class LocalProgressBroker:
+    """In-process stand-in for the Redis broker. Only reaches subscribers in the same process,
+    so it is meant for development, eager Celery and tests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._snapshots = {}
+
+    def publish(self, session_id: str, event: dict):
+        with self._lock:
+            _apply_to_snapshot(self._snapshots.setdefault(session_id, {}), event)
+            subscribers = list(self._subscribers.get(session_id, []))
+        for q in subscribers:
+            q.put(event)
+
+    def snapshot(self, session_id: str) -> dict:
+        with self._lock:
+            return json.loads(json.dumps(self._snapshots.get(session_id, {})))
+
+    def subscribe(self, session_id: str):
+        q = queue.Queue()
+        with self._lock:
+            self._subscribers.setdefault(session_id, []).append(q)
+
+        def close():
+            with self._lock:
+                self._subscribers.get(session_id, []).remove(q)
+        return _LocalSubscription(q, close)
+
+    async def snapshot_async(self, session_id: str) -> dict:
+        return self.snapshot(session_id)
+
+    async def subscribe_async(self, session_id: str):
+        """Like subscribe(), but delivers events on the calling event loop."""
+        subscription = _AsyncLocalSubscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(session_id, []).append(subscription)
+
+        def close():
+            with self._lock:
+                self._subscribers.get(session_id, []).remove(subscription)
+        subscription.close_callback = close
+        return subscription
+
+
+class _LocalSubscription:
+    def __init__(self, q, close):
+        self._queue = q
+        self.close = close
+
+    def get(self, timeout: float):
+        """Returns the next event, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _AsyncLocalSubscription:
+    """Subscriber queue fed from publisher threads; put() has the queue.Queue shape publish() expects."""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self.close_callback = None
+
+    def put(self, event: dict):
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+        except RuntimeError:
+            # The subscriber's loop has shut down; it will not read any more events
+            pass
+
+    async def get(self, timeout: float):
+        """Returns the next event, or None if nothing arrived within `timeout` seconds."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.close_callback()
+
+
+class RedisProgressBroker:
+    """Publishes progress events over Redis pub/sub so web workers can relay what Celery workers produce."""
+
+    def __init__(self, redis_url: str):
+        import redis
+        self.redis = redis.Redis.from_url(redis_url)
+        self._redis_url = redis_url
+        # redis.asyncio connections belong to the event loop that opened them
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _async_redis(self):
+        import redis.asyncio
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = redis.asyncio.Redis.from_url(self._redis_url)
+        return client
+
+    @staticmethod
+    def _channel(session_id: str) -> str:
+        return f"ai_progress:{session_id}"
+
+    @staticmethod
+    def _snapshot_key(session_id: str) -> str:
+        return f"ai_progress:{session_id}:snapshot"
+
+    def publish(self, session_id: str, event: dict):
+        key = self._snapshot_key(session_id)
+        if event['type'] == 'delta':
+            field = f"{event['stage']}:{event['persona']}"
+            self.redis.eval(_APPEND_AT_OFFSET_LUA, 1, key, field, event['offset'], event['text'], len(event['text']))
+        pipe = self.redis.pipeline()
+        if event['type'] in ('stage', *TERMINAL_EVENTS):
+            pipe.hset(key, 'status', event.get('status', event['type']))
+        pipe.expire(key, SNAPSHOT_TTL_SECONDS)
+        pipe.publish(self._channel(session_id), json.dumps(event))
+        pipe.execute()
+
+    def snapshot(self, session_id: str) -> dict:
+        return _parse_snapshot(self.redis.hgetall(self._snapshot_key(session_id)))
+
+    def subscribe(self, session_id: str):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self._channel(session_id))
+        return _RedisSubscription(pubsub)
+
+    async def snapshot_async(self, session_id: str) -> dict:
+        return _parse_snapshot(await self._async_redis().hgetall(self._snapshot_key(session_id)))
+
+    async def subscribe_async(self, session_id: str):
+        """Like subscribe(), over redis.asyncio, so waiting for events never holds a thread."""
+        pubsub = self._async_redis().pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self._channel(session_id))
+        return _AsyncRedisSubscription(pubsub)
+
+
+class _RedisSubscription:
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    def get(self, timeout: float):
+        """Returns the next event, or None if nothing arrived within `timeout` seconds."""
+        message = self._pubsub.get_message(timeout=timeout)
+        return json.loads(message['data']) if message else None
+
+    def close(self):
+        self._pubsub.close()
+
+
+class _AsyncRedisSubscription:
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    async def get(self, timeout: float):
+        """Returns the next event, or None if nothing arrived within `timeout` seconds."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            # Subscribe confirmations come back as None straight away, so wait out the rest
+            message = await self._pubsub.get_message(timeout=max(0.0, deadline - loop.time()))
+            if message:
+                return json.loads(message['data'])
+            if loop.time() >= deadline:
+                return None
+
+    async def close(self):
+        await self._pubsub.aclose()
+
+
+# Appends text to a partial output only when it is exactly `offset` characters long, so duplicate
+# or out-of-order deltas never corrupt the snapshot. Lengths are tracked in characters in a
+# sibling field because Lua's string.len counts bytes.
+_APPEND_AT_OFFSET_LUA = """
+local length = tonumber(redis.call('HGET', KEYS[1], 'len:' .. ARGV[1]) or '0')
+if length == tonumber(ARGV[2]) then
+    redis.call('HSET', KEYS[1], 'text:' .. ARGV[1], (redis.call('HGET', KEYS[1], 'text:' .. ARGV[1]) or '') .. ARGV[3])
+    redis.call('HSET', KEYS[1], 'len:' .. ARGV[1], length + tonumber(ARGV[4]))
+end
+return 1
+"""
+
+
+def _parse_snapshot(raw: dict) -> dict:
+    snapshot = {}
+    for field, value in raw.items():
+        field, value = field.decode(), value.decode()
+        if field.startswith('text:'):
+            _, stage, persona = field.split(':', 2)
+            snapshot.setdefault('partials', {}).setdefault(stage, {})[persona] = value
+        elif field == 'status':
+            snapshot['status'] = value
+    return snapshot
+
+
+def sse_event(event_type: str, data: dict) -> str:
+    """Formats one server-sent event."""
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+def _apply_to_snapshot(snapshot: dict, event: dict):
+    if event['type'] == 'delta':
+        partials = snapshot.setdefault('partials', {}).setdefault(event['stage'], {})
+        current = partials.get(event['persona'], '')
+        if len(current) == event['offset']:
+            partials[event['persona']] = current + event['text']
+    elif event['type'] in ('stage', *TERMINAL_EVENTS):
+        snapshot['status'] = event.get('status', event['type'])
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_progress_broker(config):
+    """Returns the process-wide progress broker selected by AI_PROGRESS_BACKEND, or None when disabled."""
+    global _broker
+    backend = config.get('AI_PROGRESS_BACKEND', 'redis')
+    if backend == 'none':
+        return None
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                if backend == 'local':
+                    _broker = LocalProgressBroker()
+                else:
+                    _broker = RedisProgressBroker(config.get('AI_PROGRESS_REDIS_URL'))
+    return _broker
+
+
+class ProgressChannel:
+    """Per-session progress publisher. Publishing is best-effort and never raises into the pipeline."""
+
+    def __init__(self, broker, session_id: str):
+        self.broker = broker
+        self.session_id = session_id
+
+    def stage(self, status: str):
+        self._publish({'type': 'stage', 'status': status})
+
+    def delta(self, stage: str, persona: str, offset: int, text: str):
+        self._publish({'type': 'delta', 'stage': stage, 'persona': persona, 'offset': offset, 'text': text})
+
+    def persona_done(self, stage: str, persona: str, ok: bool):
+        self._publish({'type': 'persona_done', 'stage': stage, 'persona': persona, 'ok': ok})
+
+    def done(self):
+        self._publish({'type': 'done', 'status': 'completed'})
+
+    def failed(self):
+        self._publish({'type': 'failed', 'status': 'failed'})
+
+    def _publish(self, event: dict):
+        try:
+            self.broker.publish(self.session_id, event)
+        except Exception as e:
+            logger.warning(f"Failed to publish progress for session {self.session_id}: {e}")
@@ -0,0 +1,191 @@
+# --- app/services/rate_limiter.py ---
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from .resilience import ModelUnavailableError
+
+logger = logging.getLogger(__name__)
+
+BUCKET_KEY_PREFIX = "llm_rate:"
+GLOBAL_BUCKET = "global"
+
+# Priority classes, most important first. A class may only take a token while the bucket keeps
+# at least its reserve (a fraction of capacity), so lower classes run dry before higher ones do.
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_ANALYSIS = 'analysis'
+PRIORITY_BACKGROUND = 'background'
+
+
+class RateLimitExceeded(ModelUnavailableError):
+    """Raised when a call could not get a token within its priority's maximum wait (load shedding)."""
+
+
+class LocalTokenBuckets:
+    """In-process token buckets with the same semantics as the Redis script; the stand-in for tests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # name -> [tokens, updated_at]
+
+    def try_acquire(self, buckets: list, now: float) -> float:
+        """Takes one token from every bucket or none. Returns 0 on success, else seconds to wait."""
+        with self._lock:
+            levels = []
+            for name, capacity, rate, reserve in buckets:
+                tokens, updated_at = self._buckets.get(name, (capacity, now))
+                levels.append(min(capacity, tokens + (now - updated_at) * rate))
+            wait = max(_wait_for(level, rate, reserve) for level, (_, _, rate, reserve) in zip(levels, buckets))
+            if wait > 0:
+                return wait
+            for level, (name, *_rest) in zip(levels, buckets):
+                self._buckets[name] = (level - 1, now)
+            return 0.0
+
+
+def _wait_for(level: float, rate: float, reserve: float) -> float:
+    missing = 1 + reserve - level
+    if missing <= 0:
+        return 0.0
+    return missing / rate if rate > 0 else float('inf')
+
+
+_ACQUIRE_LUA = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local rate = tonumber(ARGV[i * 3])
+    local reserve = tonumber(ARGV[i * 3 + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'updated_at')
+    local tokens = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    local level = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+    levels[i] = level
+    local missing = 1 + reserve - level
+    if missing > 0 then
+        wait = math.max(wait, missing / rate)
+    end
+end
+if wait > 0 then return tostring(wait) end
+for i, key in ipairs(KEYS) do
+    redis.call('HSET', key, 'tokens', levels[i] - 1, 'updated_at', now)
+    redis.call('EXPIRE', key, 3600)
+end
+return '0'
+"""
+
+
+class RedisTokenBuckets:
+    """Token buckets shared by every gunicorn and Celery worker; each acquire is one atomic script."""
+
+    def __init__(self, redis_url: str):
+        import redis
+        self.redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._acquire = self.redis.register_script(_ACQUIRE_LUA)
+
+    def try_acquire(self, buckets: list, now: float) -> float:
+        args = [now]
+        for _, capacity, rate, reserve in buckets:
+            args.extend([capacity, rate, reserve])
+        return float(self._acquire(keys=[BUCKET_KEY_PREFIX + name for name, *_ in buckets], args=args))
+
+
+class RateLimiter:
+    """Global plus per-model token buckets with priority reserves and a bounded wait per priority."""
+
+    def __init__(self, store, global_rate: float, global_burst: float, model_limits: dict = None,
+                 reserves: dict = None, max_waits: dict = None):
+        self.store = store
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.model_limits = model_limits or {}
+        self.reserves = reserves or {}
+        self.max_waits = max_waits or {}
+        self._lock = threading.Lock()
+        self.shed = {}
+
+    def acquire(self, model_id: str, priority: str = PRIORITY_ANALYSIS):
+        """Blocks until a token is available for `model_id`, or raises RateLimitExceeded."""
+        buckets = self._buckets(model_id, priority)
+        deadline = time.monotonic() + self.max_waits.get(priority, 10.0)
+        while True:
+            try:
+                wait = self.store.try_acquire(buckets, time.time())
+            except Exception as e:
+                # A limiter outage must not stop LLM traffic: let the call through
+                logger.warning(f"Rate limiter store unavailable: {e}")
+                return
+            if wait <= 0:
+                return
+            self._check_wait(model_id, priority, wait, deadline)
+            time.sleep(wait)
+
+    async def acquire_async(self, model_id: str, priority: str = PRIORITY_ANALYSIS):
+        """Async counterpart of acquire: sleeps on the event loop while throttled."""
+        buckets = self._buckets(model_id, priority)
+        deadline = time.monotonic() + self.max_waits.get(priority, 10.0)
+        while True:
+            try:
+                wait = await asyncio.to_thread(self.store.try_acquire, buckets, time.time())
+            except Exception as e:
+                logger.warning(f"Rate limiter store unavailable: {e}")
+                return
+            if wait <= 0:
+                return
+            self._check_wait(model_id, priority, wait, deadline)
+            await asyncio.sleep(wait)
+
+    def _buckets(self, model_id: str, priority: str) -> list:
+        buckets = [self._bucket(GLOBAL_BUCKET, self.global_burst, self.global_rate, priority)]
+        if model_id in self.model_limits:
+            rate, burst = self.model_limits[model_id]
+            buckets.append(self._bucket(f"model:{model_id}", burst, rate, priority))
+        return buckets
+
+    def _check_wait(self, model_id: str, priority: str, wait: float, deadline: float):
+        if wait > deadline - time.monotonic():
+            with self._lock:
+                self.shed[priority] = self.shed.get(priority, 0) + 1
+            raise RateLimitExceeded(f"Rate limit for {model_id} ({priority}) would need a {wait:.1f}s wait; shedding load.")
+
+    def _bucket(self, name: str, capacity: float, rate: float, priority: str) -> tuple:
+        return (name, capacity, rate, self.reserves.get(priority, 0.0) * capacity)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _limiter, _limiter_lock
+    _limiter = None
+    _limiter_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_rate_limiter(config):
+    """Returns the process-wide rate limiter, or None when OPENROUTER_RATE_LIMIT_BACKEND is 'none'."""
+    global _limiter
+    backend = config.get('OPENROUTER_RATE_LIMIT_BACKEND', 'redis')
+    if backend == 'none':
+        return None
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                store = LocalTokenBuckets() if backend == 'local' else RedisTokenBuckets(config.get('OPENROUTER_RATE_LIMIT_REDIS_URL'))
+                _limiter = RateLimiter(
+                    store,
+                    global_rate=config.get('OPENROUTER_GLOBAL_RATE', 10.0),
+                    global_burst=config.get('OPENROUTER_GLOBAL_BURST', 20.0),
+                    model_limits=config.get('OPENROUTER_MODEL_RATES'),
+                    reserves=config.get('OPENROUTER_PRIORITY_RESERVES'),
+                    max_waits=config.get('OPENROUTER_PRIORITY_MAX_WAIT'),
+                )
+    return _limiter
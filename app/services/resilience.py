@@ -0,0 +1,349 @@
+# --- app/services/resilience.py ---
+import asyncio
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+BREAKER_KEY_PREFIX = "llm_breaker:"
+# What a breaker store's acquire() returns: refused, let through while closed, or let through as the half-open probe
+BREAKER_REJECT, BREAKER_PASS, BREAKER_PROBE = 0, 1, 2
+# How often a coroutine waiting for a concurrency slot re-checks the limiter
+ASYNC_SLOT_POLL_INTERVAL = 0.02
+
+
+class ModelUnavailableError(Exception):
+    """Raised instead of calling a model that is known to be unhealthy or saturated."""
+
+
+class CircuitOpenError(ModelUnavailableError):
+    pass
+
+
+class ConcurrencyLimitError(ModelUnavailableError):
+    pass
+
+
+def is_model_failure(exc: BaseException) -> bool:
+    """Whether an error says the model is unhealthy, as opposed to something wrong with the request.
+
+    A 4xx other than 429 (bad prompt, context too long, auth) would fail the same way on any
+    healthy model, so it must not open the breaker or shrink the concurrency limit for everyone.
+    """
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return True
+
+
+# --- Circuit breaker state stores ---
+# Both stores implement the same transitions:
+#   closed    --(failure_threshold consecutive failures)--> open
+#   open      --(reset_timeout elapsed, one probe let through)--> half_open
+#   half_open --(probe succeeds)--> closed ; --(probe fails)--> open
+# A success never closes an open breaker: it is a call that started before the breaker opened.
+# A probe that never reached the model (no concurrency slot) is released for the next caller.
+
+
+class LocalBreakerStore:
+    """In-process breaker state; the stand-in for Redis in development and tests."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def _get(self, model_id: str) -> dict:
+        return self._states.setdefault(model_id, {"state": "closed", "failures": 0, "opened_at": 0.0, "probe_until": 0.0})
+
+    def acquire(self, model_id: str, now: float, reset_timeout: float, probe_timeout: float) -> int:
+        with self._lock:
+            s = self._get(model_id)
+            if s["state"] == "closed":
+                return BREAKER_PASS
+            if s["state"] == "open" and now - s["opened_at"] < reset_timeout:
+                return BREAKER_REJECT
+            if now < s["probe_until"]:
+                return BREAKER_REJECT  # another probe is already in flight
+            s["state"], s["probe_until"] = "half_open", now + probe_timeout
+            return BREAKER_PROBE
+
+    def success(self, model_id: str):
+        with self._lock:
+            s = self._get(model_id)
+            if s["state"] != "open":
+                s.update(state="closed", failures=0, probe_until=0.0)
+
+    def release_probe(self, model_id: str):
+        with self._lock:
+            s = self._get(model_id)
+            if s["state"] == "half_open":
+                s["probe_until"] = 0.0
+
+    def failure(self, model_id: str, now: float, failure_threshold: int):
+        with self._lock:
+            s = self._get(model_id)
+            s["failures"] += 1
+            if s["state"] == "half_open" or s["failures"] >= failure_threshold:
+                s.update(state="open", opened_at=now, probe_until=0.0)
+
+    def state(self, model_id: str) -> dict:
+        with self._lock:
+            return dict(self._get(model_id))
+
+
+_ACQUIRE_LUA = """
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'closed' then return 1 end
+local now = tonumber(ARGV[1])
+local opened_at = tonumber(redis.call('HGET', KEYS[1], 'opened_at') or '0')
+if state == 'open' and now - opened_at < tonumber(ARGV[2]) then return 0 end
+local probe_until = tonumber(redis.call('HGET', KEYS[1], 'probe_until') or '0')
+if now < probe_until then return 0 end
+redis.call('HSET', KEYS[1], 'state', 'half_open', 'probe_until', now + tonumber(ARGV[3]))
+return 2
+"""
+
+_SUCCESS_LUA = """
+if redis.call('HGET', KEYS[1], 'state') == 'open' then return 0 end
+redis.call('HSET', KEYS[1], 'state', 'closed', 'failures', 0, 'probe_until', 0)
+return 1
+"""
+
+_RELEASE_PROBE_LUA = """
+if redis.call('HGET', KEYS[1], 'state') ~= 'half_open' then return 0 end
+redis.call('HSET', KEYS[1], 'probe_until', 0)
+return 1
+"""
+
+_FAILURE_LUA = """
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+if state == 'half_open' or failures >= tonumber(ARGV[2]) then
+    redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', ARGV[1], 'probe_until', 0)
+end
+return failures
+"""
+
+
+class RedisBreakerStore:
+    """Breaker state shared by every web and Celery worker through Redis hashes."""
+
+    def __init__(self, redis_url: str):
+        import redis
+        self.redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._acquire = self.redis.register_script(_ACQUIRE_LUA)
+        self._failure = self.redis.register_script(_FAILURE_LUA)
+        self._success = self.redis.register_script(_SUCCESS_LUA)
+        self._release_probe = self.redis.register_script(_RELEASE_PROBE_LUA)
+
+    def acquire(self, model_id: str, now: float, reset_timeout: float, probe_timeout: float) -> int:
+        return int(self._acquire(keys=[BREAKER_KEY_PREFIX + model_id], args=[now, reset_timeout, probe_timeout]))
+
+    def success(self, model_id: str):
+        self._success(keys=[BREAKER_KEY_PREFIX + model_id])
+
+    def release_probe(self, model_id: str):
+        self._release_probe(keys=[BREAKER_KEY_PREFIX + model_id])
+
+    def failure(self, model_id: str, now: float, failure_threshold: int):
+        self._failure(keys=[BREAKER_KEY_PREFIX + model_id], args=[now, failure_threshold])
+
+    def state(self, model_id: str) -> dict:
+        raw = self.redis.hgetall(BREAKER_KEY_PREFIX + model_id)
+        state = {k.decode(): v.decode() for k, v in raw.items()}
+        return {
+            "state": state.get("state", "closed"),
+            "failures": int(state.get("failures", 0)),
+            "opened_at": float(state.get("opened_at", 0)),
+            "probe_until": float(state.get("probe_until", 0)),
+        }
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit for one model in this process.
+
+    Each success raises the limit by 1/limit (about +1 per limit's worth of calls); each failure
+    multiplies it by `backoff`. Callers wait at most `max_wait` seconds for a slot.
+    """
+
+    def __init__(self, initial: float = 8, minimum: float = 1, maximum: float = 64, backoff: float = 0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, max_wait: float) -> bool:
+        deadline = time.monotonic() + max_wait
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def try_acquire(self) -> bool:
+        """Takes a slot only if one is free right now; never blocks (used from the event loop)."""
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, ok: bool):
+        with self._cond:
+            self.in_flight -= 1
+            if ok:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            else:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+            self._cond.notify_all()
+
+
+class ModelGuard:
+    """Per-model circuit breaker plus adaptive concurrency limit around every OpenRouter call."""
+
+    def __init__(self, store, failure_threshold: int = 5, reset_timeout: float = 30.0, probe_timeout: float = 60.0,
+                 limiter_initial: int = 8, limiter_min: int = 1, limiter_max: int = 64, max_wait: float = 5.0):
+        self.store = store
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.limiter_settings = dict(initial=limiter_initial, minimum=limiter_min, maximum=limiter_max)
+        self.max_wait = max_wait
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, model_id: str) -> AdaptiveLimiter:
+        with self._lock:
+            limiter = self._limiters.get(model_id)
+            if limiter is None:
+                limiter = self._limiters[model_id] = AdaptiveLimiter(**self.limiter_settings)
+            return limiter
+
+    @contextmanager
+    def guard(self, model_id: str):
+        """Wraps one call to `model_id`; raises ModelUnavailableError instead of calling a sick model."""
+        admitted = self._store_call(self.store.acquire, model_id, time.time(), self.reset_timeout, self.probe_timeout, default=BREAKER_PASS)
+        if not admitted:
+            raise CircuitOpenError(f"Circuit for model {model_id} is open; failing fast.")
+
+        limiter = self.limiter(model_id)
+        if not limiter.acquire(self.max_wait):
+            if admitted == BREAKER_PROBE:
+                self._store_call(self.store.release_probe, model_id)
+            raise ConcurrencyLimitError(f"Model {model_id} is at its concurrency limit ({int(limiter.limit)}).")
+
+        ok = False
+        try:
+            yield
+            ok = True
+        except GeneratorExit:
+            ok = True  # the caller stopped reading a stream early; not the model's fault
+            raise
+        except Exception as e:
+            ok = not is_model_failure(e)
+            raise
+        finally:
+            limiter.release(ok)
+            if ok:
+                self._store_call(self.store.success, model_id)
+            else:
+                self._store_call(self.store.failure, model_id, time.time(), self.failure_threshold)
+
+    @asynccontextmanager
+    async def guard_async(self, model_id: str):
+        """Async counterpart of guard: waits for a slot on the event loop instead of holding a thread."""
+        # Store calls may reach Redis, so they run off the loop
+        admitted = await asyncio.to_thread(self._store_call, self.store.acquire, model_id, time.time(), self.reset_timeout, self.probe_timeout, default=BREAKER_PASS)
+        if not admitted:
+            raise CircuitOpenError(f"Circuit for model {model_id} is open; failing fast.")
+
+        limiter = self.limiter(model_id)
+        deadline = time.monotonic() + self.max_wait
+        while not limiter.try_acquire():
+            if time.monotonic() >= deadline:
+                if admitted == BREAKER_PROBE:
+                    await asyncio.to_thread(self._store_call, self.store.release_probe, model_id)
+                raise ConcurrencyLimitError(f"Model {model_id} is at its concurrency limit ({int(limiter.limit)}).")
+            await asyncio.sleep(ASYNC_SLOT_POLL_INTERVAL)
+
+        ok = False
+        try:
+            yield
+            ok = True
+        except asyncio.CancelledError:
+            ok = True  # the client went away; not the model's fault
+            raise
+        except Exception as e:
+            ok = not is_model_failure(e)
+            raise
+        finally:
+            limiter.release(ok)
+            if ok:
+                await asyncio.to_thread(self._store_call, self.store.success, model_id)
+            else:
+                await asyncio.to_thread(self._store_call, self.store.failure, model_id, time.time(), self.failure_threshold)
+
+    def status(self, model_ids) -> dict:
+        status = {}
+        for model_id in model_ids:
+            limiter = self.limiter(model_id)
+            status[model_id] = {
+                "breaker": self._store_call(self.store.state, model_id, default=None),
+                "concurrencyLimit": round(limiter.limit, 2),
+                "inFlight": limiter.in_flight,
+            }
+        return status
+
+    @staticmethod
+    def _store_call(fn, *args, default=None):
+        # A breaker store outage must never take the LLM path down with it: fail open
+        try:
+            return fn(*args)
+        except Exception as e:
+            logger.warning(f"Circuit breaker store unavailable: {e}")
+            return default
+
+
+_guard = None
+_guard_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _guard, _guard_lock
+    _guard = None
+    _guard_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_model_guard(config) -> ModelGuard:
+    """Returns the process-wide model guard, with breaker state in Redis or in process."""
+    global _guard
+    if _guard is None:
+        with _guard_lock:
+            if _guard is None:
+                if config.get('OPENROUTER_BREAKER_BACKEND', 'redis') == 'local':
+                    store = LocalBreakerStore()
+                else:
+                    store = RedisBreakerStore(config.get('OPENROUTER_BREAKER_REDIS_URL'))
+                _guard = ModelGuard(
+                    store,
+                    failure_threshold=config.get('OPENROUTER_BREAKER_FAILURE_THRESHOLD', 5),
+                    reset_timeout=config.get('OPENROUTER_BREAKER_RESET_TIMEOUT', 30.0),
+                    limiter_initial=config.get('OPENROUTER_CONCURRENCY_INITIAL', 8),
+                    limiter_min=config.get('OPENROUTER_CONCURRENCY_MIN', 1),
+                    limiter_max=config.get('OPENROUTER_CONCURRENCY_MAX', 64),
+                    max_wait=config.get('OPENROUTER_CONCURRENCY_MAX_WAIT', 5.0),
+                )
+    return _guard
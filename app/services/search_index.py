@@ -0,0 +1,680 @@
+# --- app/services/search_index.py ---
+import bisect
+import gzip
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from itertools import islice
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from .keyword_filter import normalize
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process per index directory
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Matches in the name count three times as much as in the description, and so on
+FIELD_WEIGHTS = {'name': 3.0, 'tags': 2.0, 'category': 2.0, 'description': 1.0}
+STORED_FIELDS = ('name', 'description', 'tags', 'category', 'logo', 'location')
+BM25_K1 = 1.2
+BM25_B = 0.75
+# The last query word also matches the words it begins ("robo" finds "robotics"), weighted lower
+PREFIX_WEIGHT = 0.7
+PREFIX_MIN_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 50
+# Completions are taken most common first until they cover this many postings, so a two-letter
+# prefix costs about as much as one common word
+PREFIX_POSTINGS_BUDGET = 10000
+# Terms with at least this many postings keep them sorted by weight, and their facet counts, between changes
+RANKED_CACHE_MIN_POSTINGS = 1000
+FACETS = ('category', 'location.type')
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> list:
+    if not text:
+        return []
+    # Plain ASCII (most text) only needs lowercasing; anything else gets the full Unicode folding
+    return _WORD_RE.findall(text.lower() if text.isascii() else normalize(text))
+
+
+def _facet_value(stored: dict, facet: str):
+    value = stored
+    for part in facet.split('.'):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value if isinstance(value, str) and value else None
+
+
+def searchable_fields(org_data: dict) -> dict:
+    """The organization fields the index stores and returns with hits (JSON-safe)."""
+    stored = {field: org_data.get(field) for field in STORED_FIELDS if org_data.get(field) is not None}
+    created_at = org_data.get('createdAt')
+    stored['createdAt'] = created_at.timestamp() if isinstance(created_at, datetime) else created_at if isinstance(created_at, (int, float)) else 0
+    return stored
+
+
+def _terms(stored: dict) -> dict:
+    """Term -> weighted frequency over the indexed fields of one organization."""
+    terms = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        value = stored.get(field)
+        text = ' '.join(str(v) for v in value) if isinstance(value, list) else str(value or '')
+        for term in tokenize(text):
+            terms[term] = terms.get(term, 0.0) + weight
+    return terms
+
+
+class InvertedIndex:
+    """An in-memory inverted index over organizations with BM25 ranking and last-word prefix matching.
+
+    Each document's fields are weighted (FIELD_WEIGHTS) into one bag of terms, so BM25's term
+    frequency and length normalization see a name match as several description matches. Postings
+    hold each document's BM25 term weight, computed against the average document length when the
+    document was added (all at once on a rebuild), so a query only multiplies by the term's idf.
+    Every known query word must match (words the index has never seen are ignored). Not
+    thread-safe; SearchIndex serializes access.
+    """
+
+    def __init__(self):
+        self.ids = []  # slot -> org id, None once deleted
+        self.stored = []  # slot -> searchable_fields()
+        self.lengths = []  # slot -> weighted document length
+        self.slots = {}  # org id -> slot
+        self.postings = {}  # term -> {slot: BM25 term weight}
+        self.facet_slots = {facet: {} for facet in FACETS}  # facet -> value -> {slot}
+        self.facet_of = {facet: [] for facet in FACETS}  # facet -> slot -> value
+        self.total_length = 0.0
+        self._vocabulary = None  # sorted terms for prefix lookups, built on first use
+        self._recent = None  # slots newest first, for queries without words
+        self._ranked = {}  # common term -> its slots by descending weight
+        self._term_facets = {}  # common term -> facet counts over its postings
+
+    def __len__(self):
+        return len(self.slots)
+
+    @property
+    def vocabulary(self) -> list:
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        return self._vocabulary
+
+    @classmethod
+    def build(cls, organizations):
+        """An index of (org_id, stored) pairs, with one average document length for all of them."""
+        index = cls()
+        documents = [(org_id, stored, _terms(stored)) for org_id, stored in organizations]
+        average_length = sum(sum(terms.values()) for _, _, terms in documents) / len(documents) if documents else 1.0
+        for org_id, stored, terms in documents:
+            index._add(org_id, stored, terms, average_length)
+        return index
+
+    def upsert(self, org_id: str, stored: dict):
+        self.delete(org_id)
+        terms = _terms(stored)
+        length = sum(terms.values())
+        average_length = (self.total_length + length) / (len(self.slots) + 1)
+        self._add(org_id, stored, terms, average_length)
+
+    def _add(self, org_id: str, stored: dict, terms: dict, average_length: float):
+        slot = len(self.ids)
+        length = sum(terms.values())
+        self.ids.append(org_id)
+        self.stored.append(stored)
+        self.lengths.append(length)
+        self.slots[org_id] = slot
+        self.total_length += length
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (average_length or 1.0))
+        for term, frequency in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                if self._vocabulary is not None:
+                    bisect.insort(self._vocabulary, term)
+            postings[slot] = frequency * (BM25_K1 + 1) / (frequency + norm)
+            self._ranked.pop(term, None)
+            self._term_facets.pop(term, None)
+        self._add_facets(slot, stored)
+        self._recent = None
+
+    def _add_facets(self, slot: int, stored: dict):
+        for facet, values in self.facet_slots.items():
+            value = _facet_value(stored, facet)
+            self.facet_of[facet].append(value)
+            if value is not None:
+                values.setdefault(value, set()).add(slot)
+
+    def delete(self, org_id: str):
+        slot = self.slots.pop(org_id, None)
+        if slot is None:
+            return
+        stored = self.stored[slot]
+        for term in _terms(stored):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(slot, None)
+            self._ranked.pop(term, None)
+            self._term_facets.pop(term, None)
+            if not postings:
+                del self.postings[term]
+                if self._vocabulary is not None:
+                    del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+        for facet, values in self.facet_slots.items():
+            value = _facet_value(stored, facet)
+            self.facet_of[facet][slot] = None
+            if value in values:
+                values[value].discard(slot)
+                if not values[value]:
+                    del values[value]
+        self.total_length -= self.lengths[slot]
+        self.ids[slot] = None
+        self.stored[slot] = None
+        self.lengths[slot] = 0.0
+        self._recent = None
+
+    def _expansions(self, prefix: str) -> list:
+        vocabulary = self.vocabulary
+        start = bisect.bisect_left(vocabulary, prefix)
+        matches = []
+        for term in vocabulary[start:start + 20 * MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            if term != prefix:
+                matches.append(term)
+        # The most common completions are the likeliest meant
+        expansions, covered = [], 0
+        for term in heapq.nlargest(MAX_PREFIX_EXPANSIONS, matches, key=lambda t: len(self.postings[t])):
+            if expansions and covered + len(self.postings[term]) > PREFIX_POSTINGS_BUDGET:
+                break
+            expansions.append(term)
+            covered += len(self.postings[term])
+        return expansions
+
+    def _groups(self, query: str):
+        """One {term: factor} group per known query word; None for a query without words."""
+        words = list(dict.fromkeys(tokenize(query)))
+        if not words:
+            return None
+        prefix_last = not query[-1:].isspace()
+        count = len(self.slots)
+        groups = []
+        for i, word in enumerate(words):
+            group = {word: 1.0} if word in self.postings else {}
+            if prefix_last and i == len(words) - 1 and len(word) >= PREFIX_MIN_LENGTH:
+                for term in self._expansions(word):
+                    group[term] = PREFIX_WEIGHT
+            if group:
+                # A word's factor is its idf, discounted for prefix completions
+                groups.append({term: weight * math.log(1 + (count - len(self.postings[term]) + 0.5) / (len(self.postings[term]) + 0.5))
+                               for term, weight in group.items()})
+        return groups
+
+    def _score(self, groups: list) -> dict:
+        """slot -> BM25 score for every document matching every group."""
+        # Rarest word first, so the candidate set is as small as possible from the start
+        groups = sorted(groups, key=lambda group: sum(len(self.postings[t]) for t in group))
+        scores = None
+        for group in groups:
+            group_scores = {}
+            # A document matching several completions of the word keeps the strongest, applied last
+            for term, factor in sorted(group.items(), key=lambda item: item[1]):
+                postings = self.postings[term]
+                if scores is None or len(postings) <= len(scores):
+                    group_scores.update({slot: factor * weight for slot, weight in postings.items()})
+                else:
+                    group_scores.update({slot: factor * postings[slot] for slot in scores if slot in postings})
+            if scores is None:
+                scores = group_scores
+            else:
+                scores = {slot: score + group_scores[slot] for slot, score in scores.items() if slot in group_scores}
+            if not scores:
+                break
+        return scores or {}
+
+    def search(self, query: str, filters: dict = None, page: int = 0, hits_per_page: int = 20, facets: bool = False) -> dict:
+        """Ranked hits for one page; with `facets`, counts per facet value over all matches.
+
+        `filters` maps a facet to the values it accepts (any of them).
+        """
+        groups = self._groups(query)
+        term = None
+        allowed = None
+        for facet, values in (filters or {}).items():
+            if values and facet in self.facet_slots:
+                slots = set().union(*(self.facet_slots[facet].get(value, ()) for value in values))
+                allowed = slots if allowed is None else allowed & slots
+
+        end = (page + 1) * hits_per_page
+        if groups is None or (len(groups) == 1 and len(groups[0]) == 1):
+            # No words (newest first) or a single term (its postings by weight): the order is precomputed
+            if groups is None:
+                order, members = self._newest_first(), None
+            else:
+                term = next(iter(groups[0]))
+                order, members = self._ranked_postings(term), self.postings[term]
+            if allowed is None:
+                matched = members
+                total = len(members) if members is not None else len(self.slots)
+                ranked = order[:end]
+            else:
+                if members is None:
+                    matched = allowed
+                elif len(allowed) < len(members):
+                    matched = {slot for slot in allowed if slot in members}
+                else:
+                    matched = {slot for slot in members if slot in allowed}
+                total = len(matched)
+                ranked = list(islice((slot for slot in order if slot in matched), end))
+        else:
+            scores = self._score(groups)
+            if allowed is not None:
+                scores = {slot: score for slot, score in scores.items() if slot in allowed}
+            matched = scores.keys()
+            total = len(scores)
+            ranked = [slot for _, slot in heapq.nlargest(end, zip(scores.values(), scores.keys()))]
+
+        facet_counts = {}
+        if facets and term is not None and allowed is None:
+            facet_counts = self._facets_of_term(term)
+        elif facets:
+            facet_counts = self._count_facets(matched)
+        return {
+            'hits': [{'id': self.ids[slot], **self.stored[slot]} for slot in ranked[page * hits_per_page:end]],
+            'nbHits': total,
+            'page': page,
+            'nbPages': math.ceil(total / hits_per_page) if hits_per_page else 0,
+            'hitsPerPage': hits_per_page,
+            'facets': facet_counts,
+        }
+
+    def _count_facets(self, matched) -> dict:
+        """facet -> value -> count over `matched` slots (None for every organization)."""
+        facet_counts = {}
+        for facet, values in self.facet_slots.items():
+            if matched is None:
+                counts = {value: len(slots) for value, slots in values.items()}
+            else:
+                counts = Counter(map(self.facet_of[facet].__getitem__, matched))
+                counts.pop(None, None)
+            if counts:
+                facet_counts[facet] = dict(counts)
+        return facet_counts
+
+    def _facets_of_term(self, term: str) -> dict:
+        counts = self._term_facets.get(term)
+        if counts is None:
+            counts = self._count_facets(self.postings[term])
+            if len(self.postings[term]) >= RANKED_CACHE_MIN_POSTINGS:
+                self._term_facets[term] = counts
+        return counts
+
+    def _ranked_postings(self, term: str) -> list:
+        ranked = self._ranked.get(term)
+        if ranked is None:
+            postings = self.postings[term]
+            ranked = sorted(postings, key=postings.__getitem__, reverse=True)
+            if len(ranked) >= RANKED_CACHE_MIN_POSTINGS:
+                self._ranked[term] = ranked
+        return ranked
+
+    def _newest_first(self) -> list:
+        if self._recent is None:
+            self._recent = sorted(self.slots.values(), key=lambda slot: self.stored[slot].get('createdAt') or 0, reverse=True)
+        return self._recent
+
+    def to_snapshot(self) -> dict:
+        """A compact, slot-renumbered form that loads without re-tokenizing any document."""
+        renumber = {}
+        docs = []
+        for slot, org_id in enumerate(self.ids):
+            if org_id is not None:
+                renumber[slot] = len(docs)
+                docs.append([org_id, self.stored[slot], self.lengths[slot]])
+        postings = {}
+        for term, entries in self.postings.items():
+            slots = sorted(entries)
+            postings[term] = [[renumber[s] for s in slots], [round(entries[s], 4) for s in slots]]
+        return {'docs': docs, 'postings': postings}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict):
+        index = cls()
+        for org_id, stored, length in snapshot['docs']:
+            slot = len(index.ids)
+            index.slots[org_id] = slot
+            index.ids.append(org_id)
+            index.stored.append(stored)
+            index.lengths.append(length)
+            index._add_facets(slot, stored)
+        index.total_length = sum(index.lengths)
+        index.postings = {term: dict(zip(slots, weights)) for term, (slots, weights) in snapshot['postings'].items()}
+        return index
+
+
+class SearchIndex:
+    """An InvertedIndex shared by every process on the host through a snapshot and a journal.
+
+    Changes are appended to journal-<g>.jsonl under a file lock; each process replays new journal
+    lines before answering a query, so an approval in a Celery worker is searchable from every web
+    worker on the same host. When the journal outgrows `compact_bytes`, the process appending to it
+    writes snapshot-<g+1>.json.gz (the index with the journal applied), seals journal-<g> with a
+    pointer to journal-<g+1>, and removes older generations. A fresh process loads the newest
+    snapshot and replays only its journal.
+    """
+
+    def __init__(self, directory: str, compact_bytes: int = 4 * 1024 * 1024):
+        self.directory = directory
+        self.compact_bytes = compact_bytes
+        self._lock = threading.RLock()
+        self.index = InvertedIndex()
+        self.generation = 0
+        self._offset = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_latest()
+
+    # --- reading ---
+
+    def search(self, query: str, filters: dict = None, page: int = 0, hits_per_page: int = 20, facets: bool = False) -> dict:
+        with self._lock:
+            self.refresh()
+            return self.index.search(query, filters, page, hits_per_page, facets)
+
+    def refresh(self):
+        """Applies journal lines written since the last refresh, by any process."""
+        with self._lock:
+            while True:
+                try:
+                    size = os.path.getsize(self._journal_path(self.generation))
+                except OSError:
+                    # Our generation was removed (this process fell far behind): start from the newest snapshot
+                    if self.generation == 0 and not self._snapshot_generations():
+                        return
+                    self._load_latest()
+                    return
+                if size <= self._offset:
+                    return
+                with open(self._journal_path(self.generation), 'rb') as f:
+                    f.seek(self._offset)
+                    data = f.read(size - self._offset)
+                complete = data[:data.rfind(b'\n') + 1]  # a line still being written waits for the next refresh
+                if not complete:
+                    return
+                self._offset += len(complete)
+                sealed = None
+                for line in complete.splitlines():
+                    op = json.loads(line)
+                    if op['op'] == 'seal':
+                        sealed = op
+                        break
+                    self._apply(op)
+                if sealed is None:
+                    return
+                if sealed.get('reload'):
+                    self._load_snapshot(sealed['next'])
+                else:
+                    self.generation, self._offset = sealed['next'], 0
+
+    # --- writing ---
+
+    def upsert(self, org_id: str, org_data: dict):
+        self.apply([{'op': 'upsert', 'id': org_id, 'doc': searchable_fields(org_data)}])
+
+    def delete(self, org_id: str):
+        self.apply([{'op': 'delete', 'id': org_id}])
+
+    def apply(self, ops: list):
+        """Journals several upserts and deletes in one append, then applies them here."""
+        if not ops:
+            return
+        data = ''.join(json.dumps(op, ensure_ascii=False) + '\n' for op in ops).encode('utf-8')
+        with self._lock, self._file_lock():
+            self.refresh()
+            with open(self._journal_path(self.generation), 'ab') as f:
+                f.write(data)
+            self.refresh()
+            if self._offset >= self.compact_bytes:
+                self._compact()
+
+    def rebuild(self, organizations, only_if_unbuilt: bool = False) -> bool:
+        """Replaces the whole index with (org_id, org_data) pairs, e.g. every approved organization.
+
+        With `only_if_unbuilt`, does nothing once any process has built the index. Changes journaled
+        while the rebuild reads its input wait for the file lock and are applied on top.
+        """
+        with self._lock, self._file_lock():
+            self.refresh()
+            if only_if_unbuilt and self.generation > 0:
+                return False
+            index = InvertedIndex.build((org_id, searchable_fields(org_data)) for org_id, org_data in organizations)
+            self.index = index
+            self._rotate(reload=True)
+        logger.info(f"Rebuilt the organization search index with {len(index)} organizations")
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'organizations': len(self.index), 'terms': len(self.index.postings), 'generation': self.generation, 'journalBytes': self._offset}
+
+    # --- persistence ---
+
+    def _apply(self, op: dict):
+        if op['op'] == 'upsert':
+            self.index.upsert(op['id'], op['doc'])
+        elif op['op'] == 'delete':
+            self.index.delete(op['id'])
+
+    def _compact(self):
+        started = time.perf_counter()
+        self._rotate(reload=False)
+        logger.info(f"Compacted the search index into generation {self.generation} in {time.perf_counter() - started:.2f}s")
+
+    def _rotate(self, reload: bool):
+        # Called with both locks held and the journal fully applied
+        previous, nxt = self.generation, self.generation + 1
+        self._write_snapshot(nxt)
+        open(self._journal_path(nxt), 'ab').close()
+        with open(self._journal_path(previous), 'ab') as f:
+            f.write((json.dumps({'op': 'seal', 'next': nxt, 'reload': reload}) + '\n').encode('utf-8'))
+        self.generation, self._offset = nxt, 0
+        # Keep the previous generation for processes that are still replaying it
+        for stale in range(previous - 1, -1, -1):
+            removed = False
+            for path in (self._journal_path(stale), self._snapshot_path(stale)):
+                if os.path.exists(path):
+                    os.remove(path)
+                    removed = True
+            if not removed:
+                break
+
+    def _write_snapshot(self, generation: int):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.snapshot.')
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=3) as f:
+            f.write(json.dumps(self.index.to_snapshot(), ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        os.replace(tmp_path, self._snapshot_path(generation))
+
+    def _load_snapshot(self, generation: int):
+        started = time.perf_counter()
+        with gzip.open(self._snapshot_path(generation), 'rb') as f:
+            self.index = InvertedIndex.from_snapshot(json.loads(f.read()))
+        self.generation, self._offset = generation, 0
+        logger.info(f"Loaded search index generation {generation} ({len(self.index)} organizations) in {time.perf_counter() - started:.2f}s")
+
+    def _load_latest(self):
+        generations = self._snapshot_generations()
+        if generations:
+            self._load_snapshot(generations[-1])
+        else:
+            self.index, self.generation, self._offset = InvertedIndex(), 0, 0
+        self.refresh()
+
+    def _snapshot_generations(self) -> list:
+        generations = []
+        for name in os.listdir(self.directory):
+            match = re.fullmatch(r'snapshot-(\d+)\.json\.gz', name)
+            if match and os.path.exists(self._journal_path(int(match.group(1)))):
+                generations.append(int(match.group(1)))
+        return sorted(generations)
+
+    def _journal_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"journal-{generation}.jsonl")
+
+    def _snapshot_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"snapshot-{generation}.json.gz")
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, 'index.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Catch-ups re-read this much before the last one, for clock skew between the hosts writing updatedAt
+FIRESTORE_SYNC_OVERLAP_SECONDS = 30
+SYNC_MARK_FILE = 'firestore-sync.json'
+
+_index = None
+_index_lock = threading.Lock()
+_next_catch_up = 0.0
+
+
+def _reset_after_fork():
+    global _index, _index_lock, _next_catch_up
+    _index = None
+    _index_lock = threading.Lock()
+    _next_catch_up = 0.0
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_search_index(config, db_client=None):
+    """Returns the process-wide organization search index, or None unless SEARCH_INDEX_ENABLED is set.
+
+    Callers that pass `db_client` (the search route) also keep the index in step with Firestore:
+    while no process on the host has built it, it is built from the approved organizations, and
+    every SEARCH_INDEX_FIRESTORE_SYNC_SECONDS the organizations updated since the last catch-up are
+    re-applied. The journal only reaches processes on this host, so this catch-up is what brings
+    in verdicts written by workers elsewhere; organizations deleted on another host stay searchable
+    until the next `flask rebuild-search-index`.
+    """
+    global _index, _next_catch_up
+    if not config.get('SEARCH_INDEX_ENABLED', True):
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SearchIndex(
+                    config.get('SEARCH_INDEX_DIR', 'instance/search_index'),
+                    compact_bytes=config.get('SEARCH_INDEX_COMPACT_BYTES', 4 * 1024 * 1024),
+                )
+    index = _index
+    if db_client is None:
+        return index
+    try:
+        if index.generation == 0:
+            build_from_firestore(index, db_client, only_if_unbuilt=True)
+        interval = config.get('SEARCH_INDEX_FIRESTORE_SYNC_SECONDS', 60)
+        if interval > 0 and time.monotonic() >= _next_catch_up:
+            _next_catch_up = time.monotonic() + interval
+            catch_up_from_firestore(index, db_client, interval)
+    except Exception as e:
+        # Serve what the index already has; the next caller tries again
+        logger.error(f"Failed to sync the organization search index from Firestore: {e}", exc_info=True)
+    return index
+
+
+def approved_organizations(db_client):
+    """Streams (org_id, org_data) for every approved organization."""
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    query = db_client.collection('organizations').where(filter=FieldFilter('status', '==', 'approved'))
+    for doc in query.stream():
+        yield doc.id, doc.to_dict()
+
+
+def build_from_firestore(index, db_client, only_if_unbuilt: bool = False) -> bool:
+    """Rebuilds `index` from the approved organizations and starts catch-ups from this point."""
+    started = datetime.now()
+    built = index.rebuild(approved_organizations(db_client), only_if_unbuilt=only_if_unbuilt)
+    if built:
+        _write_sync_mark(index.directory, started)
+    return built
+
+
+def catch_up_from_firestore(index, db_client, min_interval: float = 0.0) -> int:
+    """Applies the organizations updated in Firestore since the host's last catch-up.
+
+    Skipped when another process on the host caught up less than `min_interval` seconds ago.
+    Returns the number of organizations applied.
+    """
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    mark = _read_sync_mark(index.directory)
+    started = datetime.now()
+    if mark is not None and (started - mark).total_seconds() < min_interval:
+        return 0
+    query = db_client.collection('organizations')
+    if mark is not None:
+        since = mark - timedelta(seconds=FIRESTORE_SYNC_OVERLAP_SECONDS)
+        query = query.where(filter=FieldFilter('updatedAt', '>', since))
+    ops = []
+    for doc in query.stream():
+        org_data = doc.to_dict()
+        if org_data.get('status') == 'approved':
+            ops.append({'op': 'upsert', 'id': doc.id, 'doc': searchable_fields(org_data)})
+        else:
+            ops.append({'op': 'delete', 'id': doc.id})
+    index.apply(ops)
+    _write_sync_mark(index.directory, started)
+    if ops:
+        logger.info(f"Caught the search index up with {len(ops)} organizations updated in Firestore")
+    return len(ops)
+
+
+def _read_sync_mark(directory: str):
+    try:
+        with open(os.path.join(directory, SYNC_MARK_FILE), encoding='utf-8') as f:
+            return datetime.fromisoformat(json.load(f)['updatedAt'])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _write_sync_mark(directory: str, mark: datetime):
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.sync.')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'updatedAt': mark.isoformat()}, f)
+    os.replace(tmp_path, os.path.join(directory, SYNC_MARK_FILE))
+
+
+def sync_organizations(config, verdicts: list):
+    """Indexes (org_id, org_data, status) verdicts: approved organizations are upserted, others removed.
+
+    Search must never fail the caller's write, so errors are only logged.
+    """
+    try:
+        index = get_search_index(config)
+        if index is None:
+            return
+        index.apply([
+            {'op': 'upsert', 'id': org_id, 'doc': searchable_fields(org_data)} if status == 'approved' else {'op': 'delete', 'id': org_id}
+            for org_id, org_data, status in verdicts
+        ])
+    except Exception as e:
+        logger.error(f"Failed to update the organization search index: {e}", exc_info=True)
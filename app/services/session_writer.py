@@ -0,0 +1,74 @@
+# --- app/services/session_writer.py ---
+import copy
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SessionWriteBuffer:
+    """Coalesces field updates for one Firestore document into as few `update` calls as possible.
+
+    Updates use Firestore's dotted field paths. Later updates win: writing a path replaces any
+    pending writes below it, and writing below a pending path is folded into that pending value,
+    so a flush never sends overlapping paths (which Firestore rejects).
+    """
+
+    def __init__(self, doc_ref, max_pending_fields: int = 50, max_delay: float = 5.0):
+        self.doc_ref = doc_ref
+        self.max_pending_fields = max_pending_fields
+        self.max_delay = max_delay
+        self.writes = 0
+        self.field_updates = 0
+        self._pending = {}
+        self._oldest_pending_at = None
+        self._lock = threading.Lock()
+
+    def update(self, fields: dict):
+        """Queues field updates, flushing when the size or age threshold is crossed."""
+        with self._lock:
+            for path, value in fields.items():
+                self._merge(path, value)
+                self.field_updates += 1
+            if self._oldest_pending_at is None:
+                self._oldest_pending_at = time.monotonic()
+            due = (len(self._pending) >= self.max_pending_fields
+                   or time.monotonic() - self._oldest_pending_at >= self.max_delay)
+        if due:
+            self.flush()
+
+    def flush(self) -> bool:
+        """Writes all pending updates in one call. Returns True if anything was written."""
+        with self._lock:
+            if not self._pending:
+                return False
+            pending, self._pending, self._oldest_pending_at = self._pending, {}, None
+            self.writes += 1
+            try:
+                self.doc_ref.update(pending)
+            except Exception:
+                # Keep the fields queued so a later flush can retry them, then surface the error
+                self.writes -= 1
+                self._pending = pending
+                self._oldest_pending_at = time.monotonic()
+                raise
+        return True
+
+    def _merge(self, path: str, value):
+        prefix = path + '.'
+        for pending_path in [p for p in self._pending if p.startswith(prefix)]:
+            del self._pending[pending_path]
+
+        parts = path.split('.')
+        for i in range(1, len(parts)):
+            ancestor = '.'.join(parts[:i])
+            if ancestor in self._pending and isinstance(self._pending[ancestor], dict):
+                target = self._pending[ancestor] = copy.deepcopy(self._pending[ancestor])
+                for key in parts[i:-1]:
+                    if not isinstance(target.get(key), dict):
+                        target[key] = {}
+                    target = target[key]
+                target[parts[-1]] = value
+                return
+        self._pending[path] = value
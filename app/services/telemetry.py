@@ -0,0 +1,295 @@
+# --- app/services/telemetry.py ---
+import contextvars
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY_PREFIX = "metrics:"
+_LE_LABEL = re.compile(r'le="([^"]*)",?')
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 120, 300)
+
+# The session trace and LLM call being measured on this thread. Worker pools copy the context
+# into their threads (see AIAnalysisService._run_personas_concurrently), so calls made there
+# are still attributed to the right stage.
+_current_span = contextvars.ContextVar('ai_current_span', default=None)
+_current_call = contextvars.ContextVar('ai_current_llm_call', default=None)
+
+
+# --- Prometheus-style metrics ---
+
+class LocalMetricsStore:
+    """Per-process metric values; the stand-in for single-process setups and benchmarks."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def incr(self, increments: dict):
+        with self._lock:
+            for key, amount in increments.items():
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+
+class RedisMetricsStore:
+    """Metric values in one Redis hash, so /metrics on any web worker covers the Celery workers too."""
+
+    def __init__(self, redis_url: str):
+        import redis
+        self.redis = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.key = METRICS_KEY_PREFIX + "values"
+
+    def incr(self, increments: dict):
+        pipe = self.redis.pipeline(transaction=False)
+        for key, amount in increments.items():
+            pipe.hincrbyfloat(self.key, key, amount)
+        pipe.execute()
+
+    def values(self) -> dict:
+        return {k.decode(): float(v) for k, v in self.redis.hgetall(self.key).items()}
+
+
+def _series(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+def _render_order(series: str) -> tuple:
+    # Buckets of one histogram series stay together, in increasing 'le' order
+    match = _LE_LABEL.search(series)
+    if match is None:
+        return (series, 0.0)
+    le = match.group(1)
+    return (series[:match.start()] + series[match.end():], float('inf') if le == '+Inf' else float(le))
+
+
+class MetricsRegistry:
+    """Histograms and counters rendered in the Prometheus text exposition format."""
+
+    def __init__(self, store):
+        self.store = store
+        self._help = {}
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        self._help[name] = (metric_type, help_text)
+
+    def observe(self, name: str, value: float, buckets=SECONDS_BUCKETS, **labels):
+        increments = {_series(f"{name}_sum", labels): value, _series(f"{name}_count", labels): 1}
+        for bound in buckets:
+            if value <= bound:
+                increments[_series(f"{name}_bucket", {**labels, "le": bound})] = 1
+        increments[_series(f"{name}_bucket", {**labels, "le": "+Inf"})] = 1
+        self._incr(increments)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if amount:
+            self._incr({_series(name, labels): amount})
+
+    def render(self) -> str:
+        values = self.store.values()
+        lines = []
+        for name, (metric_type, help_text) in sorted(self._help.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            series_names = (name, f"{name}_sum", f"{name}_count", f"{name}_bucket")
+            for series in sorted((k for k in values if k.split('{')[0] in series_names), key=_render_order):
+                value = values[series]
+                lines.append(f"{series} {int(value) if float(value).is_integer() else value}")
+        return "\n".join(lines) + "\n"
+
+    def _incr(self, increments: dict):
+        # Observations are fire-and-forget; a metrics outage must never fail an analysis
+        try:
+            self.store.incr(increments)
+        except Exception as e:
+            logger.debug(f"Failed to record metrics: {e}")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _registry, _registry_lock
+    _registry = None
+    _registry_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_metrics(config=None):
+    """Returns the process-wide metrics registry.
+
+    Backed by Redis when METRICS_BACKEND is 'redis' (the Config default), so every gunicorn and Celery
+    worker feeds the same series; 'local' keeps the values in this process only.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                if config is None:
+                    config = current_app.config if has_app_context() else {}
+                backend = config.get('METRICS_BACKEND', 'local')
+                store = RedisMetricsStore(config.get('METRICS_REDIS_URL')) if backend == 'redis' else LocalMetricsStore()
+                registry = MetricsRegistry(store)
+                registry.describe("depanku_ai_stage_seconds", "histogram", "Duration of AI analysis and socratic stages.")
+                registry.describe("depanku_llm_call_seconds", "histogram", "Duration of LLM calls, including retries and queueing.")
+                registry.describe("depanku_llm_queue_wait_seconds", "histogram", "Time LLM calls waited for rate-limit tokens and concurrency slots.")
+                registry.describe("depanku_llm_calls_total", "counter", "LLM calls by model and outcome (ok, error, cache_hit).")
+                registry.describe("depanku_llm_retries_total", "counter", "HTTP retries made by the OpenRouter client.")
+                registry.describe("depanku_llm_tokens_total", "counter", "Tokens reported by completion.usage, by model and kind.")
+                registry.describe("depanku_goal_cache_lookups_total", "counter", "Near-duplicate goal cache lookups by outcome (hit, miss).")
+                registry.describe("depanku_goal_cache_llm_calls_saved_total", "counter", "LLM calls skipped by reusing a near-identical goal's analysis.")
+                registry.describe("depanku_moderation_memo_total", "counter", "Organization edits by moderation outcome (reused when name, description and tags are unchanged, dispatched otherwise).")
+                _registry = registry
+    return _registry
+
+
+# --- Per-session traces ---
+
+def metrics_token_valid(config, authorization: str) -> bool:
+    """Whether an Authorization header carries METRICS_TOKEN as a bearer token (always true when unset)."""
+    token = config.get('METRICS_TOKEN')
+    return not token or hmac.compare_digest(authorization or '', f"Bearer {token}")
+
+
+class SessionTrace:
+    """Collects per-stage timings and LLM usage for one AI session, in a compact persistable form."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = {}
+
+    @contextmanager
+    def span(self, name: str):
+        """Times a stage; LLM calls made inside it (on any thread carrying this context) count towards it."""
+        token = _current_span.set((self, name))
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            _current_span.reset(token)
+            with self._lock:
+                self._entry(name)["ms"] += int(elapsed * 1000)
+            get_metrics().observe("depanku_ai_stage_seconds", elapsed, stage=_stage_label(name))
+
+    def add_call(self, span_name: str, call):
+        with self._lock:
+            entry = self._entry(span_name)
+            entry["calls"] += 1
+            entry["promptTokens"] += call.prompt_tokens
+            entry["completionTokens"] += call.completion_tokens
+            entry["retries"] += call.retries
+            entry["cacheHits"] += 1 if call.cache_hit else 0
+            entry["queueMs"] += int(call.queue_wait * 1000)
+            if call.error:
+                entry["errors"] += 1
+
+    def compact(self) -> dict:
+        """{'spans': {name: {...}}, 'totals': {...}} with zero counters left out to keep the document small."""
+        with self._lock:
+            spans = {name: {k: v for k, v in entry.items() if v} for name, entry in self.spans.items()}
+        totals = {}
+        for entry in spans.values():
+            for key, value in entry.items():
+                totals[key] = totals.get(key, 0) + value
+        return {"spans": spans, "totals": totals}
+
+    def _entry(self, name: str) -> dict:
+        entry = self.spans.get(name)
+        if entry is None:
+            entry = self.spans[name] = {
+                "ms": 0, "calls": 0, "promptTokens": 0, "completionTokens": 0,
+                "retries": 0, "cacheHits": 0, "queueMs": 0, "errors": 0,
+            }
+        return entry
+
+
+def _stage_label(name: str) -> str:
+    # consensusRound1, consensusRound2... and per-persona steps (debate_qwen) share one histogram series
+    return name.split('_')[0].rstrip("0123456789") or name
+
+
+class LLMCall:
+    def __init__(self, model_id: str):
+        self.model_id = model_id
+        self.attempts = 0
+        self.queue_wait = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hit = False
+        self.error = False
+
+    @property
+    def retries(self) -> int:
+        return max(0, self.attempts - 1)
+
+    def set_usage(self, usage):
+        if usage is not None:
+            self.prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+            self.completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+
+
+@contextmanager
+def llm_call(model_id: str):
+    """Measures one logical LLM call (cache lookups, queueing, retries and hedges included)."""
+    call = LLMCall(model_id)
+    token = _current_call.set(call)
+    started = time.monotonic()
+    try:
+        yield call
+    except GeneratorExit:
+        raise  # a stream closed early by its consumer is not a failed call
+    except BaseException:
+        call.error = True
+        raise
+    finally:
+        _current_call.reset(token)
+        elapsed = time.monotonic() - started
+        metrics = get_metrics()
+        outcome = "cache_hit" if call.cache_hit else ("error" if call.error else "ok")
+        metrics.inc("depanku_llm_calls_total", model=model_id, outcome=outcome)
+        if not call.cache_hit:
+            metrics.observe("depanku_llm_call_seconds", elapsed, model=model_id)
+            metrics.observe("depanku_llm_queue_wait_seconds", call.queue_wait, model=model_id)
+        metrics.inc("depanku_llm_retries_total", call.retries, model=model_id)
+        metrics.inc("depanku_llm_tokens_total", call.prompt_tokens, model=model_id, kind="prompt")
+        metrics.inc("depanku_llm_tokens_total", call.completion_tokens, model=model_id, kind="completion")
+        current = _current_span.get()
+        if current is not None:
+            trace, span_name = current
+            trace.add_call(span_name, call)
+
+
+def note_http_attempt(request=None):
+    """httpx request hook: counts every HTTP attempt, so retries show up on the current call."""
+    call = _current_call.get()
+    if call is not None:
+        call.attempts += 1
+
+
+async def note_http_attempt_async(request=None):
+    """The same hook for httpx.AsyncClient, which only accepts coroutine hooks."""
+    note_http_attempt(request)
+
+
+def note_queue_wait(seconds: float):
+    call = _current_call.get()
+    if call is not None:
+        call.queue_wait += seconds
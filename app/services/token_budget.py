@@ -0,0 +1,64 @@
+# --- app/services/token_budget.py ---
+import hashlib
+import logging
+import math
+import threading
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:  # optional dependency; fall back to the ~4 characters per token rule of thumb
+    _encoding = None
+
+# Per-message overhead of the chat format (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with tiktoken when installed, otherwise estimates from the text length."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+def count_message_tokens(messages: list) -> int:
+    return sum(count_tokens(m.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text down to roughly `max_tokens`, marking the cut."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens]) + " [...]"
+    return text[:max_tokens * 4] + " [...]"
+
+
+class DigestCache:
+    """Compact digests of persona responses, keyed by a hash of the full text.
+
+    Responses carried over unchanged between rounds reuse their digest instead of being summarized again.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def get(self, text: str):
+        with self._lock:
+            return self._digests.get(self.key(text))
+
+    def put(self, text: str, digest: str):
+        with self._lock:
+            if len(self._digests) >= self.max_entries:
+                self._digests.pop(next(iter(self._digests)))
+            self._digests[self.key(text)] = digest
@@ -1,63 +1,233 @@
 # --- app/tasks.py ---
 import logging
+from celery import chain, chord, group
+from celery.exceptions import Retry
+from celery.signals import worker_process_shutdown
+from celery.utils import uuid
+from flask import current_app
 from .extensions import celery, db
-from .services.ai_analysis_service import AIAnalysisService
-from .services.moderation_service import ModerationService
+from .services.audit_sink import close_audit_sink
+from .services.ai_analysis_service import AIAnalysisService, DEBATE_PERSONAS, MAX_CONSENSUS_ITERATIONS
+from .services.moderation_service import ModerationService, moderation_update
 from .services.openai_service import OpenAIService
-from datetime import datetime 
+from .services.progress_channel import get_progress_broker
+from .services.resilience import ModelUnavailableError
+from .services.search_index import sync_organizations
+
 logger = logging.getLogger(__name__)
 
-@celery.task(bind=True)
+# Acked only once it finishes, so a worker that dies mid-analysis gets the task redelivered;
+# the flow then resumes from the session's checkpoints instead of starting over.
+@celery.task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=3, default_retry_delay=15)
 def perform_ai_analysis(self, user_id: str, refined_goal: str, session_id: str):
     """Celery task to run the full AI analysis flow without blocking the web server."""
+    final_attempt = self.request.retries >= self.max_retries
     try:
         self.update_state(state='PROGRESS', meta={'status': 'Initializing AI services...'})
         
         openai_service = OpenAIService()
-        ai_analysis_service = AIAnalysisService(db.client, openai_service)
+        ai_analysis_service = AIAnalysisService(db.client, openai_service, get_progress_broker(current_app.config))
         
         self.update_state(state='PROGRESS', meta={'status': 'Conducting multi-expert debate...'})
-        result = ai_analysis_service.full_ai_analysis_flow(user_id, refined_goal, session_id)
+        result = ai_analysis_service.full_ai_analysis_flow(user_id, refined_goal, session_id, mark_failed=final_attempt)
         
         if not result.get("success"):
-             raise Exception(result.get("error", "Unknown error in analysis flow"))
+            if not final_attempt:
+                logger.warning(f"AI analysis for session {session_id} failed; retrying from its checkpoints (attempt {self.request.retries + 1})")
+                raise self.retry(countdown=self.default_retry_delay * 2 ** self.request.retries)
+            raise Exception(result.get("error", "Unknown error in analysis flow"))
 
         self.update_state(state='SUCCESS', meta={'status': 'Analysis complete!'})
         return {'status': 'Complete', 'sessionId': result['sessionId']}
 
+    except Retry:
+        raise
     except Exception as e:
         logger.error(f"AI analysis task failed for session {session_id}: {e}", exc_info=True)
         self.update_state(state='FAILURE', meta={'exc_type': type(e).__name__, 'exc_message': str(e)})
         raise
 
+# --- Distributed analysis ---
+# The same flow as perform_ai_analysis, split into a canvas so one analysis spreads over many
+# worker slots and nodes:
+#
+#   start -> chord(debate x persona) -> critique
+#         -> [prepare round N -> chord(revise x persona) -> settle round N] for each round
+#         -> finish (compromise if needed, usage record)
+#
+# Every step is idempotent through the session's checkpoints, acked late and retried on its own,
+# so a lost or failed subtask is redone without repeating any other step's LLM calls.
+ANALYSIS_STEP_OPTIONS = dict(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=3, default_retry_delay=5)
+
+
+def build_ai_analysis_workflow(user_id: str, refined_goal: str, session_id: str):
+    """Returns the analysis canvas for a session; its result is the finish step's.
+
+    The finish step's id is fixed up front so the error callback can mark it failed: a canvas that
+    stops early never runs that step, and its result would otherwise stay PENDING forever.
+    """
+    finish_id = uuid()
+    rounds = [
+        chain(
+            prepare_consensus_round_step.si(session_id, round_number),
+            chord(
+                group([revise_persona_step.si(session_id, round_number, persona) for persona in DEBATE_PERSONAS]),
+                settle_consensus_round_step.si(session_id, round_number),
+            ),
+        )
+        for round_number in range(1, MAX_CONSENSUS_ITERATIONS + 1)
+    ]
+    workflow = chain(
+        start_analysis_step.si(session_id, refined_goal, user_id),
+        chord(
+            group([debate_persona_step.si(session_id, refined_goal, persona) for persona in DEBATE_PERSONAS]),
+            devil_advocate_step.si(session_id),
+        ),
+        *rounds,
+        finish_analysis_step.si(user_id, session_id).set(task_id=finish_id),
+    )
+    return workflow.on_error(analysis_failed.s(session_id=session_id, result_id=finish_id))
+
+
+def start_ai_analysis(user_id: str, refined_goal: str, session_id: str):
+    """Dispatches an analysis, as a task graph when AI_ANALYSIS_DISTRIBUTED is set. Returns its AsyncResult."""
+    if current_app.config.get('AI_ANALYSIS_DISTRIBUTED', False):
+        return build_ai_analysis_workflow(user_id, refined_goal, session_id).apply_async()
+    return perform_ai_analysis.delay(user_id, refined_goal, session_id)
+
+
+def _analysis_service() -> AIAnalysisService:
+    return AIAnalysisService(db.client, OpenAIService(), get_progress_broker(current_app.config))
+
+
+def _retry_step(task, exc, session_id: str, step: str):
+    """Retries a step with exponential backoff; returns normally once its retries are spent."""
+    if task.request.retries < task.max_retries:
+        logger.warning(f"Step {step} of session {session_id} failed ({exc}); retrying")
+        raise task.retry(exc=exc, countdown=task.default_retry_delay * 2 ** task.request.retries)
+
+
+@celery.task(**ANALYSIS_STEP_OPTIONS)
+def start_analysis_step(self, session_id: str, refined_goal: str, user_id: str = None):
+    service = _analysis_service()
+    try:
+        with service.analysis_step(session_id, 'start'):
+            service.start_analysis(session_id, refined_goal, user_id)
+    except Exception as e:
+        _retry_step(self, e, session_id, 'start')
+        raise
+
+
+@celery.task(**ANALYSIS_STEP_OPTIONS)
+def debate_persona_step(self, session_id: str, refined_goal: str, persona: str):
+    service = _analysis_service()
+    try:
+        with service.analysis_step(session_id, f'debate_{persona}'):
+            service.debate_as_persona(session_id, refined_goal, persona)
+    except Exception as e:
+        _retry_step(self, e, session_id, f'debate_{persona}')
+        # Out of retries: the critique treats this expert as unavailable, as the single-task flow does
+        logger.error(f"Persona {persona} failed in the debate for session {session_id}: {e}")
+
+
+@celery.task(**ANALYSIS_STEP_OPTIONS)
+def devil_advocate_step(self, session_id: str):
+    service = _analysis_service()
+    try:
+        with service.analysis_step(session_id, 'critique'):
+            service.devil_advocate_analysis(session_id)
+    except Exception as e:
+        _retry_step(self, e, session_id, 'critique')
+        raise
+
+
+@celery.task(**ANALYSIS_STEP_OPTIONS)
+def prepare_consensus_round_step(self, session_id: str, round_number: int):
+    service = _analysis_service()
+    try:
+        with service.analysis_step(session_id, f'consensusRound{round_number}_prepare'):
+            service.prepare_consensus_round(session_id, round_number)
+    except Exception as e:
+        _retry_step(self, e, session_id, f'consensusRound{round_number}_prepare')
+        raise
+
+
+@celery.task(**ANALYSIS_STEP_OPTIONS)
+def revise_persona_step(self, session_id: str, round_number: int, persona: str):
+    service = _analysis_service()
+    try:
+        with service.analysis_step(session_id, f'consensusRound{round_number}_{persona}'):
+            service.revise_as_persona(session_id, round_number, persona)
+    except Exception as e:
+        _retry_step(self, e, session_id, f'consensusRound{round_number}_{persona}')
+        # Out of retries: the persona's previous response carries over
+        logger.error(f"Persona {persona} failed in consensus round {round_number} for session {session_id}: {e}")
+
+
+@celery.task(**ANALYSIS_STEP_OPTIONS)
+def settle_consensus_round_step(self, session_id: str, round_number: int):
+    service = _analysis_service()
+    try:
+        with service.analysis_step(session_id, f'consensusRound{round_number}_settle'):
+            service.settle_consensus_round(session_id, round_number)
+    except Exception as e:
+        _retry_step(self, e, session_id, f'consensusRound{round_number}_settle')
+        raise
+
+
+@celery.task(**ANALYSIS_STEP_OPTIONS)
+def finish_analysis_step(self, user_id: str, session_id: str):
+    service = _analysis_service()
+    try:
+        with service.analysis_step(session_id, 'finish'):
+            service.finish_analysis(user_id, session_id)
+        return {'status': 'Complete', 'sessionId': session_id}
+    except Exception as e:
+        _retry_step(self, e, session_id, 'finish')
+        raise
+
+
 @celery.task
-def moderate_and_index_organization(org_data: dict, org_id: str):
-    """Celery task for content moderation and (future) search indexing."""
+def analysis_failed(request, exc, traceback, session_id: str, result_id: str = None):
+    """Error callback of the analysis canvas: a step failed for good."""
+    logger.error(f"Distributed AI analysis failed for session {session_id} in task {request.id}: {exc}")
+    _analysis_service().mark_analysis_failed(session_id, str(exc))
+    if result_id:
+        # The id the web app polls (/api/task_status) is the finish step's, which will never run
+        celery.backend.mark_as_failure(result_id, exc if isinstance(exc, BaseException) else Exception(str(exc)))
+
+
+@celery.task(bind=True, max_retries=5, default_retry_delay=30)
+def moderate_and_index_organization(self, org_data: dict, org_id: str):
+    """Celery task for content moderation and search indexing.
+
+    When the AI check is shed or its model is unavailable, the task retries with backoff and the
+    organization stays pending; it is never approved unchecked.
+    """
     try:
         moderation_service = ModerationService(db.client, OpenAIService())
         moderation_result = moderation_service.moderate_content(org_data)
         
         org_ref = db.client.collection('organizations').document(org_id)
-        update_data = {
-            'aiModeration': moderation_result,
-            'updatedAt': datetime.now()
-        }
-        
-        if moderation_result.get('approved', True):
-            update_data['status'] = 'approved'
-            logger.info(f"Organization {org_id} approved by moderation.")
-            # Future integration: Add to search index
-            # from app.services.search_service import algolia_client
-            # algolia_client.index_organization(org_id, org_data)
-        else:
-            update_data['status'] = 'rejected'
-            logger.warning(f"Organization {org_id} rejected by moderation. Reasons: {moderation_result.get('reasons')}")
-        
+        update_data = moderation_update(org_id, org_data, moderation_result)
         org_ref.update(update_data)
-            
+        sync_organizations(current_app.config, [(org_id, org_data, update_data['status'])])
+
+    except ModelUnavailableError as e:
+        if self.request.retries < self.max_retries:
+            logger.warning(f"AI moderation for org {org_id} unavailable ({e}); retrying")
+            raise self.retry(exc=e, countdown=self.default_retry_delay * 2 ** self.request.retries)
+        logger.error(f"AI moderation for org {org_id} still unavailable after {self.max_retries} retries; left pending")
+        raise
     except Exception as e:
         logger.error(f"Moderation task failed for org {org_id}: {e}", exc_info=True)
         # Mark the org as having a moderation failure for manual review
         org_ref = db.client.collection('organizations').document(org_id)
         org_ref.update({'status': 'moderation_failed', 'error': str(e)})
-        raise
\ No newline at end of file
+        raise
+
+
+@worker_process_shutdown.connect
+def flush_moderation_audit_log(**kwargs):
+    """Writes the audit records still buffered in a worker process before it exits."""
+    close_audit_sink()
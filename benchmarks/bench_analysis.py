@@ -0,0 +1,207 @@
+# --- benchmarks/bench_analysis.py ---
+"""End-to-end benchmark of the socratic, analysis and moderation flows, fully offline.
+
+Drives AIAnalysisService and ModerationService against the mock OpenRouter server and the
+in-memory Firestore, then reports wall time, LLM calls, tokens and Firestore ops per flow.
+Compares the run against a baseline file and exits non-zero when a flow regresses.
+
+Usage:
+    python -m benchmarks.bench_analysis [--analyses 8] [--concurrency 4] [--orgs 20]
+                                        [--latency 0.05] [--error-rate 0.0] [--goal-cache]
+                                        [--moderation-batch]
+                                        [--baseline benchmarks/baseline.json] [--update-baseline]
+
+--goal-cache turns on the near-duplicate goal cache (every analysis uses the same goal, and each
+user runs up to three, since analyses are only reused for the same user) and reports its hit rate and the LLM calls it saved. --moderation-batch moderates the organizations
+from --concurrency threads with micro-batched AI moderation on and reports the batch sizes.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+
+from config import Config
+from app.services.ai_analysis_service import AIAnalysisService, MAX_SOCRATIC_QUESTIONS
+from app.services.audit_sink import close_audit_sink
+from app.services.goal_cache import get_goal_cache
+from app.services.progress_channel import get_progress_broker
+from app.services.moderation_service import ModerationService, get_moderation_batcher
+from app.services.openai_service import OpenAIService
+from benchmarks.fake_firestore import InMemoryFirestore
+from benchmarks.mock_openrouter import Latency, MockOpenRouterServer
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+# Allowed relative growth per metric before a run counts as a regression
+TOLERANCES = {"wallSeconds": 0.25, "default": 0.10}
+# Wall time below this many seconds is noise and never fails the run
+WALL_TIME_FLOOR = 0.5
+
+GOAL = "Get into a top computer science program while keeping a part-time job."
+
+
+def build_app(base_url: str) -> Flask:
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config.update(
+        OPENROUTER_API_KEY='mock-key',
+        OPENROUTER_BASE_URL=base_url,
+        # Personas stream through the progress channel, as with the default 'redis' backend
+        AI_PROGRESS_BACKEND='local',
+        LLM_CACHE_ENABLED=False,
+        OPENROUTER_BREAKER_BACKEND='local',
+        OPENROUTER_RATE_LIMIT_BACKEND='none',
+        METRICS_BACKEND='local',
+    )
+    return app
+
+
+def measure(name: str, server: MockOpenRouterServer, db: InMemoryFirestore, fn) -> dict:
+    server.reset_counters()
+    db.reset_counters()
+    started = time.perf_counter()
+    fn()
+    wall = time.perf_counter() - started
+    llm = server.stats()
+    result = {
+        "wallSeconds": round(wall, 3),
+        "llmCalls": llm["requests"],
+        "llmErrors": llm["errors"],
+        "promptTokens": llm["promptTokens"],
+        "completionTokens": llm["completionTokens"],
+        "firestoreReads": db.reads,
+        "firestoreWrites": db.writes,
+        "firestoreRoundTrips": db.round_trips,
+    }
+    print(f"{name:>10}: " + ", ".join(f"{k}={v}" for k, v in result.items()))
+    return result
+
+
+def run(args) -> dict:
+    latency = Latency.lognormal(args.latency, 0.3)
+    with MockOpenRouterServer(latency=latency, error_rate=args.error_rate, seed=args.seed) as server:
+        app = build_app(server.base_url)
+        if args.goal_cache:
+            app.config.update(AI_GOAL_CACHE_ENABLED=True, AI_GOAL_CACHE_PATH=os.path.join(tempfile.mkdtemp(), 'goal_cache.json'))
+        if args.moderation_batch:
+            app.config.update(MODERATION_BATCH_ENABLED=True)
+        db = InMemoryFirestore()
+        results = {}
+        with app.app_context():
+            for i in range(args.analyses):
+                db.collection('users').document(f"user{i}").set({'subscription': {'plan': 'free', 'aiAnalysesRemaining': 3}})
+
+            def socratic():
+                service = AIAnalysisService(db, OpenAIService())
+                for i in range(args.analyses):
+                    session_id = service.start_socratic_session(f"user{i}", GOAL)["sessionId"]
+                    for _ in range(MAX_SOCRATIC_QUESTIONS):
+                        service.continue_socratic_session(session_id, "Mostly hands-on projects and mentorship.")
+
+            def analysis():
+                session_ids = []
+                users = -(-args.analyses // 3) if args.goal_cache else args.analyses
+                for i in range(args.analyses):
+                    ref = db.collection('ai_sessions').document()
+                    ref.set({'userId': f"user{i % users}", 'refinedGoal': GOAL})
+                    session_ids.append((f"user{i % users}", ref.id))
+
+                def one(pair):
+                    with app.app_context():
+                        result = AIAnalysisService(db, OpenAIService(), get_progress_broker(app.config)).full_ai_analysis_flow(pair[0], GOAL, pair[1])
+                        if not result.get("success"):
+                            raise RuntimeError(f"Analysis failed for session {pair[1]}")
+
+                with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    list(pool.map(one, session_ids))
+
+            def moderate_one(i):
+                with app.app_context():
+                    ModerationService(db, OpenAIService()).moderate_content({
+                        'name': f"Robotics Club {i}",
+                        'description': "A student club building competition robots after school.",
+                        'tags': ['#robotics', '#stem'],
+                        'ownerId': f"user{i % max(1, args.analyses)}",
+                    })
+
+            def moderation():
+                if args.moderation_batch:
+                    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                        list(pool.map(moderate_one, range(args.orgs)))
+                else:
+                    for i in range(args.orgs):
+                        moderate_one(i)
+                # The audit log is written in the background; count its writes in this flow
+                close_audit_sink()
+
+            results["socratic"] = measure("socratic", server, db, socratic)
+            results["analysis"] = measure("analysis", server, db, analysis)
+            results["moderation"] = measure("moderation", server, db, moderation)
+            if args.goal_cache:
+                print(f"goal cache: {get_goal_cache(app.config).stats()}")
+            if args.moderation_batch:
+                print(f"moderation batches: {get_moderation_batcher(app.config).stats()}")
+    return results
+
+
+def find_regressions(results: dict, baseline: dict) -> list:
+    regressions = []
+    for flow, metrics in baseline.get("flows", {}).items():
+        for metric, expected in metrics.items():
+            actual = results.get(flow, {}).get(metric)
+            if actual is None or metric == "llmErrors":
+                continue
+            if metric == "wallSeconds" and actual < WALL_TIME_FLOOR:
+                continue
+            allowed = expected * (1 + TOLERANCES.get(metric, TOLERANCES["default"]))
+            if actual > allowed:
+                regressions.append(f"{flow}.{metric}: {actual} > {expected} (+{TOLERANCES.get(metric, TOLERANCES['default']):.0%} allowed)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--analyses', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--orgs', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05, help="median mock LLM latency in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--goal-cache', action='store_true')
+    parser.add_argument('--moderation-batch', action='store_true')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    results = run(args)
+    settings = {k: getattr(args, k) for k in ('analyses', 'concurrency', 'orgs', 'latency', 'error_rate', 'seed')}
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({"settings": settings, "flows": results}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("settings") != settings:
+        print(f"Baseline was recorded with {baseline.get('settings')}; comparing anyway.")
+
+    regressions = find_regressions(results, baseline)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if not regressions:
+        print("No regressions against the baseline.")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
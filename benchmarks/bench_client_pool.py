@@ -0,0 +1,50 @@
+# --- benchmarks/bench_client_pool.py ---
+"""Compares a fresh OpenAI client per call (the old behaviour) against the pooled process-wide client.
+
+Usage: python -m benchmarks.bench_client_pool [--calls 200]
+"""
+import argparse
+import time
+
+from openai import OpenAI
+
+from app.services.openai_client_pool import DEFAULT_HEADERS, close_openai_clients, get_openai_client
+from benchmarks.mock_openrouter import MockOpenRouterServer
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+def _run(server: MockOpenRouterServer, calls: int, client_factory) -> dict:
+    server.connections = server.requests = 0
+    started = time.perf_counter()
+    for _ in range(calls):
+        client = client_factory()
+        client.chat.completions.create(model="mock/model", messages=MESSAGES)
+    elapsed = time.perf_counter() - started
+    return {"seconds": elapsed, "per_call_ms": elapsed / calls * 1000, "connections": server.connections, "requests": server.requests}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=200)
+    args = parser.parse_args()
+
+    with MockOpenRouterServer() as server:
+        config = {'OPENROUTER_API_KEY': 'mock-key', 'OPENROUTER_BASE_URL': server.base_url}
+
+        def fresh_client():
+            return OpenAI(api_key='mock-key', base_url=server.base_url, default_headers=DEFAULT_HEADERS, timeout=45.0, max_retries=2)
+
+        fresh = _run(server, args.calls, fresh_client)
+        pooled = _run(server, args.calls, lambda: get_openai_client(config))
+        close_openai_clients()
+
+    for name, result in (("fresh client per call", fresh), ("pooled client", pooled)):
+        print(f"{name:>22}: {result['seconds']:.3f}s total, {result['per_call_ms']:.2f} ms/call, "
+              f"{result['connections']} connections for {result['requests']} requests")
+    print(f"connection reuse saved {fresh['connections'] - pooled['connections']} connections, "
+          f"{(1 - pooled['seconds'] / fresh['seconds']) * 100:.1f}% wall time")
+
+
+if __name__ == '__main__':
+    main()
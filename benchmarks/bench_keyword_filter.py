@@ -0,0 +1,78 @@
+# --- benchmarks/bench_keyword_filter.py ---
+"""Compares the old per-keyword regex scan with the compiled KeywordMatcher as the keyword list grows.
+
+The old check ran re.search(rf'\\b{keyword}\\b') for every keyword over every field. The matcher
+compiles all keywords into one trie-shaped regex and scans the fields once.
+
+Usage: python -m benchmarks.bench_keyword_filter [--sizes 27,1000,5000] [--orgs 200] [--old-orgs 20]
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from app.services.keyword_filter import DEFAULT_KEYWORDS, KeywordMatcher
+
+
+def keyword_list(size: int, rng: random.Random) -> list:
+    words = list(DEFAULT_KEYWORDS)
+    while len(words) < size:
+        words.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))))
+    return words[:size]
+
+
+def organizations(count: int, rng: random.Random) -> list:
+    vocabulary = "student club robotics science debate music art community volunteer coding math league".split()
+    orgs = []
+    for i in range(count):
+        description = " ".join(rng.choice(vocabulary) for _ in range(60))
+        if i % 10 == 0:
+            description += " Beware of this scam."  # some organizations must be caught
+        orgs.append([f"Club {i}", description, "#stem", "#community"])
+    return orgs
+
+
+def old_check(keywords: list, fields: list) -> set:
+    found = set()
+    for text in fields:
+        text_lower = text.lower()
+        for keyword in keywords:
+            if re.search(rf'\b{re.escape(keyword)}\b', text_lower):
+                found.add(keyword)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='27,1000,5000')
+    parser.add_argument('--orgs', type=int, default=200)
+    parser.add_argument('--old-orgs', type=int, default=20, help="organizations timed with the (slow) old check")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    orgs = organizations(args.orgs, rng)
+    print(f"{'keywords':>9} {'old ms/org':>11} {'new ms/org':>11} {'build ms':>9} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        keywords = keyword_list(size, rng)
+
+        sample = orgs[:args.old_orgs]
+        started = time.perf_counter()
+        old_found = [old_check(keywords, fields) for fields in sample]
+        old_ms = (time.perf_counter() - started) * 1000 / len(sample)
+
+        started = time.perf_counter()
+        matcher = KeywordMatcher(keywords)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        new_found = [set(matcher.find(fields)) for fields in orgs]
+        new_ms = (time.perf_counter() - started) * 1000 / len(orgs)
+
+        if old_found != new_found[:len(sample)]:
+            raise SystemExit(f"Matchers disagree at {size} keywords")
+        print(f"{size:>9} {old_ms:>11.3f} {new_ms:>11.3f} {build_ms:>9.1f} {old_ms / new_ms:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
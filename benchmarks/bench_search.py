@@ -0,0 +1,107 @@
+# --- benchmarks/bench_search.py ---
+"""Measures the organization search index: build, snapshot load and query latency.
+
+Indexes synthetic organizations into a temporary SearchIndex directory, then times a mix of
+one-word, multi-word, prefix, filtered and empty queries, plus a burst of incremental updates
+through the journal as another process would see them.
+
+Usage: python -m benchmarks.bench_search [--orgs 30000] [--queries 2000] [--updates 1000]
+"""
+import argparse
+import random
+import statistics
+import string
+import tempfile
+import time
+
+from app.services.search_index import SearchIndex
+
+CATEGORIES = ['STEM', 'Arts', 'Sports', 'Community Service', 'Debate', 'Music', 'Entrepreneurship', 'Environment']
+LOCATION_TYPES = ['online', 'onsite', 'hybrid']
+TOPICS = ("robotics coding science math physics chemistry biology astronomy debate music choir band art painting "
+          "photography film theater dance football basketball volunteer tutoring mentoring environment climate "
+          "recycling startup business finance leadership language english japanese writing journalism design").split()
+FILLER = ("student club weekly meetings members school community projects competitions workshops learning "
+          "friendly beginners welcome experience skills team build share practice events join together").split()
+
+
+def organizations(count: int, rng: random.Random) -> list:
+    rare = [''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 9))) for _ in range(20000)]
+    orgs = []
+    for i in range(count):
+        topics = rng.sample(TOPICS, 2)
+        words = [rng.choice(FILLER) for _ in range(40)] + [rng.choice(topics) for _ in range(5)] + [rng.choice(rare) for _ in range(5)]
+        rng.shuffle(words)
+        orgs.append((f"org{i:06d}", {
+            'name': f"{topics[0].title()} {rng.choice(['Club', 'Society', 'Team', 'Lab'])} {i}",
+            'description': ' '.join(words),
+            'tags': [f"#{t}" for t in topics],
+            'category': rng.choice(CATEGORIES),
+            'location': {'type': rng.choice(LOCATION_TYPES)},
+            'createdAt': 1_700_000_000 + i,
+        }))
+    return orgs
+
+
+def percentile(values: list, q: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orgs', type=int, default=30000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--updates', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    orgs = organizations(args.orgs, rng)
+    directory = tempfile.mkdtemp()
+
+    writer = SearchIndex(directory)
+    started = time.perf_counter()
+    writer.rebuild(orgs)
+    print(f"build + snapshot: {time.perf_counter() - started:.2f}s for {args.orgs} organizations, {writer.stats()['terms']} terms")
+
+    started = time.perf_counter()
+    reader = SearchIndex(directory)
+    print(f"snapshot load:    {time.perf_counter() - started:.2f}s")
+
+    kinds = {
+        'one word': lambda: rng.choice(TOPICS),
+        'two words': lambda: f"{rng.choice(TOPICS)} {rng.choice(FILLER)}",
+        'prefix': lambda: rng.choice(TOPICS)[:rng.randint(2, 4)],
+        'common word': lambda: rng.choice(FILLER),
+        'filtered': lambda: rng.choice(TOPICS),
+        'empty': lambda: '',
+    }
+    print(f"{'query':>12} {'facets':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'mean hits':>10}")
+    for facets in (False, True):
+        for kind, make in kinds.items():
+            timings, hits = [], []
+            for _ in range(args.queries // len(kinds)):
+                filters = {'category': [rng.choice(CATEGORIES)]} if kind == 'filtered' else None
+                query = make()
+                started = time.perf_counter()
+                result = reader.search(query, filters, facets=facets)
+                timings.append((time.perf_counter() - started) * 1000)
+                hits.append(result['nbHits'])
+            print(f"{kind:>12} {'yes' if facets else 'no':>7} {statistics.median(timings):>8.2f} {percentile(timings, 0.95):>8.2f} "
+                  f"{max(timings):>8.2f} {statistics.mean(hits):>10.0f}")
+
+    started = time.perf_counter()
+    for i in range(args.updates):
+        org_id, org = orgs[rng.randrange(len(orgs))]
+        if i % 4 == 0:
+            writer.delete(org_id)
+        else:
+            writer.upsert(org_id, {**org, 'name': f"Renamed Zyxwv {i}"})
+    update_ms = (time.perf_counter() - started) * 1000 / args.updates
+    started = time.perf_counter()
+    found = reader.search('zyxwv')['nbHits']
+    print(f"updates: {update_ms:.2f} ms each; reader caught up in {(time.perf_counter() - started) * 1000:.1f} ms "
+          f"and finds {found} renamed organizations; writer at generation {writer.stats()['generation']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+# --- benchmarks/bench_socratic_async.py ---
+"""Load test of POST /ai/api/socratic/respond: thread-bound WSGI path vs. the native async path.
+
+Fires --users concurrent answers (each one an LLM call of about --latency seconds against the
+mock OpenRouter server) and reports wall time, throughput and latency percentiles per path.
+
+The WSGI path runs the Flask route through asgiref's WsgiToAsgi, as run.py serves it, when asgiref
+is installed; otherwise it runs the Flask app on a pool of --sync-threads threads, like a threaded
+WSGI server. The async path runs the same request through app.asgi.AsyncRouter on one event loop.
+
+Usage:
+    python -m benchmarks.bench_socratic_async [--users 200] [--latency 0.5] [--sync-threads 8]
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from app.asgi import AsyncRouter
+from app.extensions import db
+from app.routes.ai import ai_bp
+from app.services.ai_analysis_service import AIAnalysisService
+from app.services.openai_service import OpenAIService
+from benchmarks.bench_analysis import GOAL, build_app
+from benchmarks.fake_firestore import AsyncInMemoryFirestore, InMemoryFirestore
+from benchmarks.mock_openrouter import MockOpenRouterServer
+
+ANSWER = "Mostly hands-on projects and mentorship."
+
+
+async def _not_found(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _report(name: str, wall: float, latencies: list, statuses: list) -> dict:
+    ok = sum(1 for status in statuses if status == 200)
+    result = {
+        "wallSeconds": round(wall, 3),
+        "requestsPerSecond": round(len(statuses) / wall, 1),
+        "p50Ms": int(_percentile(latencies, 0.5) * 1000),
+        "p95Ms": int(_percentile(latencies, 0.95) * 1000),
+        "ok": ok,
+        "failed": len(statuses) - ok,
+    }
+    print(f"{name:>6}: " + ", ".join(f"{k}={v}" for k, v in result.items()))
+    return result
+
+
+async def _drive_asgi(asgi_app, cookie: str, session_ids: list) -> tuple:
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies={'session': cookie}, timeout=120) as client:
+        async def one(session_id):
+            started = time.perf_counter()
+            response = await client.post('/ai/api/socratic/respond', json={'sessionId': session_id, 'answer': ANSWER})
+            return time.perf_counter() - started, response.status_code
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(session_id) for session_id in session_ids))
+        return time.perf_counter() - started, [r[0] for r in results], [r[1] for r in results]
+
+
+def _drive_threads(app, cookie: str, session_ids: list, threads: int) -> tuple:
+    def one(session_id):
+        client = app.test_client()
+        client.set_cookie('session', cookie)
+        started = time.perf_counter()
+        response = client.post('/ai/api/socratic/respond', json={'sessionId': session_id, 'answer': ANSWER})
+        return time.perf_counter() - started, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(one, session_ids))
+    return time.perf_counter() - started, [r[0] for r in results], [r[1] for r in results]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.5, help="mock LLM latency in seconds")
+    parser.add_argument('--sync-threads', type=int, default=8, help="threads for the WSGI path when asgiref is missing")
+    args = parser.parse_args()
+
+    with MockOpenRouterServer(latency=args.latency) as server:
+        app = build_app(server.base_url)
+        # Let the guard admit every user at once: the test measures the request path, not the limiter
+        app.config.update(
+            OPENROUTER_CONCURRENCY_INITIAL=args.users,
+            OPENROUTER_CONCURRENCY_MAX=args.users,
+            OPENROUTER_POOL_MAX_CONNECTIONS=args.users,
+        )
+        app.register_blueprint(ai_bp, url_prefix='/ai')
+        store = InMemoryFirestore()
+        db.client = store
+        db.async_client = AsyncInMemoryFirestore(store)
+        cookie = app.session_interface.get_signing_serializer(app).dumps({'user_id': 'bench-user'})
+
+        def new_sessions() -> list:
+            with app.app_context():
+                service = AIAnalysisService(store, OpenAIService())
+                return [service.start_socratic_session('bench-user', GOAL)["sessionId"] for _ in range(args.users)]
+
+        results = {}
+        try:
+            from asgiref.wsgi import WsgiToAsgi
+            wall, latencies, statuses = asyncio.run(_drive_asgi(WsgiToAsgi(app), cookie, new_sessions()))
+            label = "WsgiToAsgi"
+        except ImportError:
+            wall, latencies, statuses = _drive_threads(app, cookie, new_sessions(), args.sync_threads)
+            label = f"{args.sync_threads} WSGI threads"
+        print(f"WSGI path ({label}):")
+        results["wsgi"] = _report("wsgi", wall, latencies, statuses)
+
+        wall, latencies, statuses = asyncio.run(_drive_asgi(AsyncRouter(app, _not_found), cookie, new_sessions()))
+        print("Async path (AsyncRouter, one event loop):")
+        results["async"] = _report("async", wall, latencies, statuses)
+
+    gain = results["async"]["requestsPerSecond"] / max(results["wsgi"]["requestsPerSecond"], 0.001)
+    print(f"Concurrency gain: {gain:.1f}x requests/second")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+# --- benchmarks/fake_firestore.py ---
+"""An in-memory stand-in for the parts of the Firestore client this app uses, with op counters.
+
+Counts documents read, documents written and network round trips, which is what the benchmarks
+report. Supports dotted-path updates, where/order_by/limit/start_after/select queries, batches and
+last-update-time preconditions (write_option).
+"""
+import copy
+import itertools
+import threading
+
+from google.api_core.exceptions import FailedPrecondition
+
+_ids = itertools.count(1)
+
+_OPS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a is not None and a < b,
+    '<=': lambda a, b: a is not None and a <= b,
+    '>': lambda a, b: a is not None and a > b,
+    '>=': lambda a, b: a is not None and a >= b,
+    'in': lambda a, b: a in b,
+    'array_contains': lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+def _get_path(data: dict, path: str):
+    for part in path.split('.'):
+        if not isinstance(data, dict) or part not in data:
+            return None
+        data = data[part]
+    return data
+
+
+def _set_path(data: dict, path: str, value):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        if not isinstance(data.get(part), dict):
+            data[part] = {}
+        data = data[part]
+    data[parts[-1]] = value
+
+
+class LastUpdateOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+class InMemoryFirestore:
+    def __init__(self):
+        self._data = {}
+        # Stand-in for each document's update_time: a counter bumped on every write
+        self._update_times = {}
+        self._clock = itertools.count(1)
+        self._lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+        self.round_trips = 0
+
+    def collection(self, name: str):
+        return CollectionReference(self, name)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def write_option(self, last_update_time=None):
+        return LastUpdateOption(last_update_time)
+
+    def reset_counters(self):
+        self.reads = self.writes = self.round_trips = 0
+
+    def stats(self) -> dict:
+        return {"reads": self.reads, "writes": self.writes, "roundTrips": self.round_trips}
+
+    def _docs(self, collection: str) -> dict:
+        return self._data.setdefault(collection, {})
+
+    def _write(self, collection: str, doc_id: str, fn, round_trip: bool = True):
+        with self._lock:
+            self.writes += 1
+            if round_trip:
+                self.round_trips += 1
+            fn(self._docs(collection), doc_id)
+            self._update_times[(collection, doc_id)] = next(self._clock)
+
+    def _check(self, collection: str, doc_id: str, option):
+        if option is not None and self._update_times.get((collection, doc_id)) != option.last_update_time:
+            raise FailedPrecondition(f"{collection}/{doc_id} changed since {option.last_update_time}")
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.update_time = update_time
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field_path: str):
+        return _get_path(self._data or {}, field_path)
+
+
+class DocumentReference:
+    def __init__(self, db: InMemoryFirestore, collection: str, doc_id: str):
+        self._db = db
+        self._collection = collection
+        self.id = doc_id
+
+    def get(self):
+        with self._db._lock:
+            self._db.reads += 1
+            self._db.round_trips += 1
+            data = self._db._docs(self._collection).get(self.id)
+            return DocumentSnapshot(self, copy.deepcopy(data), self._db._update_times.get((self._collection, self.id)))
+
+    def set(self, data: dict, merge: bool = False, _round_trip: bool = True):
+        def apply(docs, doc_id):
+            if merge and doc_id in docs:
+                for key, value in data.items():
+                    docs[doc_id][key] = copy.deepcopy(value)
+            else:
+                docs[doc_id] = copy.deepcopy(data)
+        self._db._write(self._collection, self.id, apply, _round_trip)
+
+    def update(self, fields: dict, option=None, _round_trip: bool = True):
+        def apply(docs, doc_id):
+            self._db._check(self._collection, doc_id, option)
+            if doc_id not in docs:
+                raise KeyError(f"No document to update: {self._collection}/{doc_id}")
+            for path, value in fields.items():
+                _set_path(docs[doc_id], path, copy.deepcopy(value))
+        self._db._write(self._collection, self.id, apply, _round_trip)
+
+    def delete(self, _round_trip: bool = True):
+        self._db._write(self._collection, self.id, lambda docs, doc_id: docs.pop(doc_id, None), _round_trip)
+
+
+class Query:
+    def __init__(self, db: InMemoryFirestore, collection: str):
+        self._db = db
+        self._collection = collection
+        self._filters = []
+        self._orders = []
+        self._limit = None
+        self._start_after = None
+        self._fields = None
+
+    def _copy(self):
+        query = copy.copy(self)
+        query._filters = list(self._filters)
+        query._orders = list(self._orders)
+        return query
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        query = self._copy()
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        query._filters.append((field_path, op_string, value))
+        return query
+
+    def order_by(self, field_path: str, direction: str = 'ASCENDING'):
+        query = self._copy()
+        query._orders.append((field_path, direction))
+        return query
+
+    def limit(self, count: int):
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def start_after(self, document_fields):
+        query = self._copy()
+        query._start_after = document_fields
+        return query
+
+    def select(self, field_paths):
+        query = self._copy()
+        query._fields = list(field_paths)
+        return query
+
+    def _sort_key(self, doc_id: str, data: dict):
+        return [doc_id if field == '__name__' else _get_path(data, field) for field, _ in self._orders]
+
+    def stream(self):
+        with self._db._lock:
+            self._db.round_trips += 1
+            docs = [(doc_id, copy.deepcopy(data)) for doc_id, data in self._db._docs(self._collection).items()]
+            update_times = {doc_id: self._db._update_times.get((self._collection, doc_id)) for doc_id, _ in docs}
+        docs = [(doc_id, data) for doc_id, data in docs
+                if all(_OPS[op](_get_path(data, field), value) for field, op, value in self._filters)]
+        if self._orders:
+            # Apply the orderings from the last to the first so the sort is lexicographic
+            for index in range(len(self._orders) - 1, -1, -1):
+                field, direction = self._orders[index]
+                docs.sort(key=lambda item: _sortable(item[0] if field == '__name__' else _get_path(item[1], field)),
+                          reverse=direction == 'DESCENDING')
+        if self._start_after is not None:
+            cursor = self._cursor_values()
+            docs = [item for item in docs if self._is_after(self._sort_key(*item), cursor)]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        for doc_id, data in docs:
+            with self._db._lock:
+                self._db.reads += 1
+            if self._fields is not None:
+                projected = {}
+                for field in self._fields:
+                    value = _get_path(data, field)
+                    if value is not None:
+                        _set_path(projected, field, value)
+                data = projected
+            yield DocumentSnapshot(DocumentReference(self._db, self._collection, doc_id), data, update_times[doc_id])
+
+    def get(self):
+        return list(self.stream())
+
+    def _cursor_values(self) -> list:
+        cursor = self._start_after
+        if isinstance(cursor, DocumentSnapshot):
+            return self._sort_key(cursor.id, cursor._data or {})
+        if isinstance(cursor, dict):
+            return [cursor.get(field) for field, _ in self._orders]
+        return list(cursor)
+
+    def _is_after(self, key: list, cursor: list) -> bool:
+        for (field, direction), value, bound in zip(self._orders, key, cursor):
+            value, bound = _sortable(value), _sortable(bound)
+            if value == bound:
+                continue
+            return value < bound if direction == 'DESCENDING' else value > bound
+        return False
+
+
+def _sortable(value):
+    # None sorts first, then everything else by its natural order
+    return (value is not None, value if value is not None else 0)
+
+
+class CollectionReference(Query):
+    def __init__(self, db: InMemoryFirestore, name: str):
+        super().__init__(db, name)
+        self.id = name
+
+    def document(self, doc_id: str = None):
+        return DocumentReference(self._db, self._collection, doc_id or f"doc{next(_ids):08d}")
+
+
+class WriteBatch:
+    """Applies its operations in one round trip on commit; Firestore caps a batch at 500 writes."""
+
+    MAX_OPERATIONS = 500
+
+    def __init__(self, db: InMemoryFirestore):
+        self._db = db
+        self._operations = []
+        self._preconditions = []
+
+    def __len__(self):
+        return len(self._operations)
+
+    def _add(self, operation):
+        if len(self._operations) >= self.MAX_OPERATIONS:
+            raise ValueError("Batch is full (500 operations).")
+        self._operations.append(operation)
+
+    def set(self, reference: DocumentReference, data: dict, merge: bool = False):
+        self._add(lambda: reference.set(data, merge=merge, _round_trip=False))
+
+    def update(self, reference: DocumentReference, fields: dict, option=None):
+        # Preconditions are checked up front in commit(), against the state before the batch
+        self._add(lambda: reference.update(fields, _round_trip=False))
+        if option is not None:
+            self._preconditions.append((reference, option))
+
+    def delete(self, reference: DocumentReference):
+        self._add(lambda: reference.delete(_round_trip=False))
+
+    def commit(self):
+        with self._db._lock:
+            self._db.round_trips += 1
+            # All or nothing, like Firestore: a failed precondition rejects the whole batch
+            for reference, option in self._preconditions:
+                self._db._check(reference._collection, reference.id, option)
+            for operation in self._operations:
+                operation()
+        self._operations = []
+        self._preconditions = []
+
+
+class AsyncInMemoryFirestore:
+    """The google.cloud.firestore.AsyncClient shape over an InMemoryFirestore (documents only).
+
+    Shares data and counters with the wrapped store, so sync and async code paths see the same documents.
+    """
+
+    def __init__(self, store: InMemoryFirestore):
+        self.store = store
+
+    def collection(self, name: str):
+        return AsyncCollectionReference(self.store.collection(name))
+
+
+class AsyncCollectionReference:
+    def __init__(self, collection: CollectionReference):
+        self._collection = collection
+        self.id = collection.id
+
+    def document(self, doc_id: str = None):
+        return AsyncDocumentReference(self._collection.document(doc_id))
+
+
+class AsyncDocumentReference:
+    def __init__(self, reference: DocumentReference):
+        self._reference = reference
+        self.id = reference.id
+
+    async def get(self):
+        return self._reference.get()
+
+    async def set(self, data: dict, merge: bool = False):
+        self._reference.set(data, merge=merge)
+
+    async def update(self, fields: dict):
+        self._reference.update(fields)
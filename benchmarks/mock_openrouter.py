@@ -0,0 +1,256 @@
+# --- benchmarks/mock_openrouter.py ---
+"""A local stand-in for OpenRouter's OpenAI-compatible /chat/completions API.
+
+Supports per-model latency distributions, injected error rates, streaming (SSE) responses and
+JSON-mode bodies shaped for the prompts this app sends (consensus checks, moderation, digests).
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Latency:
+    """Latency distributions in seconds; each returns a callable taking a random.Random."""
+
+    @staticmethod
+    def constant(seconds: float):
+        return lambda rng: seconds
+
+    @staticmethod
+    def uniform(low: float, high: float):
+        return lambda rng: rng.uniform(low, high)
+
+    @staticmethod
+    def lognormal(median: float, sigma: float):
+        # median of a lognormal is exp(mu)
+        import math
+        mu = math.log(median) if median > 0 else 0.0
+        return lambda rng: rng.lognormvariate(mu, sigma) if median > 0 else 0.0
+
+
+def default_json_responder(request: dict, rng: random.Random) -> dict:
+    """Builds a plausible JSON-mode answer from what the prompt asks for."""
+    prompt = request["messages"][-1]["content"] if request.get("messages") else ""
+    if "'consensus'" in prompt:
+        return {"consensus": True, "recommendation": "Pursue the most consistent recommendation.", "reasoning": "All experts converge."}
+    if '"results"' in prompt and "Items:\n" in prompt:
+        items = json.loads(prompt.split("Items:\n", 1)[1].strip())
+        return {"results": [{"id": item["id"], "approved": True, "confidence": 95, "reasons": []} for item in items]}
+    if '"approved"' in prompt:
+        return {"approved": True, "confidence": 95, "reasons": []}
+    if "Condense each expert" in prompt:
+        analyses = json.loads(prompt.split("Analyses:\n", 1)[1]) if "Analyses:\n" in prompt else {}
+        return {name: " ".join(text.split()[:30]) for name, text in analyses.items()}
+    return {"result": "ok"}
+
+
+def default_text_responder(request: dict, rng: random.Random) -> str:
+    model = request.get("model", "mock")
+    return f"Mock analysis from {model}: focus on concrete experience, mentorship and a realistic weekly schedule."
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(re.findall(r"\S+", text)))
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    # The stdlib default backlog of 5 resets connections under the async load test's bursts
+    request_queue_size = 256
+
+
+class MockOpenRouterServer:
+    """Serves chat completions on 127.0.0.1 and counts connections, requests and tokens."""
+
+    def __init__(self, latency: float = 0.0, content: str = None, model_latency: dict = None,
+                 error_rate: float = 0.0, error_status: int = 500, seed: int = 0,
+                 json_responder=default_json_responder, text_responder=None, stream_chunk_words: int = 3):
+        self.latency = Latency.constant(latency) if isinstance(latency, (int, float)) else latency
+        self.model_latency = model_latency or {}
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.json_responder = json_responder
+        self.text_responder = text_responder or ((lambda request, rng: content) if content else default_text_responder)
+        self.stream_chunk_words = stream_chunk_words
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.requests_by_model = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = _HTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address
+        return f"http://{host}:{port}/api/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counters(self):
+        with self._lock:
+            self.connections = self.requests = self.errors = 0
+            self.prompt_tokens = self.completion_tokens = 0
+            self.requests_by_model = {}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "connections": self.connections,
+                "promptTokens": self.prompt_tokens,
+                "completionTokens": self.completion_tokens,
+                "requestsByModel": dict(self.requests_by_model),
+            }
+
+    # --- request handling ---
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _plan(self, request: dict):
+        """Decides latency, failure and content for one request under the lock (deterministic per seed)."""
+        model = request.get("model", "mock")
+        with self._lock:
+            self.requests += 1
+            self.requests_by_model[model] = self.requests_by_model.get(model, 0) + 1
+            delay = self.model_latency.get(model, self.latency)(self._rng)
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+                return delay, True, None
+            if (request.get("response_format") or {}).get("type") == "json_object":
+                content = json.dumps(self.json_responder(request, self._rng))
+            else:
+                content = self.text_responder(request, self._rng)
+            self.prompt_tokens += sum(count_tokens(m.get("content") or "") for m in request.get("messages", []))
+            self.completion_tokens += count_tokens(content)
+        return delay, False, content
+
+    def completion_body(self, request: dict, content: str) -> dict:
+        prompt_tokens = sum(count_tokens(m.get("content") or "") for m in request.get("messages", []))
+        completion_tokens = count_tokens(content)
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def stream_chunks(self, request: dict, content: str):
+        words = content.split(" ")
+        for i in range(0, len(words), self.stream_chunk_words):
+            piece = " ".join(words[i:i + self.stream_chunk_words])
+            if i + self.stream_chunk_words < len(words):
+                piece += " "
+            yield {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+        yield {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        if (request.get("stream_options") or {}).get("include_usage"):
+            body = self.completion_body(request, content)
+            yield {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "mock"),
+                "choices": [],
+                "usage": body["usage"],
+            }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is observable
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                server._count('connections')  # one handler instance per TCP connection
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length) or b'{}')
+                delay, fail, content = server._plan(request)
+
+                if fail:
+                    if delay:
+                        time.sleep(delay)
+                    self._send_json(server.error_status, {"error": {"message": "Mock upstream failure", "code": server.error_status}})
+                    return
+
+                if request.get("stream"):
+                    self._send_stream(request, content, delay)
+                    return
+                if delay:
+                    time.sleep(delay)
+                self._send_json(200, server.completion_body(request, content))
+
+            def _send_json(self, status: int, payload: dict):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_stream(self, request: dict, content: str, delay: float):
+                chunks = list(server.stream_chunks(request, content))
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                # Spread the latency over the chunks so time-to-first-token is realistic
+                per_chunk = delay / len(chunks) if chunks else 0
+                try:
+                    for chunk in chunks:
+                        if per_chunk:
+                            time.sleep(per_chunk)
+                        self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self._write_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # the client cancelled the generation
+
+            def _write_chunk(self, data: bytes):
+                self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -1,5 +1,6 @@
 # --- config.py (NEW) ---
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -26,7 +27,155 @@ class Config:
         "glm": "glm-4.5-air",
         "grok": "xai/grok-4"
     }
+    # Process-wide HTTP connection pool shared by every OpenAIService instance.
+    # HTTP/2 additionally requires the optional 'h2' package (pip install httpx[http2]).
+    OPENROUTER_POOL_MAX_CONNECTIONS = int(os.environ.get('OPENROUTER_POOL_MAX_CONNECTIONS', 100))
+    OPENROUTER_POOL_MAX_KEEPALIVE = int(os.environ.get('OPENROUTER_POOL_MAX_KEEPALIVE', 20))
+    OPENROUTER_POOL_KEEPALIVE_EXPIRY = float(os.environ.get('OPENROUTER_POOL_KEEPALIVE_EXPIRY', 60))
+    OPENROUTER_HTTP2 = os.environ.get('OPENROUTER_HTTP2', 'false').lower() == 'true'
+    # Hedged requests: a call still running after its model's rolling p95 latency (but at least
+    # OPENROUTER_HEDGE_MIN_DELAY seconds) is duplicated to the equivalent model id listed here.
+    OPENROUTER_HEDGE_MODELS = json.loads(os.environ.get('OPENROUTER_HEDGE_MODELS', json.dumps({
+        "deepseek/deepseek-chat": "deepseek/deepseek-chat-v3-0324",
+    })))
+    OPENROUTER_HEDGE_MIN_SAMPLES = int(os.environ.get('OPENROUTER_HEDGE_MIN_SAMPLES', 20))
+    OPENROUTER_HEDGE_MIN_DELAY = float(os.environ.get('OPENROUTER_HEDGE_MIN_DELAY', 1.0))
+    OPENROUTER_LATENCY_WINDOW = int(os.environ.get('OPENROUTER_LATENCY_WINDOW', 200))
+    # Per-model circuit breaker, shared across processes ('redis') or per process ('local').
+    # After N consecutive failures calls fail fast for RESET_TIMEOUT seconds, then one probe is let through.
+    OPENROUTER_BREAKER_BACKEND = os.environ.get('OPENROUTER_BREAKER_BACKEND', 'redis')
+    OPENROUTER_BREAKER_REDIS_URL = os.environ.get('OPENROUTER_BREAKER_REDIS_URL', CELERY_BROKER_URL)
+    OPENROUTER_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('OPENROUTER_BREAKER_FAILURE_THRESHOLD', 5))
+    OPENROUTER_BREAKER_RESET_TIMEOUT = float(os.environ.get('OPENROUTER_BREAKER_RESET_TIMEOUT', 30))
+    # Adaptive (AIMD) in-flight limit per model and process, and the longest a call waits for a slot.
+    OPENROUTER_CONCURRENCY_INITIAL = int(os.environ.get('OPENROUTER_CONCURRENCY_INITIAL', 8))
+    OPENROUTER_CONCURRENCY_MIN = int(os.environ.get('OPENROUTER_CONCURRENCY_MIN', 1))
+    OPENROUTER_CONCURRENCY_MAX = int(os.environ.get('OPENROUTER_CONCURRENCY_MAX', 64))
+    OPENROUTER_CONCURRENCY_MAX_WAIT = float(os.environ.get('OPENROUTER_CONCURRENCY_MAX_WAIT', 5))
+    # Cluster-wide token buckets in front of OpenRouter ('redis', 'local' or 'none').
+    # Rates are requests/second; OPENROUTER_MODEL_RATES maps a model id to [rate, burst].
+    OPENROUTER_RATE_LIMIT_BACKEND = os.environ.get('OPENROUTER_RATE_LIMIT_BACKEND', 'redis')
+    OPENROUTER_RATE_LIMIT_REDIS_URL = os.environ.get('OPENROUTER_RATE_LIMIT_REDIS_URL', CELERY_BROKER_URL)
+    OPENROUTER_GLOBAL_RATE = float(os.environ.get('OPENROUTER_GLOBAL_RATE', 10))
+    OPENROUTER_GLOBAL_BURST = float(os.environ.get('OPENROUTER_GLOBAL_BURST', 20))
+    OPENROUTER_MODEL_RATES = json.loads(os.environ.get('OPENROUTER_MODEL_RATES', '{}'))
+    # Share of each bucket a priority class must leave untouched, and its longest wait (seconds)
+    # before the call is shed. Interactive socratic calls beat analysis, which beats moderation.
+    OPENROUTER_PRIORITY_RESERVES = {"interactive": 0.0, "analysis": 0.2, "background": 0.5}
+    OPENROUTER_PRIORITY_MAX_WAIT = {"interactive": 10.0, "analysis": 30.0, "background": 5.0}
+
+    # AI Analysis Pipeline Configuration
+    # Max personas queried at once for a single analysis, and the deadlines (seconds)
+    # applied to each persona call and to the whole round-table stage.
+    AI_DEBATE_MAX_CONCURRENCY = int(os.environ.get('AI_DEBATE_MAX_CONCURRENCY', 4))
+    AI_PERSONA_TIMEOUT = float(os.environ.get('AI_PERSONA_TIMEOUT', 45))
+    AI_DEBATE_STAGE_TIMEOUT = float(os.environ.get('AI_DEBATE_STAGE_TIMEOUT', 60))
+    # Same limits for the persona revisions inside each consensus round.
+    AI_CONSENSUS_MAX_CONCURRENCY = int(os.environ.get('AI_CONSENSUS_MAX_CONCURRENCY', 4))
+    AI_CONSENSUS_ROUND_TIMEOUT = float(os.environ.get('AI_CONSENSUS_ROUND_TIMEOUT', 60))
+    # Revision prompts above this many tokens have peer responses replaced by compact digests
+    # (at most AI_DIGEST_MAX_WORDS words each). Set the budget to 0 to always send full text.
+    AI_CONSENSUS_PROMPT_TOKEN_BUDGET = int(os.environ.get('AI_CONSENSUS_PROMPT_TOKEN_BUDGET', 3000))
+    AI_DIGEST_MAX_WORDS = int(os.environ.get('AI_DIGEST_MAX_WORDS', 120))
+    # Opt-in local consensus pre-check: mean pairwise TF-IDF similarity of the revised responses at
+    # or above AGREE settles consensus, at or below DISAGREE settles disagreement, both without an
+    # LLM call. Only scores in between are sent to the consensus model. Off by default: it judges
+    # wording rather than substance, and an 'agree' round's recommendation is the most central
+    # expert's own analysis instead of a synthesized consensus.
+    AI_CONSENSUS_PRECHECK_ENABLED = os.environ.get('AI_CONSENSUS_PRECHECK_ENABLED', 'false').lower() == 'true'
+    AI_CONSENSUS_AGREE_THRESHOLD = float(os.environ.get('AI_CONSENSUS_AGREE_THRESHOLD', 0.85))
+    AI_CONSENSUS_DISAGREE_THRESHOLD = float(os.environ.get('AI_CONSENSUS_DISAGREE_THRESHOLD', 0.15))
+    # Opt-in near-duplicate goal cache: an analysis whose refined goal's SimHash is at least
+    # THRESHOLD similar (share of matching bits) to a completed one from the last MAX_AGE seconds
+    # reuses its persona responses and only runs a personalization call on PERSONALIZE_MODEL.
+    # The index is a JSON file local to each host.
+    AI_GOAL_CACHE_ENABLED = os.environ.get('AI_GOAL_CACHE_ENABLED', 'false').lower() == 'true'
+    AI_GOAL_CACHE_PATH = os.environ.get('AI_GOAL_CACHE_PATH', 'instance/goal_cache.json')
+    AI_GOAL_CACHE_THRESHOLD = float(os.environ.get('AI_GOAL_CACHE_THRESHOLD', 0.9))
+    AI_GOAL_CACHE_MAX_ENTRIES = int(os.environ.get('AI_GOAL_CACHE_MAX_ENTRIES', 200))
+    AI_GOAL_CACHE_MAX_AGE = int(os.environ.get('AI_GOAL_CACHE_MAX_AGE', 7 * 24 * 3600))
+    AI_GOAL_CACHE_PERSONALIZE_MODEL = os.environ.get('AI_GOAL_CACHE_PERSONALIZE_MODEL', 'deepseek')
+    # Session documents are written in coalesced batches: flushed at every stage boundary,
+    # or earlier once this many fields are queued or the oldest queued field is this old (seconds).
+    AI_SESSION_WRITE_MAX_FIELDS = int(os.environ.get('AI_SESSION_WRITE_MAX_FIELDS', 50))
+    AI_SESSION_WRITE_MAX_DELAY = float(os.environ.get('AI_SESSION_WRITE_MAX_DELAY', 5))
+    # Run each analysis as a Celery task graph (per-persona subtasks spread over the workers)
+    # instead of one long task that fans out on threads. Off by default: each chord waits for every
+    # persona task, retries included, so AI_DEBATE_STAGE_TIMEOUT, AI_CONSENSUS_ROUND_TIMEOUT and
+    # AI_DEBATE_MAX_CONCURRENCY only apply to the threaded flow.
+    AI_ANALYSIS_DISTRIBUTED = os.environ.get('AI_ANALYSIS_DISTRIBUTED', 'false').lower() == 'true'
+    # Serve /ai/api/socratic/start and /respond from native async handlers (app/asgi.py), so an
+    # ASGI worker waits on the LLM without tying up the thread that runs the Flask app.
+    AI_ASYNC_SOCRATIC = os.environ.get('AI_ASYNC_SOCRATIC', 'true').lower() == 'true'
+    # Live analysis progress: 'redis' (pub/sub, works across processes), 'local' (single process) or 'none'
+    AI_PROGRESS_BACKEND = os.environ.get('AI_PROGRESS_BACKEND', 'redis')
+    AI_PROGRESS_REDIS_URL = os.environ.get('AI_PROGRESS_REDIS_URL', CELERY_BROKER_URL)
+
+    # LLM Response Cache
+    # Identical (model, messages, temperature, max_tokens, json) requests are answered from cache.
+    # Only JSON-mode calls (moderation verdicts, consensus and digest checks) unless LLM_CACHE_FREE_TEXT
+    # is set: persona and socratic generations are sampled at temperature 0.7 and the cache is shared
+    # across users, so caching them would replay the same "independent" answers to every re-run.
+    LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+    LLM_CACHE_FREE_TEXT = os.environ.get('LLM_CACHE_FREE_TEXT', 'false').lower() == 'true'
+    LLM_CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    LLM_CACHE_DEFAULT_TTL = int(os.environ.get('LLM_CACHE_DEFAULT_TTL', 6 * 60 * 60))
+    # Per-model TTL overrides in seconds, keyed by model id; 0 disables caching for that model.
+    LLM_CACHE_MODEL_TTLS = json.loads(os.environ.get('LLM_CACHE_MODEL_TTLS', '{}'))
+    LLM_CACHE_REDIS_URL = os.environ.get('LLM_CACHE_REDIS_URL', CELERY_BROKER_URL)
+    # Stream JSON-mode decisions (consensus checks, moderation) and stop generating once the
+    # deciding field has arrived; 'false' waits for the whole response instead.
+    LLM_JSON_EARLY_STOP = os.environ.get('LLM_JSON_EARLY_STOP', 'true').lower() == 'true'
+
+    # Blocked keywords for the basic moderation filter: one term or phrase per line. The file is
+    # re-read when it changes (checked every RELOAD_INTERVAL seconds); unset uses the built-in list.
+    MODERATION_KEYWORDS_PATH = os.environ.get('MODERATION_KEYWORDS_PATH')
+    MODERATION_KEYWORDS_RELOAD_INTERVAL = float(os.environ.get('MODERATION_KEYWORDS_RELOAD_INTERVAL', 30))
+    # Micro-batched AI moderation: concurrent checks in one process are sent as a single request of
+    # up to BATCH_SIZE items, waiting at most BATCH_MAX_WAIT_MS for a batch to fill. Only pays off
+    # when a process moderates concurrently (web threads, threaded or gevent Celery pools); it is
+    # skipped in prefork Celery pool children (the default pool), which run one task at a time.
+    MODERATION_BATCH_ENABLED = os.environ.get('MODERATION_BATCH_ENABLED', 'false').lower() == 'true'
+    MODERATION_BATCH_SIZE = int(os.environ.get('MODERATION_BATCH_SIZE', 8))
+    MODERATION_BATCH_MAX_WAIT_MS = float(os.environ.get('MODERATION_BATCH_MAX_WAIT_MS', 50))
+    MODERATION_BATCH_MAX_IN_FLIGHT = int(os.environ.get('MODERATION_BATCH_MAX_IN_FLIGHT', 4))
+    # Moderation audit log: comma-separated sinks, 'firestore' (batched writes to moderation_logs),
+    # 'segments' (size-rotated local JSONL files, see `python -m app.services.audit_sink`) or 'none'.
+    # Records are written in the background once BATCH_SIZE are waiting or after FLUSH_INTERVAL seconds.
+    MODERATION_AUDIT_SINK = os.environ.get('MODERATION_AUDIT_SINK', 'firestore')
+    MODERATION_AUDIT_BATCH_SIZE = int(os.environ.get('MODERATION_AUDIT_BATCH_SIZE', 500))
+    MODERATION_AUDIT_FLUSH_INTERVAL = float(os.environ.get('MODERATION_AUDIT_FLUSH_INTERVAL', 2.0))
+    MODERATION_AUDIT_MAX_BUFFER = int(os.environ.get('MODERATION_AUDIT_MAX_BUFFER', 10000))
+    MODERATION_AUDIT_SEGMENT_DIR = os.environ.get('MODERATION_AUDIT_SEGMENT_DIR', 'instance/moderation_audit')
+    MODERATION_AUDIT_SEGMENT_MAX_BYTES = int(os.environ.get('MODERATION_AUDIT_SEGMENT_MAX_BYTES', 64 * 1024 * 1024))
+    MODERATION_AUDIT_COMPRESS = os.environ.get('MODERATION_AUDIT_COMPRESS', 'true').lower() == 'true'
+    # Default LLM request rate (batched requests per second) for `flask remoderate-organizations`
+    MODERATION_BULK_LLM_RATE = float(os.environ.get('MODERATION_BULK_LLM_RATE', 2.0))
+
+    # Metrics (/metrics, Prometheus text format)
+    # 'redis' aggregates stage and LLM metrics from every web and Celery worker; 'local' is per process.
+    METRICS_BACKEND = os.environ.get('METRICS_BACKEND', 'redis')
+    METRICS_REDIS_URL = os.environ.get('METRICS_REDIS_URL', CELERY_BROKER_URL)
+    # When set, scrapers must send 'Authorization: Bearer <token>'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
     
+    # Built-in organization search (/api/organizations/search): an index shared by every process on
+    # the host through a snapshot and a journal in SEARCH_INDEX_DIR, compacted once the journal
+    # passes COMPACT_BYTES. Built from Firestore on first use; `flask rebuild-search-index` redoes it.
+    SEARCH_INDEX_ENABLED = os.environ.get('SEARCH_INDEX_ENABLED', 'true').lower() == 'true'
+    SEARCH_INDEX_DIR = os.environ.get('SEARCH_INDEX_DIR', 'instance/search_index')
+    SEARCH_INDEX_COMPACT_BYTES = int(os.environ.get('SEARCH_INDEX_COMPACT_BYTES', 4 * 1024 * 1024))
+    # The journal is shared through local files only; verdicts written by Celery workers on other
+    # hosts reach this host's index through a catch-up from Firestore (updatedAt since the last one)
+    # run by the search route at most this often. 0 disables it (single-host deployments).
+    SEARCH_INDEX_FIRESTORE_SYNC_SECONDS = float(os.environ.get('SEARCH_INDEX_FIRESTORE_SYNC_SECONDS', 60))
+    SEARCH_MAX_HITS_PER_PAGE = int(os.environ.get('SEARCH_MAX_HITS_PER_PAGE', 100))
+
+    # /api/organizations page size: ?limit= defaults to ORGANIZATIONS_PAGE_SIZE and is capped at
+    # ORGANIZATIONS_MAX_PAGE_SIZE; further pages are fetched with the returned nextPageToken.
+    ORGANIZATIONS_PAGE_SIZE = int(os.environ.get('ORGANIZATIONS_PAGE_SIZE', 20))
+    ORGANIZATIONS_MAX_PAGE_SIZE = int(os.environ.get('ORGANIZATIONS_MAX_PAGE_SIZE', 100))
+
     # Algolia Configuration (from original code)
     ALGOLIA_APP_ID = os.environ.get('ALGOLIA_APP_ID', '')
     ALGOLIA_SEARCH_KEY = os.environ.get('ALGOLIA_SEARCH_KEY', '')
@@ -3,6 +3,7 @@ import os
 from app import create_app
 from dotenv import load_dotenv
 from asgiref.wsgi import WsgiToAsgi # MODIFIED: Import the standard ASGI wrapper
+from app.asgi import AsyncRouter
 
 load_dotenv()
 
@@ -14,7 +15,8 @@ wsgi_app = create_app(env_name)
 
 # MODIFIED: Wrap the WSGI app using the standard `asgiref` library
 # This creates a reliable ASGI-compatible application for Gunicorn/Uvicorn.
-app = WsgiToAsgi(wsgi_app)
+# The LLM-bound socratic endpoints are served natively async in front of it (see app/asgi.py).
+app = AsyncRouter(wsgi_app, WsgiToAsgi(wsgi_app))
 
 
 if __name__ == '__main__':
@@ -58,14 +58,20 @@ async function loadUserOwnedOrganizations() {
         // In a real app, this would be an API call like `/api/organizations?ownerId=${currentUser.uid}`
         // For now, we simulate this by filtering the combined list later.
         // This function will primarily populate the "Available Organizations" list.
-        const response = await fetch('/api/organizations'); // Fetching a general list for demo
-        const data = await response.json();
-        if (data.success) {
-            // Filter for organizations owned by the current user
-            userOrganizations = data.data.filter(org => org.ownerId === currentUser.uid);
-        } else {
-            throw new Error(data.error.message);
-        }
+        const organizations = [];
+        let pageToken = null;
+        do {
+            const params = new URLSearchParams({ owner: 'me', fields: 'name,description,tags,ownerId', limit: '100' });
+            if (pageToken) params.set('pageToken', pageToken);
+            const response = await fetch(`/api/organizations?${params}`);
+            const data = await response.json();
+            if (!data.success) {
+                throw new Error(data.error);
+            }
+            organizations.push(...data.data);
+            pageToken = data.nextPageToken;
+        } while (pageToken);
+        userOrganizations = organizations;
     } catch (error) {
         console.error('Error loading organizations:', error);
         throw error;
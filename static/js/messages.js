@@ -264,7 +264,7 @@ class MessagingSystem {
     // Load organization owners for new conversation
     async loadOrganizationOwners() {
         try {
-            const response = await axios.get('/api/organizations?limit=100');
+            const response = await axios.get('/api/organizations?limit=100&fields=name,ownerId');
             const select = document.getElementById('receiverSelect');
             
             if (response.data.success) {